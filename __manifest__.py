@@ -45,6 +45,7 @@
         'data/boq_sequence.xml',
         'data/boq_journals.xml',
         'data/cost_types.xml',
+        'data/boq_cron.xml',
         
         # Views
         'views/boq_menus.xml',
@@ -52,6 +53,11 @@
         'views/boq_activity_views.xml',
         'views/boq_payment_certificate_views.xml',
         'views/boq_variation_views.xml',
+        'views/boq_quantity_ledger_views.xml',
+        'views/boq_advance_ledger_views.xml',
+        'views/boq_cost_cube_views.xml',
+        'views/boq_project_pnl_views.xml',
+        'views/boq_job_views.xml',
         'views/crm_lead_views.xml',
         'views/sale_order_views.xml',
         'views/purchase_order_views.xml',
@@ -60,6 +66,7 @@
         'wizards/set_margin_wizard_views.xml',
         'wizards/advance_payment_wizard_views.xml',
         'wizards/subcontract_wizard_views.xml',
+        'wizards/boq_import_wizard_views.xml',
         
         # Reports
         'reports/boq_reports.xml',
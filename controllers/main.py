@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+from werkzeug.wsgi import wrap_file
+
+from odoo import http
+from odoo.http import content_disposition, request
+
+EXPORT_CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+
+class BoqController(http.Controller):
+
+    @http.route('/boq/export/<int:boq_id>', type='http', auth='user')
+    def export_boq(self, boq_id, file_format='xlsx', **kwargs):
+        """Stream a BOQ tree export from a temporary file"""
+        if file_format not in EXPORT_CONTENT_TYPES:
+            raise request.not_found()
+        boq = request.env['boq.project'].browse(boq_id).exists()
+        if not boq:
+            raise request.not_found()
+        fileobj = tempfile.TemporaryFile()
+        filename = boq._export_tree(fileobj, file_format)
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+        return http.Response(
+            wrap_file(request.httprequest.environ, fileobj),
+            headers=[
+                ('Content-Type', EXPORT_CONTENT_TYPES[file_format]),
+                ('Content-Length', size),
+                ('Content-Disposition', content_disposition(filename)),
+            ],
+            direct_passthrough=True,
+        )
+
+    @http.route('/boq/kpi', type='json', auth='user')
+    def boq_kpis(self, boq_ids=None, **kwargs):
+        """Dashboard KPIs of the given BOQs, or of the current user's BOQs"""
+        Boq = request.env['boq.project']
+        if boq_ids is None:
+            domain = ['|', ('user_id', '=', request.env.uid), ('project_manager_id', '=', request.env.uid)]
+        else:
+            domain = [('id', 'in', [int(boq_id) for boq_id in boq_ids])]
+        boqs = Boq.search(domain)
+        kpis = boqs._get_kpis()
+        return {
+            str(boq.id): dict(kpis[boq.id], name=boq.display_name, currency=boq.currency_id.name)
+            for boq in boqs
+            if boq.id in kpis
+        }
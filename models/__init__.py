@@ -1,3 +1,4 @@
+from . import boq_job
 from . import boq_project
 from . import boq_activity
 from . import boq_subactivity
@@ -6,4 +7,11 @@ from . import boq_payment_certificate
 from . import boq_variation
 from . import crm_lead
 from . import sale_order
-from . import purchase_order
\ No newline at end of file
+from . import purchase_order
+from . import boq_quantity_ledger
+from . import boq_advance_ledger
+from . import ir_sequence
+from . import boq_pricing
+from . import boq_cost_cube
+from . import boq_project_pnl
+from . import boq_benchmark
\ No newline at end of file
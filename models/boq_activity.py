@@ -1,6 +1,46 @@
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 
+# Per-activity aggregation of the sub-activity amounts and quantities. Shared
+# with the BOQ rollup query so activities and projects are summed the same way.
+ACTIVITY_ROLLUP_QUERY = """
+    SELECT act.id,
+           act.boq_id,
+           COALESCE(SUM(sub.total_previous), 0) AS total_previous,
+           COALESCE(SUM(sub.total_current), 0) AS total_current,
+           COALESCE(SUM(sub.total_cumulative), 0) AS total_cumulative,
+           COALESCE(SUM(sub.master_qty), 0) AS master_qty,
+           COALESCE(SUM(sub.previous_qty), 0) AS previous_qty,
+           COALESCE(SUM(sub.current_qty), 0) AS current_qty
+      FROM boq_activity act
+ LEFT JOIN boq_subactivity sub ON sub.activity_id = act.id
+     WHERE {where}
+  GROUP BY act.id, act.boq_id
+"""
+
+ROLLUP_SUBACTIVITY_FIELDS = [
+    'activity_id', 'previous_qty', 'current_qty', 'master_qty',
+    'total_previous', 'total_current', 'total_cumulative',
+]
+
+ACTIVITY_ROLLUP_FIELDS = [
+    'total_previous', 'total_current', 'total_cumulative',
+    'billed_progress_percent', 'onsite_progress_percent',
+    'master_qty_total', 'previous_qty_total', 'current_qty_total',
+]
+
+
+def progress_percents(master_qty, previous_qty, current_qty):
+    """Return the (billed, onsite) progress percentages of quantities."""
+    if not master_qty:
+        return 0.0, 0.0
+    return (
+        previous_qty / master_qty * 100,
+        (previous_qty + current_qty) / master_qty * 100,
+    )
+
 
 class BoqActivity(models.Model):
     _name = 'boq.activity'
@@ -72,6 +112,27 @@ class BoqActivity(models.Model):
         store=True
     )
     
+    # Progress numerators and denominators, kept so that quantity changes
+    # can be propagated incrementally
+    master_qty_total = fields.Float(
+        'Total Master Quantity',
+        digits=(16, 2),
+        compute='_compute_progress',
+        store=True
+    )
+    previous_qty_total = fields.Float(
+        'Total Previous Quantity',
+        digits=(16, 2),
+        compute='_compute_progress',
+        store=True
+    )
+    current_qty_total = fields.Float(
+        'Total Current Quantity',
+        digits=(16, 2),
+        compute='_compute_progress',
+        store=True
+    )
+    
     # Related fields
     currency_id = fields.Many2one(
         related='boq_id.currency_id'
@@ -86,6 +147,14 @@ class BoqActivity(models.Model):
     
     @api.depends('subactivity_ids.total_previous', 'subactivity_ids.total_current', 'subactivity_ids.total_cumulative')
     def _compute_totals(self):
+        if self.env['boq.project']._use_sql_rollups(self):
+            rollups = self._read_rollups()
+            for activity in self:
+                values = rollups.get(activity.id, {})
+                activity.total_previous = values.get('total_previous', 0.0)
+                activity.total_current = values.get('total_current', 0.0)
+                activity.total_cumulative = values.get('total_cumulative', 0.0)
+            return
         for activity in self:
             activity.total_previous = sum(activity.subactivity_ids.mapped('total_previous'))
             activity.total_current = sum(activity.subactivity_ids.mapped('total_current'))
@@ -93,10 +162,30 @@ class BoqActivity(models.Model):
     
     @api.depends('subactivity_ids.previous_qty', 'subactivity_ids.current_qty', 'subactivity_ids.master_qty')
     def _compute_progress(self):
+        if self.env['boq.project']._use_sql_rollups(self):
+            rollups = self._read_rollups()
+            for activity in self:
+                values = rollups.get(activity.id, {})
+                total_master = values.get('master_qty', 0.0)
+                activity.master_qty_total = total_master
+                activity.previous_qty_total = values.get('previous_qty', 0.0)
+                activity.current_qty_total = values.get('current_qty', 0.0)
+                if total_master:
+                    activity.billed_progress_percent = (values['previous_qty'] / total_master) * 100
+                    activity.onsite_progress_percent = (
+                        (values['previous_qty'] + values['current_qty']) / total_master
+                    ) * 100
+                else:
+                    activity.billed_progress_percent = 0
+                    activity.onsite_progress_percent = 0
+            return
         for activity in self:
             total_master = sum(activity.subactivity_ids.mapped('master_qty'))
             total_previous = sum(activity.subactivity_ids.mapped('previous_qty'))
             total_current = sum(activity.subactivity_ids.mapped('current_qty'))
+            activity.master_qty_total = total_master
+            activity.previous_qty_total = total_previous
+            activity.current_qty_total = total_current
             
             if total_master:
                 activity.billed_progress_percent = (total_previous / total_master) * 100
@@ -105,6 +194,77 @@ class BoqActivity(models.Model):
                 activity.billed_progress_percent = 0
                 activity.onsite_progress_percent = 0
     
+    def _read_rollups(self):
+        """Aggregate sub-activity amounts and quantities per activity.
+
+        Returns a dict mapping activity ids to their summed totals and
+        quantities, computed with a single grouped query.
+        """
+        if not self._ids:
+            return {}
+        self.env['boq.subactivity'].flush_model(ROLLUP_SUBACTIVITY_FIELDS)
+        self.env.cr.execute(
+            ACTIVITY_ROLLUP_QUERY.format(where='act.id IN %s'),
+            [tuple(self._ids)],
+        )
+        return {
+            row[0]: {
+                'total_previous': float(row[2]),
+                'total_current': float(row[3]),
+                'total_cumulative': float(row[4]),
+                'master_qty': float(row[5]),
+                'previous_qty': float(row[6]),
+                'current_qty': float(row[7]),
+            }
+            for row in self.env.cr.fetchall()
+        }
+
+    def _apply_rollup_deltas(self, deltas):
+        """Adjust the stored rollups of ``self`` by sub-activity changes.
+
+        ``deltas`` maps activity ids to the ``(previous_qty, current_qty,
+        total_previous, total_current)`` differences of their sub-activities.
+        Each activity is updated from its stored numerators and denominators
+        instead of re-summing its siblings, and the resulting changes are
+        propagated to the BOQs the same way.
+        """
+        if not self._ids:
+            return
+        cr = self.env.cr
+        cr.execute("""
+            SELECT id, boq_id, total_cumulative, master_qty_total,
+                   previous_qty_total, current_qty_total
+              FROM boq_activity
+             WHERE id IN %s
+               FOR UPDATE
+        """, [tuple(self._ids)])
+        boq_deltas = defaultdict(lambda: [0.0, 0.0, 0.0, 0.0])
+        for activity_id, boq_id, total_cumulative, master_qty, previous_qty, current_qty in cr.fetchall():
+            d_previous_qty, d_current_qty, d_total_previous, d_total_current = deltas[activity_id]
+            master_qty, previous_qty, current_qty = float(master_qty), float(previous_qty), float(current_qty)
+            old_billed, old_onsite = progress_percents(master_qty, previous_qty, current_qty)
+            previous_qty += d_previous_qty
+            current_qty += d_current_qty
+            new_billed, new_onsite = progress_percents(master_qty, previous_qty, current_qty)
+            cr.execute("""
+                UPDATE boq_activity
+                   SET total_previous = total_previous + %s,
+                       total_current = total_current + %s,
+                       previous_qty_total = %s,
+                       current_qty_total = %s,
+                       billed_progress_percent = %s,
+                       onsite_progress_percent = %s
+                 WHERE id = %s
+            """, [d_total_previous, d_total_current, previous_qty, current_qty,
+                  new_billed, new_onsite, activity_id])
+            boq_delta = boq_deltas[boq_id]
+            boq_delta[0] += d_total_previous
+            boq_delta[1] += d_total_current
+            boq_delta[2] += (new_billed - old_billed) * float(total_cumulative) / 100
+            boq_delta[3] += (new_onsite - old_onsite) * float(total_cumulative) / 100
+        boqs = self.env['boq.project'].browse(list(boq_deltas))
+        boqs._apply_rollup_deltas(boq_deltas, self)
+
     def action_view_subactivities(self):
         """View subactivities in popup"""
         return {
@@ -116,19 +276,53 @@ class BoqActivity(models.Model):
             'context': {
                 'default_activity_id': self.id,
                 'default_boq_id': self.boq_id.id,
+                'boq_delta_propagation': True,
             },
             'target': 'new'
         }
     
-    @api.model
-    def create(self, vals):
-        """Set sequence automatically"""
-        if not vals.get('sequence'):
-            boq_id = vals.get('boq_id')
-            if boq_id:
-                last_activity = self.search([('boq_id', '=', boq_id)], order='sequence desc', limit=1)
-                vals['sequence'] = (last_activity.sequence or 0) + 10
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Set sequence automatically, after the last activity of each BOQ"""
+        to_sequence = [vals for vals in vals_list if not vals.get('sequence') and vals.get('boq_id')]
+        if to_sequence:
+            last_sequences = {
+                boq.id: sequence
+                for boq, sequence in self._read_group(
+                    [('boq_id', 'in', list({vals['boq_id'] for vals in to_sequence}))],
+                    ['boq_id'],
+                    ['sequence:max'],
+                )
+            }
+            for vals in to_sequence:
+                last_sequences[vals['boq_id']] = (last_sequences.get(vals['boq_id']) or 0) + 10
+                vals['sequence'] = last_sequences[vals['boq_id']]
+        activities = super().create(vals_list)
+        activities.boq_id._check_job_lock()
+        activities.boq_id._kpi_invalidate()
+        self.env['boq.project']._batch_edit_defer(activities)
+        return activities
+
+    def write(self, vals):
+        boqs = self.boq_id
+        boqs._check_job_lock()
+        res = super().write(vals)
+        (boqs | self.boq_id)._kpi_invalidate()
+        self.env['boq.project']._batch_edit_defer(self, boqs)
+        return res
+
+    def unlink(self):
+        boqs = self.boq_id
+        boqs._check_job_lock()
+        boqs._kpi_invalidate()
+        res = super().unlink()
+        self.env['boq.project']._batch_edit_defer(self.browse(), boqs.exists())
+        return res
+
+    def _validate_fields(self, field_names, excluded_names=()):
+        if self.env['boq.project']._batch_edit_defer_constraints(self, field_names):
+            return
+        super()._validate_fields(field_names, excluded_names)
     
     @api.constrains('margin_percent')
     def _check_margin(self):
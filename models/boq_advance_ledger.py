@@ -0,0 +1,102 @@
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index, index_exists
+
+# Advanced and recovered amount fields of boq.project for each line type
+ADVANCE_FIELDS = {
+    'original': ('advanced_payment_amount_original', 'advance_recovered_original'),
+    'variation': ('advanced_payment_amount_variation', 'advance_recovered_variation'),
+}
+
+
+class BoqAdvanceLedger(models.Model):
+    _name = 'boq.advance.ledger'
+    _description = 'BOQ Advance Payment Ledger'
+    _order = 'id desc'
+    _rec_name = 'boq_id'
+
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    date = fields.Date('Date', required=True, readonly=True)
+    line_type = fields.Selection([
+        ('original', 'Original'),
+        ('variation', 'Variation')
+    ], string='Line Type', required=True, readonly=True)
+    kind = fields.Selection([
+        ('advance', 'Advance'),
+        ('recovery', 'Recovery')
+    ], string='Kind', required=True, readonly=True)
+    amount = fields.Monetary(
+        'Amount',
+        readonly=True,
+        help="Positive for advances, negative for recoveries"
+    )
+    balance_after = fields.Monetary(
+        'Outstanding Balance',
+        readonly=True,
+        help="Outstanding advance of the line type after this entry"
+    )
+    certificate_id = fields.Many2one(
+        'boq.payment.certificate',
+        string='Certificate',
+        readonly=True,
+        ondelete='set null'
+    )
+    move_id = fields.Many2one(
+        'account.move',
+        string='Invoice',
+        readonly=True,
+        ondelete='set null'
+    )
+
+    currency_id = fields.Many2one(related='boq_id.currency_id')
+    company_id = fields.Many2one(related='boq_id.company_id', store=True)
+
+    def init(self):
+        # Per-project history, latest entries first
+        indexname = 'boq_advance_ledger_boq_id_line_type_index'
+        if not index_exists(self.env.cr, indexname):
+            create_index(self.env.cr, indexname, self._table, ['boq_id', 'line_type', 'id'])
+
+    def write(self, vals):
+        raise UserError(_('Advance ledger entries cannot be modified.'))
+
+    def unlink(self):
+        raise UserError(_('Advance ledger entries cannot be deleted.'))
+
+    @api.model
+    def _record(self, boq, line_type, kind, amount, date=None, certificate=None, move=None):
+        """Append an advance or recovery of ``amount`` to the ledger of ``boq``.
+
+        The advanced or recovered total of the BOQ is incremented in place,
+        which keeps its outstanding balance current without rescanning
+        previous entries. The BOQ row is locked so that concurrent events
+        see each other's totals. The entry and the totals are written with
+        ``sudo()``: users only read the ledger, and the totals can only be
+        changed through it.
+        """
+        advanced_field, recovered_field = ADVANCE_FIELDS[line_type]
+        boq.check_access('write')
+        boq = boq.sudo()
+        boq.flush_recordset([advanced_field, recovered_field])
+        self.env.cr.execute("SELECT id FROM boq_project WHERE id = %s FOR UPDATE", [boq.id])
+        boq.invalidate_recordset([advanced_field, recovered_field])
+        if kind == 'advance':
+            boq[advanced_field] += amount
+        else:
+            boq[recovered_field] += amount
+        return self.sudo().create({
+            'boq_id': boq.id,
+            'date': date or fields.Date.context_today(self),
+            'line_type': line_type,
+            'kind': kind,
+            'amount': amount if kind == 'advance' else -amount,
+            'balance_after': boq[advanced_field] - boq[recovered_field],
+            'certificate_id': certificate and certificate.id,
+            'move_id': move and move.id,
+        }).sudo(False)
@@ -0,0 +1,305 @@
+from collections import defaultdict
+import random
+import statistics
+import time
+import tracemalloc
+
+from odoo import api, fields, models, _
+from odoo.exceptions import AccessError, UserError
+
+# Master quantities drawn by the generator; a small set keeps the progress
+# writes grouped by value
+BENCHMARK_MASTER_QTYS = (10.0, 20.0, 50.0, 100.0, 250.0)
+BENCHMARK_ACTIVITY_TYPES = ('material', 'labor', 'service')
+
+# Hot paths timed by ``run``, in order
+BENCHMARK_SCENARIOS = (
+    'create_payment_certificate',
+    'submit_certificate',
+    'apply_variation',
+    'set_margin',
+    'confirm_subcontract_po',
+    'advance_payment_wizard_default_get',
+    'subcontract_wizard_default_get',
+    'set_margin_wizard_default_get',
+)
+
+
+class BoqBenchmark(models.AbstractModel):
+    """Time the BOQ hot paths on generated projects.
+
+    Meant to be run from ``odoo-bin shell``::
+
+        result = env['boq.benchmark'].run(activities=100, subactivities=50)
+        print(json.dumps(result, indent=2))
+
+    The generator is deterministic for a given ``seed``, so results can be
+    compared between releases. Every scenario runs in a savepoint rolled
+    back afterwards, and so is the generated data unless ``keep`` is set.
+    """
+    _name = 'boq.benchmark'
+    _description = 'BOQ Benchmark'
+
+    @api.model
+    def run(self, activities=20, subactivities=25, costs=1, certificates=2, variations=1,
+            variation_lines=20, scenarios=None, repeat=1, seed=42, keep=False, trace_memory=True):
+        """Generate a BOQ and time ``scenarios`` (all by default) on it.
+
+        Returns a JSON serializable dict with the parameters, the
+        generation time and, per scenario, the wall time in seconds, the
+        number of SQL queries and the peak Python memory in bytes. With
+        ``repeat`` > 1 the median and minimum wall times are reported.
+        Tracing memory slows Python down, so the peak memory comes from one
+        more run of each scenario, skipped when ``trace_memory`` is False.
+        """
+        if not self.env.is_admin():
+            raise AccessError(_('Only administrators can run the BOQ benchmark.'))
+        scenarios = scenarios or BENCHMARK_SCENARIOS
+        unknown = set(scenarios) - set(BENCHMARK_SCENARIOS)
+        if unknown:
+            raise UserError(_('Unknown benchmark scenarios: %s', ', '.join(sorted(unknown))))
+
+        savepoint = self.env.cr.savepoint()
+        try:
+            generation, boq = self._measure(lambda: self._generate(
+                activities, subactivities, costs, certificates, variations, variation_lines, seed,
+            ))
+            results = []
+            for scenario in scenarios:
+                runs = [self._run_scenario(scenario, boq) for _i in range(repeat)]
+                wall_times = [run['wall_time'] for run in runs]
+                result = {
+                    'scenario': scenario,
+                    'wall_time': statistics.median(wall_times),
+                    'wall_time_min': min(wall_times),
+                    'queries': runs[0]['queries'],
+                }
+                if trace_memory:
+                    result.update(self._run_scenario(scenario, boq, trace_memory=True))
+                results.append(result)
+        finally:
+            savepoint.close(rollback=not keep)
+            self.env.invalidate_all()
+        return {
+            'date': fields.Datetime.to_string(fields.Datetime.now()),
+            'database': self.env.cr.dbname,
+            'params': {
+                'activities': activities,
+                'subactivities': subactivities,
+                'costs': costs,
+                'certificates': certificates,
+                'variations': variations,
+                'variation_lines': variation_lines,
+                'repeat': repeat,
+                'seed': seed,
+                'trace_memory': trace_memory,
+            },
+            'generation': generation,
+            'results': results,
+        }
+
+    @api.model
+    def _measure(self, func):
+        """Call ``func`` and return its ``(metrics, result)``; pending
+        writes are flushed inside the measure."""
+        self.env.flush_all()
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        start = time.perf_counter()
+        result = func()
+        self.env.flush_all()
+        metrics = {
+            'wall_time': time.perf_counter() - start,
+            'queries': cr.sql_log_count - queries,
+        }
+        return metrics, result
+
+    @api.model
+    def _measure_memory(self, func):
+        """Call ``func`` with memory tracing and return its
+        ``({'peak_memory': bytes}, result)``."""
+        self.env.flush_all()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            result = func()
+            self.env.flush_all()
+            metrics = {'peak_memory': tracemalloc.get_traced_memory()[1]}
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        return metrics, result
+
+    @api.model
+    def _run_scenario(self, scenario, boq, trace_memory=False):
+        """Set up and measure one run of ``scenario``, then roll it back;
+        with ``trace_memory`` only its peak memory is measured."""
+        savepoint = self.env.cr.savepoint()
+        try:
+            func = getattr(self, '_scenario_%s' % scenario)(boq)
+            measure = self._measure_memory if trace_memory else self._measure
+            metrics, _result = measure(func)
+        finally:
+            savepoint.close(rollback=True)
+            self.env.invalidate_all()
+        return metrics
+
+    # Scenarios: each prepares its records and returns the call to time
+
+    @api.model
+    def _scenario_create_payment_certificate(self, boq):
+        return boq.action_create_payment_certificate
+
+    @api.model
+    def _scenario_submit_certificate(self, boq):
+        certificate = self._create_certificate(boq)
+        return certificate.action_submit
+
+    @api.model
+    def _scenario_apply_variation(self, boq):
+        variation = self.env['boq.variation'].search([('boq_id', '=', boq.id), ('state', '=', 'approved')], limit=1)
+        if not variation:
+            raise UserError(_('The apply_variation scenario needs at least one generated variation.'))
+        return variation.action_apply_variation
+
+    @api.model
+    def _scenario_set_margin(self, boq):
+        wizard = self.env['boq.set.margin.wizard'].create({
+            'boq_id': boq.id,
+            'margin_percent': 17.5,
+            'apply_to': 'all',
+            'override_existing': True,
+        })
+        return wizard.action_set_margin
+
+    @api.model
+    def _scenario_confirm_subcontract_po(self, boq):
+        Wizard = self.env['boq.subcontract.wizard'].with_context(boq_id=boq.id)
+        wizard = Wizard.create({
+            'boq_id': boq.id,
+            'vendor_id': self._get_partner('Benchmark Subcontractor', supplier_rank=1).id,
+        })
+        wizard.line_ids.write({'selected': True, 'unit_cost': 10.0})
+        action = wizard.action_create_purchase_order()
+        return self.env['purchase.order'].browse(action['res_id']).button_confirm
+
+    @api.model
+    def _scenario_advance_payment_wizard_default_get(self, boq):
+        return self._default_get_call('boq.advance.payment.wizard', boq)
+
+    @api.model
+    def _scenario_subcontract_wizard_default_get(self, boq):
+        return self._default_get_call('boq.subcontract.wizard', boq)
+
+    @api.model
+    def _scenario_set_margin_wizard_default_get(self, boq):
+        return self._default_get_call('boq.set.margin.wizard', boq)
+
+    @api.model
+    def _default_get_call(self, model_name, boq):
+        Wizard = self.env[model_name].with_context(boq_id=boq.id, default_boq_id=boq.id)
+        return lambda: Wizard.default_get(list(Wizard._fields))
+
+    # Generator
+
+    @api.model
+    def _generate(self, activities, subactivities, costs, certificates, variations, variation_lines, seed):
+        """Create a BOQ of ``activities`` x ``subactivities`` lines with
+        ``costs`` additional costs each, ``certificates`` submitted
+        certificates and ``variations`` approved variations of
+        ``variation_lines`` edits, leaving current progress to certify."""
+        products = self._get_products()
+        rng = random.Random(seed)
+        cost_types = self.env['boq.cost.type'].search([], order='id')
+        boq = self.env['boq.project'].create({
+            'customer_id': self._get_partner('Benchmark Customer', customer_rank=1).id,
+            'margin_percent': 10.0,
+        })
+        activity_records = self.env['boq.activity'].create([{
+            'boq_id': boq.id,
+            'name': 'Benchmark Activity %05d' % i,
+            'sequence': (i + 1) * 10,
+        } for i in range(activities)])
+        with boq.batch_edit():
+            subs = self.env['boq.subactivity'].create([{
+                'activity_id': activity.id,
+                'product_id': rng.choice(products).id,
+                'activity_type': rng.choice(BENCHMARK_ACTIVITY_TYPES),
+                'master_qty': rng.choice(BENCHMARK_MASTER_QTYS),
+                'product_cost': round(rng.uniform(5, 500), 2),
+                'margin_percent': rng.choice((0.0, 10.0, 15.0, 20.0)),
+            } for activity in activity_records for _i in range(subactivities)])
+            if costs:
+                self.env['boq.subactivity.cost'].create([{
+                    'subactivity_id': sub.id,
+                    'cost_type_id': cost_types[i % len(cost_types)].id if cost_types else False,
+                    'name': 'Benchmark Cost %s' % (i + 1),
+                    'cost': round(rng.uniform(1, 50), 2),
+                } for sub in subs for i in range(costs)])
+
+        # Each certificate certifies the same share of every master quantity
+        step = 1.0 / (certificates + 2)
+        for _i in range(certificates):
+            self._set_progress(subs, step)
+            self._create_certificate(boq).action_submit()
+        self._set_progress(subs, step)
+
+        for i in range(variations):
+            edited = subs[i * variation_lines:(i + 1) * variation_lines]
+            variation = self.env['boq.variation'].create({
+                'boq_id': boq.id,
+                'description': 'Benchmark Variation %s' % (i + 1),
+                'approver_ids': [(6, 0, self.env.user.ids)],
+                'edit_line_ids': [(0, 0, {
+                    'action_type': 'edit',
+                    'target_subactivity_id': sub.id,
+                    'original_qty': sub.master_qty,
+                    'original_cost': sub.product_cost,
+                    'original_margin': sub.margin_percent,
+                    'new_qty': sub.master_qty * 1.5,
+                    'new_cost': round(sub.product_cost * 1.1, 2),
+                    'new_margin': sub.margin_percent,
+                }) for sub in edited],
+            })
+            variation.action_submit()
+            variation.action_approve()
+        return boq
+
+    @api.model
+    def _set_progress(self, subs, step):
+        """Set the current quantity of ``subs`` to ``step`` of their master
+        quantity, with one write per master quantity."""
+        by_qty = defaultdict(lambda: self.env['boq.subactivity'])
+        for sub in subs:
+            by_qty[sub.master_qty] |= sub
+        for master_qty, group in by_qty.items():
+            group.write({'current_qty': round(master_qty * step, 2)})
+
+    @api.model
+    def _create_certificate(self, boq):
+        action = boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        certificate.action_set_approved_amount()
+        return certificate
+
+    @api.model
+    def _get_products(self, count=50):
+        """Return the benchmark products, created once per database with
+        their own fixed seed so existing ones do not shift the generator."""
+        rng = random.Random(count)
+        products = self.env['product.product'].search([('default_code', '=like', 'BOQ-BENCH-%')], order='id')
+        if len(products) < count:
+            products |= self.env['product.product'].create([{
+                'name': 'Benchmark Product %03d' % i,
+                'default_code': 'BOQ-BENCH-%03d' % i,
+                'standard_price': round(rng.uniform(5, 500), 2),
+                'list_price': round(rng.uniform(5, 500), 2),
+            } for i in range(count)][len(products):])
+        return products
+
+    @api.model
+    def _get_partner(self, name, **ranks):
+        partner = self.env['res.partner'].search([('name', '=', name)], limit=1)
+        return partner or self.env['res.partner'].create(dict(ranks, name=name))
@@ -0,0 +1,162 @@
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_unique_index, index_exists
+
+# Cell key of the cube; a cost type or activity type may be empty
+CUBE_KEY_INDEX = 'boq_cost_cube_key_index'
+CUBE_KEY = "boq_id, activity_id, (COALESCE(cost_type_id, 0)), (COALESCE(activity_type, ''))"
+
+# Fields of the additional costs and sub-activities moving amounts between cells
+CUBE_COST_FIELDS = {'subactivity_id', 'cost_type_id', 'cost'}
+CUBE_SUBACTIVITY_FIELDS = {'activity_id', 'activity_type', 'master_qty'}
+
+CUBE_REBUILD_QUERY = """
+    INSERT INTO boq_cost_cube (boq_id, activity_id, cost_type_id, activity_type, amount, line_count,
+                               create_uid, create_date, write_uid, write_date)
+    SELECT sub.boq_id, sub.activity_id, cost.cost_type_id, sub.activity_type,
+           SUM(COALESCE(cost.cost, 0) * COALESCE(sub.master_qty, 0)), COUNT(*),
+           %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+      FROM boq_subactivity_cost cost
+      JOIN boq_subactivity sub ON sub.id = cost.subactivity_id
+     WHERE %(all)s OR sub.boq_id = ANY(%(boq_ids)s)
+  GROUP BY sub.boq_id, sub.activity_id, cost.cost_type_id, sub.activity_type
+"""
+
+
+class BoqCostCube(models.Model):
+    """Additional costs summed per BOQ, activity, cost type and activity type.
+
+    The cells are kept up to date by the additional cost and sub-activity
+    writes, which add the old/new differences of the lines they change, so
+    breakdowns are read from the cube instead of the line tables. The amount
+    of a line is its unit cost times the master quantity of its
+    sub-activity.
+    """
+    _name = 'boq.cost.cube'
+    _description = 'BOQ Cost Breakdown'
+    _order = 'boq_id, activity_id, cost_type_id'
+    _rec_name = 'activity_id'
+
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    activity_id = fields.Many2one(
+        'boq.activity',
+        string='Activity',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    cost_type_id = fields.Many2one(
+        'boq.cost.type',
+        string='Cost Type',
+        readonly=True,
+        ondelete='cascade'
+    )
+    activity_type = fields.Selection([
+        ('material', 'Material'),
+        ('labor', 'Labor'),
+        ('service', 'Service')
+    ], string='Activity Type', readonly=True)
+    amount = fields.Monetary('Amount', readonly=True)
+    line_count = fields.Integer('Cost Lines', readonly=True)
+
+    currency_id = fields.Many2one(related='boq_id.currency_id')
+    company_id = fields.Many2one(related='boq_id.company_id', store=True)
+
+    def init(self):
+        if not index_exists(self.env.cr, CUBE_KEY_INDEX):
+            create_unique_index(self.env.cr, CUBE_KEY_INDEX, self._table, [CUBE_KEY])
+        # Fill the cube from the costs recorded before it existed
+        self.env.cr.execute("SELECT 1 FROM boq_cost_cube LIMIT 1")
+        if not self.env.cr.rowcount:
+            self.env.cr.execute(CUBE_REBUILD_QUERY, {'uid': self.env.uid, 'all': True, 'boq_ids': []})
+
+    @api.model
+    def _contributions(self, costs):
+        """Return the ``{cell key: [amount, line count]}`` contributions of
+        the additional cost lines ``costs``."""
+        contributions = defaultdict(lambda: [0.0, 0])
+        for cost in costs:
+            sub = cost.subactivity_id
+            cell = contributions[(sub.boq_id.id, sub.activity_id.id, cost.cost_type_id.id, sub.activity_type)]
+            cell[0] += cost.cost * sub.master_qty
+            cell[1] += 1
+        return contributions
+
+    @api.model
+    def _apply_contributions(self, before, after):
+        """Move the cells of the cube from the ``before`` contributions to
+        the ``after`` ones, with one upsert."""
+        deltas = defaultdict(lambda: [0.0, 0])
+        for sign, contributions in ((-1, before), (1, after)):
+            for key, (amount, count) in contributions.items():
+                deltas[key][0] += sign * amount
+                deltas[key][1] += sign * count
+        rows = [
+            (key, amount, count) for key, (amount, count) in deltas.items()
+            if key[0] and key[1] and (amount or count)
+        ]
+        if not rows:
+            return
+        keys, amounts, counts = zip(*rows)
+        self.env.cr.execute(f"""
+            INSERT INTO boq_cost_cube (boq_id, activity_id, cost_type_id, activity_type, amount, line_count,
+                                       create_uid, create_date, write_uid, write_date)
+            SELECT cell.boq_id, cell.activity_id, NULLIF(cell.cost_type_id, 0), NULLIF(cell.activity_type, ''),
+                   cell.amount, cell.line_count,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%(boq_ids)s::int[], %(activity_ids)s::int[], %(cost_type_ids)s::int[],
+                          %(activity_types)s::varchar[], %(amounts)s::numeric[], %(counts)s::int[])
+                   AS cell(boq_id, activity_id, cost_type_id, activity_type, amount, line_count)
+            ON CONFLICT ({CUBE_KEY}) DO UPDATE
+               SET amount = boq_cost_cube.amount + EXCLUDED.amount,
+                   line_count = boq_cost_cube.line_count + EXCLUDED.line_count,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'uid': self.env.uid,
+            'boq_ids': [key[0] for key in keys],
+            'activity_ids': [key[1] for key in keys],
+            'cost_type_ids': [key[2] or 0 for key in keys],
+            'activity_types': [key[3] or '' for key in keys],
+            'amounts': list(amounts),
+            'counts': list(counts),
+        })
+        self.env.cr.execute(
+            "DELETE FROM boq_cost_cube WHERE line_count <= 0 AND boq_id = ANY(%s)",
+            [list({key[0] for key in keys})],
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild(self, boqs):
+        """Recompute the cells of ``boqs`` from their additional costs, for
+        costs inserted without the ORM."""
+        self.env['boq.subactivity'].flush_model(['boq_id', 'activity_id', 'activity_type', 'master_qty'])
+        self.env['boq.subactivity.cost'].flush_model(['subactivity_id', 'cost_type_id', 'cost'])
+        self.env.cr.execute("DELETE FROM boq_cost_cube WHERE boq_id = ANY(%s)", [boqs.ids])
+        self.env.cr.execute(CUBE_REBUILD_QUERY, {'uid': self.env.uid, 'all': False, 'boq_ids': boqs.ids})
+        self.invalidate_model()
+
+    @api.model
+    def _breakdown(self, boqs, groupby=('cost_type_id',)):
+        """Return the amounts and line counts of the additional costs of
+        ``boqs`` grouped by ``groupby``, as a list of dicts."""
+        groupby = list(groupby)
+        groups = self._read_group(
+            [('boq_id', 'in', boqs.ids)],
+            groupby,
+            ['amount:sum', 'line_count:sum'],
+        )
+        result = []
+        for group in groups:
+            values = dict(zip(groupby, group[:len(groupby)]))
+            values['amount'], values['line_count'] = group[len(groupby):]
+            result.append(values)
+        return result
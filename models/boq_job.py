@@ -0,0 +1,251 @@
+from contextlib import contextmanager
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import AccessError, UserError
+
+_logger = logging.getLogger(__name__)
+
+# States in which a job keeps its records locked against other edits; a
+# failed job stays locked until a manager retries or cancels it
+JOB_LOCK_STATES = ('pending', 'running', 'failed')
+# Seconds a cron run spends on jobs before handing over to the next run
+JOB_TIME_LIMIT = 60
+
+
+class BoqJob(models.Model):
+    """Long-running BOQ operation processed by the ``ir.cron`` worker.
+
+    The record the job runs on provides the work through two methods:
+    ``_job_stages()`` returns the ordered ``(stage, lines)`` pairs, where
+    ``lines`` is a recordset processed ``chunk_size`` records at a time or
+    ``None`` for a single step, and ``_job_process(stage, lines)`` does the
+    work of one chunk. Every chunk is committed together with the position
+    of the job, so an interrupted or failed job resumes where it stopped.
+    """
+    _name = 'boq.job'
+    _description = 'BOQ Background Job'
+    _order = 'id desc'
+
+    name = fields.Char('Name', required=True, readonly=True)
+    res_model = fields.Char('Model', required=True, readonly=True)
+    res_id = fields.Many2oneReference(
+        'Record',
+        model_field='res_model',
+        required=True,
+        readonly=True
+    )
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        readonly=True,
+        index=True,
+        ondelete='cascade'
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Requested By',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Company',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.company
+    )
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ], string='Status', default='pending', required=True, readonly=True, index=True)
+
+    stage = fields.Char('Stage', readonly=True)
+    offset = fields.Integer('Offset', readonly=True)
+    chunk_size = fields.Integer('Chunk Size', default=500)
+    progress = fields.Float('Progress', digits=(5, 2), readonly=True)
+    date_start = fields.Datetime('Started', readonly=True)
+    date_end = fields.Datetime('Ended', readonly=True)
+    error = fields.Text('Error', readonly=True)
+
+    @api.model
+    def _enqueue(self, record, name):
+        """Create a job running on ``record`` and wake up the worker.
+
+        ``record`` and its BOQ are locked until the job is done or
+        cancelled.
+        """
+        record.ensure_one()
+        boq = record if record._name == 'boq.project' else record.boq_id
+        record._check_job_lock()
+        boq._check_job_lock()
+        # Users only read jobs; their state is moved by the worker
+        job = self.sudo().create({
+            'name': name,
+            'res_model': record._name,
+            'res_id': record.id,
+            'boq_id': boq.id,
+        })
+        record.job_id = job
+        boq.job_id = job
+        self.env.ref('boq.ir_cron_boq_jobs').sudo()._trigger()
+        return job.sudo(False)
+
+    @api.model
+    def _cron_run_jobs(self, time_limit=JOB_TIME_LIMIT):
+        """Process pending jobs, oldest first, for at most ``time_limit``
+        seconds; the cron is triggered again if jobs remain."""
+        deadline = time.monotonic() + time_limit
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            if not job._run(deadline):
+                self.env.ref('boq.ir_cron_boq_jobs')._trigger()
+                return
+
+    def _run(self, deadline):
+        """Process chunks until the job ends or ``deadline`` passes.
+        Returns whether the job ended."""
+        self.ensure_one()
+        record = self.env[self.res_model].browse(self.res_id).with_user(self.user_id).with_context(
+            allowed_company_ids=[self.company_id.id],
+        )
+        if self.state == 'pending':
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+        with self._processing():
+            try:
+                stages = record._job_stages()
+                sizes = [1 if lines is None else len(lines) for _stage, lines in stages]
+                names = [stage for stage, _lines in stages]
+                index = names.index(self.stage) if self.stage else 0
+                offset = self.offset
+                done = sum(sizes[:index]) + offset
+                while index < len(stages):
+                    stage, lines = stages[index]
+                    if lines is None:
+                        record._job_process(stage, None)
+                        done += 1
+                        index, offset = index + 1, 0
+                    else:
+                        chunk = lines[offset:offset + self.chunk_size]
+                        if chunk:
+                            record._job_process(stage, chunk)
+                        done += len(chunk)
+                        offset += len(chunk)
+                        if offset >= len(lines):
+                            index, offset = index + 1, 0
+                    self.write({
+                        'stage': names[index] if index < len(stages) else False,
+                        'offset': offset,
+                        'progress': 100.0 * done / (sum(sizes) or 1),
+                    })
+                    self.env.cr.commit()
+                    if index < len(stages) and time.monotonic() > deadline:
+                        return False
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception("BOQ job %s failed", self.id)
+                self.write({'state': 'failed', 'error': str(e), 'date_end': fields.Datetime.now()})
+                self.env.cr.commit()
+                return True
+            self.write({'state': 'done', 'progress': 100.0, 'date_end': fields.Datetime.now()})
+            self.env.cr.commit()
+            _logger.info("BOQ job %s (%s) done", self.id, self.name)
+            return True
+
+    @api.model
+    def _running_job_ids(self):
+        """Return the set of ids of the jobs processed by this transaction.
+
+        It is kept on the transaction rather than in the context, which RPC
+        clients can set.
+        """
+        transaction = self.env.transaction
+        if not hasattr(transaction, 'boq_job_ids'):
+            transaction.boq_job_ids = set()
+        return transaction.boq_job_ids
+
+    @contextmanager
+    def _processing(self):
+        """Let the job write the records it locks during the block."""
+        self.ensure_one()
+        running = self._running_job_ids()
+        running.add(self.id)
+        try:
+            yield
+        finally:
+            running.discard(self.id)
+
+    def action_retry(self):
+        """Resume failed jobs from the chunk that failed"""
+        self._check_manager()
+        self.filtered(lambda j: j.state == 'failed').write({'state': 'pending', 'error': False})
+        self.env.ref('boq.ir_cron_boq_jobs').sudo()._trigger()
+
+    def action_cancel(self):
+        """Cancel jobs and unlock their records; chunks already committed are kept"""
+        self._check_manager()
+        if self.filtered(lambda j: j.state == 'running'):
+            raise UserError(_('Running jobs cannot be cancelled.'))
+        self.filtered(lambda j: j.state in ('pending', 'failed')).write({
+            'state': 'cancelled',
+            'date_end': fields.Datetime.now(),
+        })
+
+    def _check_manager(self):
+        if not self.env.user.has_group('boq.group_boq_manager'):
+            raise AccessError(_('Only BOQ managers can retry or cancel background jobs.'))
+
+
+class BoqJobMixin(models.AbstractModel):
+    _name = 'boq.job.mixin'
+    _description = 'BOQ Background Job Mixin'
+
+    job_id = fields.Many2one(
+        'boq.job',
+        string='Background Job',
+        readonly=True,
+        copy=False
+    )
+    job_state = fields.Selection(related='job_id.state', string='Job Status')
+    job_progress = fields.Float(related='job_id.progress', string='Job Progress')
+
+    def write(self, vals):
+        self._check_job_lock()
+        return super().write(vals)
+
+    def _check_job_lock(self):
+        """Forbid changes to records a background job is working on,
+        except from the job itself."""
+        running = self.env['boq.job']._running_job_ids()
+        locked = self.filtered(lambda r: r.job_id.state in JOB_LOCK_STATES and r.job_id.id not in running)
+        if locked:
+            raise UserError(_(
+                '%s is being processed by a background job. '
+                'Wait for the job to finish or cancel it.',
+                locked[0].display_name,
+            ))
+
+    def action_retry_job(self):
+        """Resume the failed background job of the record"""
+        self.job_id.action_retry()
+
+    def action_cancel_job(self):
+        """Cancel the background job of the record and unlock it"""
+        self.job_id.action_cancel()
+
+    def _job_stages(self):
+        """Return the ordered ``(stage, lines)`` pairs of the job, where
+        ``lines`` is a recordset processed in chunks or ``None`` for a
+        single step. To be overridden by the models running jobs."""
+        return []
+
+    def _job_process(self, stage, lines):
+        """Process one chunk of ``lines`` of ``stage``, or the whole stage
+        when ``lines`` is ``None``. To be overridden by the models running
+        jobs."""
+        return
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 
@@ -5,7 +7,7 @@ from odoo.exceptions import UserError, ValidationError
 class BoqPaymentCertificate(models.Model):
     _name = 'boq.payment.certificate'
     _description = 'Payment Certificate (Mustahlas)'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'boq.job.mixin']
     _rec_name = 'name'
     _order = 'create_date desc'
 
@@ -89,35 +91,56 @@ class BoqPaymentCertificate(models.Model):
     company_id = fields.Many2one(related='boq_id.company_id', store=True)
     customer_id = fields.Many2one(related='boq_id.customer_id')
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """Override create to set sequence"""
-        if vals.get('name', _('New')) == _('New'):
-            vals['name'] = self.env['ir.sequence'].next_by_code('boq.payment.certificate') or _('New')
-        return super().create(vals)
+        to_name = [vals for vals in vals_list if vals.get('name', _('New')) == _('New')]
+        names = self.env['ir.sequence']._next_batch_by_code('boq.payment.certificate', len(to_name))
+        for vals, name in zip(to_name, names):
+            vals['name'] = name or _('New')
+        records = super().create(vals_list)
+        records.boq_id._kpi_invalidate()
+        return records
+
+    def write(self, vals):
+        boqs = self.boq_id
+        res = super().write(vals)
+        (boqs | self.boq_id)._kpi_invalidate()
+        return res
+
+    def unlink(self):
+        self.boq_id._kpi_invalidate()
+        return super().unlink()
 
     @api.depends('line_ids.amount_completed', 'line_ids.amount_approved', 'line_ids.approved_percent')
     def _compute_amounts(self):
+        # Load the BOQ fields used below for the whole batch at once
+        boqs = self.boq_id._origin
+        if boqs:
+            boqs.fetch([
+                'retention_rate', 'total',
+                'advanced_payment_amount_original', 'advanced_payment_amount_variation',
+                'outstanding_advanced_payment_original', 'outstanding_advanced_payment_variation',
+            ])
         for cert in self:
             cert.amount_completed = sum(cert.line_ids.mapped('amount_completed'))
             cert.amount_approved = sum(cert.line_ids.mapped('amount_approved'))
             
-            # Calculate retention (5% of approved amount)
-            retention_percent = 5.0  # Default 5%
-            if cert.boq_id.retention_tax and '%' in cert.boq_id.retention_tax:
-                try:
-                    retention_percent = float(cert.boq_id.retention_tax.split()[-1].replace('%', ''))
-                except (ValueError, IndexError):
-                    retention_percent = 5.0
-            
-            cert.amount_retention = cert.amount_approved * (retention_percent / 100)
+            # Calculate retention (5% of approved amount by default)
+            cert.amount_retention = cert.amount_approved * (cert.boq_id.retention_rate / 100)
             
             # Calculate advance payment recovery
             if cert.amount_approved and cert.boq_id.total:
-                # Recovery proportional to this certificate
+                # Recovery proportional to this certificate, capped to what is still outstanding
                 cert_ratio = cert.amount_approved / cert.boq_id.total
-                cert.amount_advance_recovery_orig = (cert.boq_id.outstanding_advanced_payment_original * cert_ratio)
-                cert.amount_advance_recovery_var = (cert.boq_id.outstanding_advanced_payment_variation * cert_ratio)
+                cert.amount_advance_recovery_orig = max(min(
+                    cert.boq_id.advanced_payment_amount_original * cert_ratio,
+                    cert.boq_id.outstanding_advanced_payment_original,
+                ), 0)
+                cert.amount_advance_recovery_var = max(min(
+                    cert.boq_id.advanced_payment_amount_variation * cert_ratio,
+                    cert.boq_id.outstanding_advanced_payment_variation,
+                ), 0)
             else:
                 cert.amount_advance_recovery_orig = 0
                 cert.amount_advance_recovery_var = 0
@@ -137,31 +160,103 @@ class BoqPaymentCertificate(models.Model):
     def action_submit(self):
         """Submit certificate and create draft invoice"""
         self.ensure_one()
+        self._check_submit()
+        
+        invoice_lines = self._prepare_work_invoice_lines(self.line_ids) + self._prepare_deduction_invoice_lines()
+        if not invoice_lines:
+            raise UserError(_('No approved amounts to invoice.'))
+        
+        # Create invoice
+        invoice = self.env['account.move'].create(self._prepare_invoice_vals(invoice_lines))
         
+        self.invoice_id = invoice
+        self.state = 'submitted'
+        self._record_advance_recoveries()
+        
+        # Update subactivity previous quantities
+        self._apply_quantity_transfers()
+        
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move',
+            'res_id': invoice.id,
+            'view_mode': 'form',
+        }
+
+    def action_submit_async(self):
+        """Submit certificate in a background job"""
+        self.ensure_one()
+        self._check_submit()
+        if not (self.line_ids.filtered(lambda l: l.amount_approved > 0) or self._prepare_deduction_invoice_lines()):
+            raise UserError(_('No approved amounts to invoice.'))
+        self.env['boq.job']._enqueue(self, _('Submit certificate %s', self.name))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Certificate Queued'),
+                'message': _('Certificate %s will be submitted in the background.', self.name),
+                'type': 'info',
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
+
+    def _check_submit(self):
         if not self.line_ids:
             raise UserError(_('Cannot submit certificate without lines.'))
-        
-        # Create invoice lines
+        self._check_job_lock()
+
+    def _job_stages(self):
+        return [
+            ('lines', self.line_ids.sorted('id')),
+            ('done', None),
+        ]
+
+    def _job_process(self, stage, lines):
+        if stage == 'lines':
+            # Invoice the chunk and move its quantities in the same transaction
+            if not self.invoice_id:
+                self.invoice_id = self.env['account.move'].create(self._prepare_invoice_vals([]))
+            self.invoice_id.write({'invoice_line_ids': self._prepare_work_invoice_lines(lines)})
+            self._apply_quantity_transfers(lines)
+            return
+        self.invoice_id.write({'invoice_line_ids': self._prepare_deduction_invoice_lines()})
+        self.state = 'submitted'
+        self._record_advance_recoveries()
+
+    def _prepare_invoice_vals(self, invoice_lines):
+        return {
+            'partner_id': self.boq_id.customer_id.id,
+            'move_type': 'out_invoice',
+            'invoice_date': self.certificate_date,
+            'invoice_line_ids': invoice_lines,
+            'ref': self.name,
+            'company_id': self.company_id.id,
+        }
+
+    def _prepare_work_invoice_lines(self, lines):
+        """Invoice line commands for the work completed on ``lines``"""
+        analytic_distribution = {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {}
+        return [(0, 0, {
+            'name': f"{line.subactivity_id.name} - {line.approved_percent:.1f}% Completed",
+            'quantity': line.qty_approved,
+            'price_unit': line.subactivity_id.unit_price,
+            'product_id': line.subactivity_id.product_id.id,
+            'analytic_distribution': analytic_distribution,
+        }) for line in lines if line.amount_approved > 0]
+
+    def _prepare_deduction_invoice_lines(self):
+        """Invoice line commands for the advance recoveries and retention"""
+        analytic_distribution = {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {}
         invoice_lines = []
         
-        # Add work completed lines
-        for line in self.line_ids:
-            if line.amount_approved > 0:
-                invoice_lines.append((0, 0, {
-                    'name': f"{line.subactivity_id.name} - {line.approved_percent:.1f}% Completed",
-                    'quantity': line.qty_approved,
-                    'price_unit': line.subactivity_id.unit_price,
-                    'product_id': line.subactivity_id.product_id.id,
-                    'analytic_distribution': {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {},
-                }))
-        
         # Add advance recovery (negative lines)
         if self.amount_advance_recovery_orig > 0:
             invoice_lines.append((0, 0, {
                 'name': 'Advance Payment Recovery (Original)',
                 'quantity': -1,
                 'price_unit': self.amount_advance_recovery_orig,
-                'analytic_distribution': {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {},
+                'analytic_distribution': analytic_distribution,
             }))
         
         if self.amount_advance_recovery_var > 0:
@@ -169,7 +264,7 @@ class BoqPaymentCertificate(models.Model):
                 'name': 'Advance Payment Recovery (Variation)',
                 'quantity': -1,
                 'price_unit': self.amount_advance_recovery_var,
-                'analytic_distribution': {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {},
+                'analytic_distribution': analytic_distribution,
             }))
         
         # Add retention (negative line)
@@ -178,37 +273,61 @@ class BoqPaymentCertificate(models.Model):
                 'name': f'Retention ({self.boq_id.retention_tax})',
                 'quantity': -1,
                 'price_unit': self.amount_retention,
-                'analytic_distribution': {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {},
+                'analytic_distribution': analytic_distribution,
             }))
-        
-        if not invoice_lines:
-            raise UserError(_('No approved amounts to invoice.'))
-        
-        # Create invoice
-        invoice = self.env['account.move'].create({
-            'partner_id': self.boq_id.customer_id.id,
-            'move_type': 'out_invoice',
-            'invoice_date': self.certificate_date,
-            'invoice_line_ids': invoice_lines,
-            'ref': self.name,
-            'company_id': self.company_id.id,
-        })
-        
-        self.invoice_id = invoice
-        self.state = 'submitted'
-        
-        # Update subactivity previous quantities
-        for line in self.line_ids:
-            if line.approved_percent > 0:
-                line.subactivity_id.previous_qty += line.qty_approved
-                line.subactivity_id.current_qty -= line.qty_approved
-        
-        return {
-            'type': 'ir.actions.act_window',
-            'res_model': 'account.move',
-            'res_id': invoice.id,
-            'view_mode': 'form',
-        }
+        return invoice_lines
+
+    def _record_advance_recoveries(self):
+        """Reduce the outstanding advances by the recovered amounts"""
+        AdvanceLedger = self.env['boq.advance.ledger']
+        for line_type, recovery in (('original', self.amount_advance_recovery_orig),
+                                    ('variation', self.amount_advance_recovery_var)):
+            if recovery > 0:
+                AdvanceLedger._record(self.boq_id, line_type, 'recovery', recovery,
+                                      date=self.certificate_date, certificate=self, move=self.invoice_id)
+
+    def _apply_quantity_transfers(self, lines=None):
+        """Move the approved quantities from current to previous quantity
+        of the subactivities, for all lines (or ``lines``) at once.
+
+        The quantities are summed per subactivity with one grouped read and
+        applied with one ``UPDATE``, after being appended to the quantity
+        ledger; constraints are then checked once for the batch and the
+        affected rollups recomputed in bulk.
+
+        The ``UPDATE`` skips ``write()``, so its job lock and KPI hooks are
+        called here. The quantities do not feed the cost cube.
+        """
+        domain = [('id', 'in', lines.ids)] if lines is not None else [('certificate_id', 'in', self.ids)]
+        groups = self.env['boq.payment.certificate.line']._read_group(
+            domain + [('approved_percent', '>', 0)],
+            ['certificate_id', 'subactivity_id'],
+            ['qty_approved:sum'],
+        )
+        if not groups:
+            return
+        transfers = defaultdict(float)
+        for _certificate, subactivity, qty in groups:
+            transfers[subactivity] += qty
+        subactivities = self.env['boq.subactivity'].concat(*transfers)
+        subactivities.boq_id._check_job_lock()
+        subactivities.boq_id._kpi_invalidate()
+        subactivities.flush_recordset(['previous_qty', 'current_qty'])
+        # Ledger entries continue from the quantities before the transfer
+        self.env['boq.quantity.ledger']._record_transfers(groups)
+        self.env.cr.execute("""
+            UPDATE boq_subactivity sub
+               SET previous_qty = sub.previous_qty + transfer.qty,
+                   current_qty = sub.current_qty - transfer.qty,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::numeric[]) AS transfer(id, qty)
+             WHERE sub.id = transfer.id
+        """, [self.env.uid, subactivities.ids, list(transfers.values())])
+        subactivities.invalidate_recordset(['previous_qty', 'current_qty', 'write_uid', 'write_date'])
+        subactivities.modified(['previous_qty', 'current_qty'])
+        subactivities._validate_fields(['previous_qty', 'current_qty'])
+        subactivities.boq_id._recompute_rollups(subactivities.activity_id)
 
     def action_approve(self):
         """Approve certificate"""
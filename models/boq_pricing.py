@@ -0,0 +1,171 @@
+from odoo import api, models, _
+from odoo.exceptions import UserError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Sub-activity columns loaded by the engine, grouped by activity
+PRICING_QUERY = """
+    SELECT id,
+           activity_id,
+           COALESCE(activity_type, ''),
+           COALESCE(product_cost, 0),
+           COALESCE(total_cost, 0) - COALESCE(product_cost, 0),
+           COALESCE(master_qty, 0),
+           COALESCE(margin_percent, 0)
+      FROM boq_subactivity
+     WHERE boq_id = %s
+  ORDER BY activity_id, id
+"""
+
+
+class BoqPricingEngine(models.AbstractModel):
+    """Price a BOQ under several scenarios without writing anything.
+
+    A scenario is a dict with any of the following keys, applied in this
+    order on top of the current sub-activity values:
+
+    ``name``
+        label returned with the results;
+    ``margin``
+        margin % replacing every sub-activity margin;
+    ``margin_by_type``
+        ``{activity_type: margin %}`` replacing the margin of that type;
+    ``cost_escalation``
+        % added to every product cost;
+    ``cost_escalation_by_type``
+        ``{activity_type: %}`` added to the product cost of that type.
+
+    Additional costs are never escalated.
+    """
+    _name = 'boq.pricing.engine'
+    _description = 'BOQ Pricing Engine'
+
+    @api.model
+    def evaluate(self, boq_id, scenarios):
+        """Return, for each scenario, the BOQ total, cost and margin
+        amounts, and the totals per activity id and per activity type."""
+        boq = self.env['boq.project'].browse(boq_id)
+        boq.check_access('read')
+        data = self._load(boq)
+        margins, costs = self._scenario_columns(data, scenarios)
+        totals_cost = (costs + data['additional_cost']) * data['master_qty']
+        amounts = totals_cost * (1 + margins / 100)
+
+        if len(data['ids']):
+            by_activity = np.add.reduceat(amounts, data['activity_starts'], axis=1)
+        else:
+            by_activity = np.zeros((len(scenarios), 0))
+        by_type = {
+            activity_type: amounts[:, data['activity_type'] == activity_type].sum(axis=1)
+            for activity_type in data['activity_types']
+        }
+        results = []
+        for i, scenario in enumerate(scenarios):
+            total = float(amounts[i].sum())
+            cost = float(totals_cost[i].sum())
+            results.append({
+                'name': scenario.get('name') or _('Scenario %s', i + 1),
+                'total': total,
+                'cost': cost,
+                'margin_amount': total - cost,
+                'activities': dict(zip(data['activity_ids'], by_activity[i].tolist())),
+                'activity_types': {
+                    activity_type or 'undefined': float(values[i])
+                    for activity_type, values in by_type.items()
+                },
+            })
+        return results
+
+    @api.model
+    def commit(self, boq_id, scenario):
+        """Write the margins and product costs of ``scenario`` to the BOQ.
+
+        Only the sub-activities whose values change are updated, with one
+        ``UPDATE``; their computes and the BOQ rollups then run once.
+        Returns the number of sub-activities changed.
+
+        The ``UPDATE`` skips ``write()``, so its access, job lock and KPI
+        hooks are called here. Margins and product costs do not feed the
+        cost cube.
+        """
+        boq = self.env['boq.project'].browse(boq_id)
+        boq.check_access('write')
+        boq._check_job_lock()
+        data = self._load(boq)
+        margins, costs = self._scenario_columns(data, [scenario])
+        # Rounded to the field precisions, as a write would
+        margins, costs = np.round(margins[0], 2), np.round(costs[0], 2)
+        changed = (margins != data['margin_percent']) | (costs != data['product_cost'])
+        if scenario.get('margin') is not None:
+            boq.margin_percent = scenario['margin']
+        if not changed.any():
+            return 0
+        ids = data['ids'][changed].tolist()
+        self.env['boq.subactivity'].browse(ids).check_access('write')
+        boq._kpi_invalidate()
+        self.env.cr.execute("""
+            UPDATE boq_subactivity sub
+               SET margin_percent = new.margin_percent,
+                   product_cost = new.product_cost,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::numeric[], %s::numeric[]) AS new(id, margin_percent, product_cost)
+             WHERE sub.id = new.id
+        """, [self.env.uid, ids, margins[changed].tolist(), costs[changed].tolist()])
+        subactivities = self.env['boq.subactivity'].browse(ids)
+        fnames = ['margin_percent', 'product_cost', 'write_uid', 'write_date']
+        subactivities.invalidate_recordset(fnames)
+        subactivities.modified(['margin_percent', 'product_cost'])
+        subactivities._validate_fields(['margin_percent', 'product_cost'])
+        subactivities.flush_recordset()
+        boq._recompute_rollups(subactivities.activity_id)
+        return len(ids)
+
+    @api.model
+    def _load(self, boq):
+        """Load the pricing columns of the sub-activities of ``boq`` into
+        arrays, ordered by activity."""
+        if np is None:
+            raise UserError(_('The numpy library is required to use the pricing engine.'))
+        self.env['boq.subactivity'].flush_model([
+            'activity_id', 'boq_id', 'activity_type', 'product_cost', 'total_cost',
+            'master_qty', 'margin_percent',
+        ])
+        self.env.cr.execute(PRICING_QUERY, [boq.id])
+        rows = self.env.cr.fetchall()
+        columns = list(zip(*rows)) or [()] * 7
+        activity_column = np.array(columns[1], dtype=np.int64)
+        activity_ids, activity_starts = np.unique(activity_column, return_index=True)
+        activity_type = np.array(columns[2], dtype=object)
+        return {
+            'ids': np.array(columns[0], dtype=np.int64),
+            'activity_ids': activity_ids.tolist(),
+            'activity_starts': activity_starts,
+            'activity_type': activity_type,
+            'activity_types': sorted(set(columns[2])),
+            'product_cost': np.array(columns[3], dtype=np.float64),
+            'additional_cost': np.array(columns[4], dtype=np.float64),
+            'master_qty': np.array(columns[5], dtype=np.float64),
+            'margin_percent': np.array(columns[6], dtype=np.float64),
+        }
+
+    @api.model
+    def _scenario_columns(self, data, scenarios):
+        """Return the (scenarios x sub-activities) margin and product cost
+        matrices of ``scenarios``."""
+        count = len(scenarios)
+        margins = np.tile(data['margin_percent'], (count, 1))
+        costs = np.tile(data['product_cost'], (count, 1))
+        for i, scenario in enumerate(scenarios):
+            if scenario.get('margin') is not None:
+                margins[i] = scenario['margin']
+            for activity_type, margin in (scenario.get('margin_by_type') or {}).items():
+                margins[i, data['activity_type'] == activity_type] = margin
+            if scenario.get('cost_escalation'):
+                costs[i] *= 1 + scenario['cost_escalation'] / 100
+            for activity_type, escalation in (scenario.get('cost_escalation_by_type') or {}).items():
+                costs[i, data['activity_type'] == activity_type] *= 1 + escalation / 100
+        return margins, costs
@@ -1,14 +1,101 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import csv
+import io
+import itertools
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL, float_compare
+from odoo.tools.lru import LRU
 import logging
 
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from .boq_activity import (
+    ACTIVITY_ROLLUP_FIELDS,
+    ACTIVITY_ROLLUP_QUERY,
+    ROLLUP_SUBACTIVITY_FIELDS,
+    progress_percents,
+)
+from .boq_advance_ledger import ADVANCE_FIELDS
+
+# Retention percentage when the retention tax label has none
+DEFAULT_RETENTION_RATE = 5.0
+
+# Fields only written by boq.advance.ledger._record()
+ADVANCE_LEDGER_FIELDS = {fname for fnames in ADVANCE_FIELDS.values() for fname in fnames}
+
+# Key of the running batch edit state in the transaction data
+BATCH_EDIT_KEY = 'boq.batch_edit'
+
+# BOQ values not carried over by clone_tree() when progress is reset: the
+# sales and purchase documents and the advance payments of the source
+CLONE_RESET_VALUES = {
+    'sale_order_id': False,
+    'purchase_order_id': False,
+    'advanced_payment_amount_original': 0.0,
+    'advanced_payment_percentage_original': 0.0,
+    'advance_recovered_original': 0.0,
+    'advanced_payment_amount_variation': 0.0,
+    'advanced_payment_percentage_variation': 0.0,
+    'advance_recovered_variation': 0.0,
+}
+
+# Key of the BOQs whose KPI stamp is bumped when the transaction commits
+KPI_STALE_KEY = 'boq.kpi_stale'
+
+# Dashboard KPIs of the BOQs, shared by the requests of the process:
+# {(dbname, boq id): (kpi stamp, kpis)}
+KPI_CACHE = LRU(8192)
+
+KPI_QUERY = """
+    SELECT boq.id,
+           COALESCE(boq.kpi_stamp, 0),
+           COALESCE(boq.total, 0),
+           COALESCE(boq.total_previous, 0),
+           COALESCE(boq.total_current, 0),
+           COALESCE(boq.billed_progress_percent, 0),
+           COALESCE(boq.onsite_progress_percent, 0),
+           COALESCE(boq.retention_amount_total, 0),
+           COALESCE(boq.outstanding_advanced_payment_original, 0),
+           COALESCE(boq.outstanding_advanced_payment_variation, 0),
+           COALESCE(var.amount, 0),
+           COALESCE(var.count, 0)
+      FROM boq_project boq
+ LEFT JOIN (SELECT boq_id, SUM(total_variation_amount) AS amount, COUNT(*) AS count
+              FROM boq_variation
+             WHERE state IN ('submitted', 'approved')
+               AND boq_id = ANY(%(ids)s)
+          GROUP BY boq_id) var ON var.boq_id = boq.id
+     WHERE boq.id = ANY(%(ids)s)
+"""
+
+BOQ_ROLLUP_FIELDS = [
+    'total_previous', 'total_current', 'total',
+    'billed_progress_percent', 'onsite_progress_percent',
+    'weighted_billed_amount', 'weighted_onsite_amount',
+]
+
 _logger = logging.getLogger(__name__)
 
+# Suffixes of the server-side export cursors
+EXPORT_CURSOR_IDS = itertools.count()
+
+EXPORT_HEADER = [
+    'Level', 'Activity', 'Product', 'Description', 'Activity Type', 'UoM',
+    'Master Qty', 'Previous Qty', 'Current Qty', 'Product Cost', 'Total Cost',
+    'Margin %', 'Unit Price', 'Total', 'Cost Name', 'Cost',
+]
+
 
 class BoqProject(models.Model):
     _name = 'boq.project'
     _description = 'Bill of Quantities'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'boq.job.mixin']
     _rec_name = 'name'
     _order = 'create_date desc, id desc'
 
@@ -94,6 +181,18 @@ class BoqProject(models.Model):
         compute='_compute_progress',
         store=True
     )
+    # Progress numerators, kept so that activity changes can be propagated
+    # incrementally
+    weighted_billed_amount = fields.Monetary(
+        'Weighted Billed Amount',
+        compute='_compute_progress',
+        store=True
+    )
+    weighted_onsite_amount = fields.Monetary(
+        'Weighted Onsite Amount',
+        compute='_compute_progress',
+        store=True
+    )
     margin_percent = fields.Float(
         'Global Margin %', 
         digits=(5, 2),
@@ -151,6 +250,13 @@ class BoqProject(models.Model):
         string='Retention Journal',
         domain="[('type', '=', 'general'), ('company_id', '=', company_id)]"
     )
+    retention_rate = fields.Float(
+        'Retention %',
+        digits=(5, 2),
+        compute='_compute_retention_rate',
+        store=True,
+        help="Percentage parsed from the retention tax, 5% when it has none"
+    )
     retention_amount_total = fields.Monetary(
         'Retention Amount Total',
         compute='_compute_retention_amounts',
@@ -166,12 +272,19 @@ class BoqProject(models.Model):
     
     # Original Advanced Payment
     advanced_payment_amount_original = fields.Monetary(
-        'Advanced Payment Amount Original'
+        'Advanced Payment Amount Original',
+        readonly=True,
+        copy=False
     )
     advanced_payment_percentage_original = fields.Float(
         'Advanced Payment Percentage Original',
         digits=(5, 2)
     )
+    advance_recovered_original = fields.Monetary(
+        'Advance Recovered Original',
+        readonly=True,
+        copy=False
+    )
     outstanding_advanced_payment_original = fields.Monetary(
         'Outstanding Advanced Payment Amount Original',
         compute='_compute_outstanding_advances',
@@ -180,12 +293,19 @@ class BoqProject(models.Model):
     
     # Variation Advanced Payment
     advanced_payment_amount_variation = fields.Monetary(
-        'Advanced Payment Amount Variation'
+        'Advanced Payment Amount Variation',
+        readonly=True,
+        copy=False
     )
     advanced_payment_percentage_variation = fields.Float(
         'Advanced Payment Percentage Variation',
         digits=(5, 2)
     )
+    advance_recovered_variation = fields.Monetary(
+        'Advance Recovered Variation',
+        readonly=True,
+        copy=False
+    )
     outstanding_advanced_payment_variation = fields.Monetary(
         'Outstanding Advanced Payment Amount Variation',
         compute='_compute_outstanding_advances',
@@ -218,25 +338,49 @@ class BoqProject(models.Model):
     # Statistics
     payment_certificate_count = fields.Integer(
         'Payment Certificate Count',
-        compute='_compute_counts'
+        compute='_compute_counts',
+        store=True
     )
     variation_count = fields.Integer(
         'Variation Count',
-        compute='_compute_counts'
+        compute='_compute_counts',
+        store=True
     )
+    # Incremented when anything shown by the dashboard KPIs changes
+    kpi_stamp = fields.Integer('KPI Stamp', readonly=True, copy=False)
     
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """Override create to set sequence"""
-        if vals.get('name', _('New')) == _('New'):
-            if vals.get('type') == 'subcontract':
-                vals['name'] = self.env['ir.sequence'].next_by_code('boq.subcontract') or _('New')
-            else:
-                vals['name'] = self.env['ir.sequence'].next_by_code('boq.project') or _('New')
-        return super().create(vals)
+        to_name = defaultdict(list)
+        for vals in vals_list:
+            if vals.get('name', _('New')) == _('New'):
+                code = 'boq.subcontract' if vals.get('type') == 'subcontract' else 'boq.project'
+                to_name[code].append(vals)
+        for code, code_vals_list in to_name.items():
+            names = self.env['ir.sequence']._next_batch_by_code(code, len(code_vals_list))
+            for vals, name in zip(code_vals_list, names):
+                vals['name'] = name or _('New')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        # The advance totals follow the advance ledger entries
+        if not self.env.su and ADVANCE_LEDGER_FIELDS.intersection(vals):
+            raise UserError(_('Advance payments and recoveries can only be recorded through the advance ledger.'))
+        res = super().write(vals)
+        self._kpi_invalidate()
+        return res
     
     @api.depends('activity_line_ids.total_previous', 'activity_line_ids.total_current', 'activity_line_ids.total_cumulative')
     def _compute_totals(self):
+        if self._use_sql_rollups():
+            rollups = self._read_rollups()
+            for boq in self:
+                values = rollups.get(boq.id, {})
+                boq.total_previous = values.get('total_previous', 0.0)
+                boq.total_current = values.get('total_current', 0.0)
+                boq.total = values.get('total_cumulative', 0.0)
+            return
         for boq in self:
             boq.total_previous = sum(boq.activity_line_ids.mapped('total_previous'))
             boq.total_current = sum(boq.activity_line_ids.mapped('total_current'))
@@ -244,7 +388,23 @@ class BoqProject(models.Model):
     
     @api.depends('activity_line_ids.billed_progress_percent', 'activity_line_ids.onsite_progress_percent')
     def _compute_progress(self):
+        if self._use_sql_rollups():
+            rollups = self._read_rollups()
+            for boq in self:
+                values = rollups.get(boq.id, {})
+                total_cumulative = values.get('total_cumulative', 0.0)
+                boq.weighted_billed_amount = values.get('weighted_billed', 0.0)
+                boq.weighted_onsite_amount = values.get('weighted_onsite', 0.0)
+                if total_cumulative:
+                    boq.billed_progress_percent = (values['weighted_billed'] / total_cumulative) * 100
+                    boq.onsite_progress_percent = (values['weighted_onsite'] / total_cumulative) * 100
+                else:
+                    boq.billed_progress_percent = 0
+                    boq.onsite_progress_percent = 0
+            return
         for boq in self:
+            boq.weighted_billed_amount = 0
+            boq.weighted_onsite_amount = 0
             if boq.activity_line_ids:
                 total_cumulative = sum(boq.activity_line_ids.mapped('total_cumulative'))
                 if total_cumulative:
@@ -256,6 +416,8 @@ class BoqProject(models.Model):
                         activity.onsite_progress_percent * activity.total_cumulative / 100
                         for activity in boq.activity_line_ids
                     )
+                    boq.weighted_billed_amount = weighted_billed
+                    boq.weighted_onsite_amount = weighted_onsite
                     boq.billed_progress_percent = (weighted_billed / total_cumulative) * 100
                     boq.onsite_progress_percent = (weighted_onsite / total_cumulative) * 100
                 else:
@@ -265,31 +427,586 @@ class BoqProject(models.Model):
                 boq.billed_progress_percent = 0
                 boq.onsite_progress_percent = 0
     
-    @api.depends('total', 'retention_tax')
-    def _compute_retention_amounts(self):
+    def _use_sql_rollups(self, records=None):
+        """Whether the rollups of ``records`` (BOQs or activities, ``self``
+        by default) are aggregated in SQL. They are for saved records; new
+        records (onchange) and the ``boq_rollup_orm`` context use the ORM
+        path."""
+        records = self if records is None else records
+        return not self.env.context.get('boq_rollup_orm') and all(
+            isinstance(record_id, int) for record_id in records._ids
+        )
+
+    def _rollup_query(self):
+        """Return the BOQ-level aggregate over ``boq_activity`` and
+        ``boq_subactivity``, filtered on a tuple of BOQ ids."""
+        return """
+            SELECT act.boq_id,
+                   SUM(act.total_previous),
+                   SUM(act.total_current),
+                   SUM(act.total_cumulative),
+                   SUM(CASE WHEN act.master_qty != 0
+                            THEN act.previous_qty / act.master_qty * act.total_cumulative
+                            ELSE 0 END),
+                   SUM(CASE WHEN act.master_qty != 0
+                            THEN (act.previous_qty + act.current_qty) / act.master_qty * act.total_cumulative
+                            ELSE 0 END)
+              FROM ({activities}) act
+          GROUP BY act.boq_id
+        """.format(activities=ACTIVITY_ROLLUP_QUERY.format(where='act.boq_id IN %s'))
+
+    def _read_rollups(self):
+        """Aggregate the totals and weighted progress of the BOQs in ``self``.
+
+        The weighted amounts are the sums of each activity progress ratio
+        multiplied by the activity cumulative total, i.e. the numerators of
+        the BOQ progress percentages.
+        """
+        if not self._ids:
+            return {}
+        self.env['boq.subactivity'].flush_model(ROLLUP_SUBACTIVITY_FIELDS)
+        self.env['boq.activity'].flush_model(['boq_id'])
+        self.env.cr.execute(self._rollup_query(), [tuple(self._ids)])
+        return {
+            row[0]: {
+                'total_previous': float(row[1]),
+                'total_current': float(row[2]),
+                'total_cumulative': float(row[3]),
+                'weighted_billed': float(row[4]),
+                'weighted_onsite': float(row[5]),
+            }
+            for row in self.env.cr.fetchall()
+        }
+
+    def _recompute_rollups(self, activities=None):
+        """Recompute the stored activity and BOQ rollups of ``self`` in bulk.
+
+        Both levels are written with one ``UPDATE ... FROM`` statement each,
+        bypassing the per-record compute cascade. When ``activities`` is
+        given, only those activities are rewritten instead of every activity
+        of the BOQs. Pending recomputations of the rewritten fields are
+        dropped and the cache is invalidated.
+        """
+        if not self._ids:
+            return
+        if activities is None:
+            activity_where, activity_params = 'act.boq_id IN %s', [tuple(self._ids)]
+        elif activities:
+            activity_where, activity_params = 'act.id IN %s', [tuple(activities._ids)]
+        else:
+            activity_where, activity_params = 'FALSE', []
+        self.env['boq.subactivity'].flush_model(ROLLUP_SUBACTIVITY_FIELDS)
+        self.env['boq.activity'].flush_model(['boq_id'])
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE boq_activity act
+               SET total_previous = r.total_previous,
+                   total_current = r.total_current,
+                   total_cumulative = r.total_cumulative,
+                   billed_progress_percent = CASE WHEN r.master_qty != 0
+                        THEN r.previous_qty / r.master_qty * 100 ELSE 0 END,
+                   onsite_progress_percent = CASE WHEN r.master_qty != 0
+                        THEN (r.previous_qty + r.current_qty) / r.master_qty * 100 ELSE 0 END,
+                   master_qty_total = r.master_qty,
+                   previous_qty_total = r.previous_qty,
+                   current_qty_total = r.current_qty
+              FROM ({activities}) r
+             WHERE act.id = r.id
+         RETURNING act.id
+        """.format(activities=ACTIVITY_ROLLUP_QUERY.format(where=activity_where)),
+            activity_params,
+        )
+        activities = self.env['boq.activity'].browse([row[0] for row in cr.fetchall()])
+        cr.execute("""
+            UPDATE boq_project boq
+               SET total_previous = r.total_previous,
+                   total_current = r.total_current,
+                   total = r.total_cumulative,
+                   billed_progress_percent = CASE WHEN r.total_cumulative != 0
+                        THEN r.weighted_billed / r.total_cumulative * 100 ELSE 0 END,
+                   onsite_progress_percent = CASE WHEN r.total_cumulative != 0
+                        THEN r.weighted_onsite / r.total_cumulative * 100 ELSE 0 END,
+                   weighted_billed_amount = r.weighted_billed,
+                   weighted_onsite_amount = r.weighted_onsite
+              FROM ({rollups}) r (boq_id, total_previous, total_current, total_cumulative,
+                                  weighted_billed, weighted_onsite)
+             WHERE boq.id = r.boq_id
+        """.format(rollups=self._rollup_query()), [tuple(self._ids)])
+        # BOQs without any activity are not returned by the aggregate
+        cr.execute("""
+            UPDATE boq_project boq
+               SET total_previous = 0, total_current = 0, total = 0,
+                   billed_progress_percent = 0, onsite_progress_percent = 0,
+                   weighted_billed_amount = 0, weighted_onsite_amount = 0
+             WHERE boq.id IN %s
+               AND NOT EXISTS (SELECT 1 FROM boq_activity act WHERE act.boq_id = boq.id)
+        """, [tuple(self._ids)])
+        self._invalidate_rollups(activities)
+
+    def _invalidate_rollups(self, activities):
+        """Drop pending recomputations and cached values of the rollup fields
+        of ``activities`` and ``self`` after they were written in SQL, and
+        mark the fields depending on the BOQ totals as modified."""
+        for fname in ACTIVITY_ROLLUP_FIELDS:
+            self.env.remove_to_compute(activities._fields[fname], activities)
+        for fname in BOQ_ROLLUP_FIELDS:
+            self.env.remove_to_compute(self._fields[fname], self)
+        activities.invalidate_recordset(ACTIVITY_ROLLUP_FIELDS)
+        self.invalidate_recordset(BOQ_ROLLUP_FIELDS)
+        self.modified(['total_previous', 'total_current', 'total'])
+        self._kpi_invalidate()
+
+    def _kpi_invalidate(self):
+        """Mark the cached dashboard KPIs of ``self`` as stale.
+
+        The KPI stamps are bumped once per BOQ when the transaction commits,
+        which makes every process drop its cached values.
+        """
+        ids = [boq_id for boq_id in self._ids if isinstance(boq_id, int)]
+        if not ids:
+            return
+        precommit = self.env.cr.precommit
+        if KPI_STALE_KEY not in precommit.data:
+            precommit.data[KPI_STALE_KEY] = set()
+            precommit.add(self._kpi_bump_stamps)
+        precommit.data[KPI_STALE_KEY].update(ids)
+
+    def _kpi_bump_stamps(self):
+        ids = self.env.cr.precommit.data.pop(KPI_STALE_KEY, set())
+        if ids:
+            self.env.cr.execute(
+                "UPDATE boq_project SET kpi_stamp = COALESCE(kpi_stamp, 0) + 1 WHERE id = ANY(%s)",
+                [sorted(ids)],
+            )
+
+    def _get_kpis(self):
+        """Return the dashboard KPIs of ``self`` as ``{boq id: kpis}``.
+
+        Values are cached per process and per BOQ with the KPI stamp they
+        were read at. Only the BOQs whose stamp changed since are read
+        again, all with one aggregate query.
+        """
+        if not self._ids:
+            return {}
+        dbname = self.env.cr.dbname
+        # Changes of the current transaction are not stamped yet
+        stale = self.env.cr.precommit.data.get(KPI_STALE_KEY, set())
+        self.env.cr.execute(
+            "SELECT id, COALESCE(kpi_stamp, 0) FROM boq_project WHERE id = ANY(%s)",
+            [list(self._ids)],
+        )
+        kpis = {}
+        missing = []
+        for boq_id, stamp in self.env.cr.fetchall():
+            cached = KPI_CACHE.get((dbname, boq_id))
+            if cached and cached[0] == stamp and boq_id not in stale:
+                kpis[boq_id] = cached[1]
+            else:
+                missing.append(boq_id)
+        if missing:
+            self._flush_rollups()
+            self.flush_model([
+                'retention_amount_total',
+                'outstanding_advanced_payment_original', 'outstanding_advanced_payment_variation',
+            ])
+            self.env['boq.variation'].flush_model(['boq_id', 'state', 'total_variation_amount'])
+            self.env.cr.execute(KPI_QUERY, {'ids': missing})
+            for row in self.env.cr.fetchall():
+                boq_id, stamp = row[0], row[1]
+                kpis[boq_id] = {
+                    'total': float(row[2]),
+                    'total_previous': float(row[3]),
+                    'total_current': float(row[4]),
+                    'billed_progress_percent': float(row[5]),
+                    'onsite_progress_percent': float(row[6]),
+                    'retention_amount_total': float(row[7]),
+                    'outstanding_advance_original': float(row[8]),
+                    'outstanding_advance_variation': float(row[9]),
+                    'pending_variation_amount': float(row[10]),
+                    'pending_variation_count': row[11],
+                }
+                if boq_id not in stale:
+                    KPI_CACHE[(dbname, boq_id)] = (stamp, kpis[boq_id])
+        return kpis
+
+    @api.model
+    def _flush_rollups(self):
+        """Flush the sub-activity, activity and BOQ rollup fields, so that the
+        stored values can be read or adjusted in SQL."""
+        self.env['boq.subactivity'].flush_model(ROLLUP_SUBACTIVITY_FIELDS)
+        self.env['boq.activity'].flush_model(['boq_id'] + ACTIVITY_ROLLUP_FIELDS)
+        self.flush_model(BOQ_ROLLUP_FIELDS)
+
+    def _apply_rollup_deltas(self, deltas, activities):
+        """Adjust the stored rollups of ``self`` by activity changes.
+
+        ``deltas`` maps BOQ ids to ``(total_previous, total_current,
+        weighted_billed, weighted_onsite)`` differences computed by
+        :meth:`boq.activity._apply_rollup_deltas` for ``activities``.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            SELECT id, total, weighted_billed_amount, weighted_onsite_amount
+              FROM boq_project
+             WHERE id IN %s
+               FOR UPDATE
+        """, [tuple(self._ids)])
+        for boq_id, total, weighted_billed, weighted_onsite in cr.fetchall():
+            d_total_previous, d_total_current, d_weighted_billed, d_weighted_onsite = deltas[boq_id]
+            total = float(total or 0.0)
+            weighted_billed = float(weighted_billed or 0.0) + d_weighted_billed
+            weighted_onsite = float(weighted_onsite or 0.0) + d_weighted_onsite
+            cr.execute("""
+                UPDATE boq_project
+                   SET total_previous = total_previous + %s,
+                       total_current = total_current + %s,
+                       weighted_billed_amount = %s,
+                       weighted_onsite_amount = %s,
+                       billed_progress_percent = %s,
+                       onsite_progress_percent = %s
+                 WHERE id = %s
+            """, [d_total_previous, d_total_current, weighted_billed, weighted_onsite,
+                  weighted_billed / total * 100 if total else 0.0,
+                  weighted_onsite / total * 100 if total else 0.0,
+                  boq_id])
+        self._invalidate_rollups(activities)
+
+    def _check_rollup_consistency(self, precision_digits=2):
+        """Compare the stored rollups of ``self`` with a full recompute.
+
+        Used to verify incrementally propagated values. Returns a list of
+        ``(model, record id, field, stored, expected)`` tuples for every value
+        that differs; an empty list means the rollups are consistent.
+        """
+        self._flush_rollups()
+        mismatches = []
+        activities = self.activity_line_ids
+        activity_rollups = activities._read_rollups()
+        for activity in activities:
+            values = activity_rollups.get(activity.id, {})
+            billed, onsite = progress_percents(
+                values.get('master_qty', 0.0),
+                values.get('previous_qty', 0.0),
+                values.get('current_qty', 0.0),
+            )
+            expected = {
+                'total_previous': values.get('total_previous', 0.0),
+                'total_current': values.get('total_current', 0.0),
+                'total_cumulative': values.get('total_cumulative', 0.0),
+                'master_qty_total': values.get('master_qty', 0.0),
+                'previous_qty_total': values.get('previous_qty', 0.0),
+                'current_qty_total': values.get('current_qty', 0.0),
+                'billed_progress_percent': billed,
+                'onsite_progress_percent': onsite,
+            }
+            for fname, value in expected.items():
+                if float_compare(activity[fname], value, precision_digits=precision_digits):
+                    mismatches.append((activity._name, activity.id, fname, activity[fname], value))
+        boq_rollups = self._read_rollups()
         for boq in self:
+            values = boq_rollups.get(boq.id, {})
+            total = values.get('total_cumulative', 0.0)
+            weighted_billed = values.get('weighted_billed', 0.0)
+            weighted_onsite = values.get('weighted_onsite', 0.0)
+            expected = {
+                'total_previous': values.get('total_previous', 0.0),
+                'total_current': values.get('total_current', 0.0),
+                'total': total,
+                'weighted_billed_amount': weighted_billed,
+                'weighted_onsite_amount': weighted_onsite,
+                'billed_progress_percent': weighted_billed / total * 100 if total else 0.0,
+                'onsite_progress_percent': weighted_onsite / total * 100 if total else 0.0,
+            }
+            for fname, value in expected.items():
+                if float_compare(boq[fname], value, precision_digits=precision_digits):
+                    mismatches.append((boq._name, boq.id, fname, boq[fname], value))
+        if mismatches:
+            _logger.warning("BOQ rollup inconsistencies found: %s", mismatches)
+        return mismatches
+
+    @contextmanager
+    def batch_edit(self):
+        """Defer the rollup and constraint cascades of BOQ trees.
+
+        Inside the block, writes on activities, sub-activities and additional
+        costs no longer recompute the activity and BOQ rollups nor check
+        their constraints. When the block exits, constraints are validated
+        once per model and every affected activity and BOQ is recomputed
+        exactly once. Yields a dict filled with statistics on exit::
+
+            with boq.batch_edit() as stats:
+                boq.activity_line_ids.subactivity_ids.write({'margin_percent': 10})
+            _logger.info("%(saved_recomputes)s recomputes saved", stats)
+
+        Nested blocks join the outermost one.
+        """
+        data = self.env.cr.precommit.data
+        stats = {}
+        if BATCH_EDIT_KEY in data:
+            yield stats
+            return
+        state = data[BATCH_EDIT_KEY] = {
+            'activity_ids': set(),
+            'boq_ids': set(self._ids),
+            'cascades': 0,
+            'constraints': defaultdict(lambda: [set(), set()]),
+        }
+        try:
+            yield stats
+        finally:
+            # Precommit data is not restored by a savepoint rollback: the
+            # state must not outlive the block, however it is left
+            data.pop(BATCH_EDIT_KEY, None)
+        stats.update(self._batch_edit_finish(state))
+
+    @api.model
+    def _batch_edit_active(self):
+        return BATCH_EDIT_KEY in self.env.cr.precommit.data
+
+    @api.model
+    def _batch_edit_defer(self, activities, boqs=None):
+        """Register ``activities`` and ``boqs`` as touched by the running
+        batch edit and drop their pending rollup recomputations.
+
+        Returns whether a batch edit is running.
+        """
+        state = self.env.cr.precommit.data.get(BATCH_EDIT_KEY)
+        if state is None:
+            return False
+        boqs = (boqs or self.browse()) | activities.boq_id
+        state['activity_ids'].update(activities._ids)
+        state['boq_ids'].update(boqs._ids)
+        state['cascades'] += len(activities) + len(boqs)
+        for fname in ACTIVITY_ROLLUP_FIELDS:
+            self.env.remove_to_compute(activities._fields[fname], activities)
+        for fname in BOQ_ROLLUP_FIELDS:
+            self.env.remove_to_compute(self._fields[fname], boqs)
+        return True
+
+    @api.model
+    def _batch_edit_defer_constraints(self, records, field_names):
+        """Postpone the constraint checks of ``records`` to the end of the
+        running batch edit. Returns whether they were postponed."""
+        state = self.env.cr.precommit.data.get(BATCH_EDIT_KEY)
+        if state is None:
+            return False
+        record_ids, fnames = state['constraints'][records._name]
+        record_ids.update(records._ids)
+        fnames.update(field_names)
+        return True
+
+    @api.model
+    def _batch_edit_finish(self, state):
+        """Validate the postponed constraints and recompute the rollups of
+        the activities and BOQs touched during a batch edit."""
+        for model_name, (record_ids, fnames) in state['constraints'].items():
+            self.env[model_name].browse(record_ids).exists()._validate_fields(fnames)
+        activities = self.env['boq.activity'].browse(state['activity_ids']).exists()
+        boqs = self.browse(state['boq_ids']).exists()
+        boqs._recompute_rollups(activities)
+        recomputes = len(activities) + len(boqs)
+        stats = {
+            'activities': len(activities),
+            'boqs': len(boqs),
+            'recomputes': recomputes,
+            'saved_recomputes': max(state['cascades'] - recomputes, 0),
+            'constraint_checks': sum(len(ids) for ids, _fnames in state['constraints'].values()),
+        }
+        _logger.info(
+            "BOQ batch edit: recomputed %(activities)s activities and %(boqs)s BOQs, "
+            "saved %(saved_recomputes)s rollup recomputes", stats,
+        )
+        return stats
+
+    def clone_tree(self, default=None, overrides=None, reset_progress=True):
+        """Copy the BOQ with its whole activity tree.
+
+        ``default`` is passed to ``copy()`` for the BOQ itself (e.g. a new
+        ``type`` or ``currency_id``); with ``reset_progress`` the sales and
+        purchase orders and the advance payments of the source are not
+        copied either. See :meth:`_clone_tree_into` for the other
+        arguments. Returns the new BOQ.
+        """
+        self.ensure_one()
+        default = dict(CLONE_RESET_VALUES if reset_progress else {}, **(default or {}))
+        target = self.copy(dict(default, activity_line_ids=[]))
+        self._clone_tree_into(target, overrides=overrides, reset_progress=reset_progress)
+        return target
+
+    def _clone_tree_into(self, target, activities=None, overrides=None, product_costs=None,
+                         copy_costs=True, reset_progress=True):
+        """Copy ``activities`` (all activities of the BOQ by default) with
+        their subactivities and additional costs under ``target``.
+
+        Each level is copied with one ``INSERT ... SELECT`` on ids reserved
+        from the table sequence, which gives the mapping from source to
+        copied ids for the next level. ``overrides`` maps model names to
+        column values forced on the copies (e.g. ``{'boq.subactivity':
+        {'margin_percent': 0}}``), ``product_costs`` maps product ids to the
+        product cost of their copied subactivities, and ``reset_progress``
+        clears the previous and current quantities. The subactivity
+        computes and the rollups of ``target`` are recomputed once at the
+        end.
+        """
+        self.ensure_one()
+        overrides = overrides or {}
+        if activities is None:
+            activities = self.activity_line_ids
+        # The rows are inserted in SQL: check what the ORM would have
+        self.check_access('read')
+        target.check_access('write')
+        target._check_job_lock()
+        cloned_models = ['boq.activity', 'boq.subactivity'] + (['boq.subactivity.cost'] if copy_costs else [])
+        for model_name in cloned_models:
+            self.env[model_name].check_access('create')
+        self.env.flush_all()
+
+        activity_values = dict(overrides.get('boq.activity', {}), boq_id=target.id, company_id=target.company_id.id)
+        activity_map = self._clone_rows('boq.activity', activities.ids, activity_values)
+
+        sub_values = {'source_variation_id': None}
+        if reset_progress:
+            sub_values.update(previous_qty=0.0, current_qty=0.0)
+        sub_values.update(overrides.get('boq.subactivity', {}))
+        sub_values.update(boq_id=target.id, company_id=target.company_id.id)
+        self.env.cr.execute(
+            "SELECT id FROM boq_subactivity WHERE activity_id = ANY(%s) ORDER BY id",
+            [list(activity_map)],
+        )
+        sub_ids = [row[0] for row in self.env.cr.fetchall()]
+        sub_map = self._clone_rows(
+            'boq.subactivity', sub_ids, sub_values,
+            parent=('activity_id', activity_map), product_costs=product_costs,
+        )
+
+        cost_map = {}
+        if copy_costs:
+            self.env.cr.execute(
+                "SELECT id FROM boq_subactivity_cost WHERE subactivity_id = ANY(%s) ORDER BY id",
+                [list(sub_map)],
+            )
+            cost_ids = [row[0] for row in self.env.cr.fetchall()]
+            cost_map = self._clone_rows(
+                'boq.subactivity.cost', cost_ids, overrides.get('boq.subactivity.cost', {}),
+                parent=('subactivity_id', sub_map),
+            )
+        # Record rules on the copies, e.g. the company of the target
+        self.env['boq.activity'].browse(list(activity_map.values())).check_access('create')
+        self.env['boq.subactivity'].browse(list(sub_map.values())).check_access('create')
+        costs = self.env['boq.subactivity.cost'].browse(list(cost_map.values()))
+        costs.check_access('create')
+
+        # The copied rows are not known to the cache yet
+        target.invalidate_recordset(['activity_line_ids'])
+        Subactivity = self.env['boq.subactivity']
+        subs = Subactivity.browse(list(sub_map.values()))
+        if reset_progress or overrides.get('boq.subactivity') or product_costs or not copy_costs:
+            computed = [
+                field for field in Subactivity._fields.values()
+                if field.store and field.compute and not field.related
+            ]
+            for field in computed:
+                self.env.add_to_compute(field, subs)
+            subs.flush_recordset([field.name for field in computed])
+        target._recompute_rollups()
+        # What the create overrides of the cloned models do per record
+        Cube = self.env['boq.cost.cube']
+        Cube._apply_contributions({}, Cube._contributions(costs))
+        target._kpi_invalidate()
+        return subs
+
+    def _clone_rows(self, model_name, source_ids, values, parent=None, product_costs=None):
+        """Insert copies of the ``source_ids`` rows of ``model_name`` and
+        return the ``{source id: copy id}`` mapping.
+
+        ``values`` overrides columns of the copies; ``parent`` is a
+        ``(column, {source id: copy id})`` pair remapping a many2one to the
+        copied parents. ``product_costs`` maps product ids to the product
+        cost of the copies; entries without a product are ignored.
+        """
+        if not source_ids:
+            return {}
+        product_costs = {product_id: cost for product_id, cost in (product_costs or {}).items() if product_id}
+        Model = self.env[model_name]
+        cr = self.env.cr
+        cr.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [f'{Model._table}_id_seq', len(source_ids)])
+        copy_ids = [row[0] for row in cr.fetchall()]
+
+        columns = [
+            name for name, field in Model._fields.items()
+            if field.store and field.column_type and name not in models.MAGIC_COLUMNS
+        ]
+        expressions = []
+        params = [self.env.uid, self.env.uid]
+        for column in columns:
+            if parent and column == parent[0]:
+                expressions.append('parent.copy_id')
+            elif column in values:
+                expressions.append('%s')
+                params.append(values[column])
+            elif column == 'product_cost' and product_costs:
+                expressions.append('COALESCE(price.cost, src.product_cost)')
+            else:
+                expressions.append(f'src."{column}"')
+        joins = ''
+        params += [source_ids, copy_ids]
+        if parent:
+            joins += """
+                JOIN unnest(%s::int[], %s::int[]) AS parent(source_id, copy_id)
+                  ON parent.source_id = src.{}""".format(parent[0])
+            params += [list(parent[1]), list(parent[1].values())]
+        if product_costs and 'product_cost' in columns and 'product_cost' not in values:
+            joins += """
+           LEFT JOIN unnest(%s::int[], %s::numeric[]) AS price(product_id, cost)
+                  ON price.product_id = src.product_id"""
+            params += [list(product_costs), list(product_costs.values())]
+        cr.execute("""
+            INSERT INTO "{table}" (id, create_uid, create_date, write_uid, write_date, {columns})
+            SELECT rows.copy_id, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC', {expressions}
+              FROM unnest(%s::int[], %s::int[]) AS rows(source_id, copy_id)
+              JOIN "{table}" src ON src.id = rows.source_id{joins}
+        """.format(
+            table=Model._table,
+            columns=', '.join(f'"{column}"' for column in columns),
+            expressions=', '.join(expressions),
+            joins=joins,
+        ), params)
+        return dict(zip(source_ids, copy_ids))
+
+    @api.depends('retention_tax')
+    def _compute_retention_rate(self):
+        for boq in self:
+            rate = DEFAULT_RETENTION_RATE
             if boq.retention_tax and '%' in boq.retention_tax:
                 try:
                     # Extract percentage from retention_tax (e.g., "RET 5%" -> 5)
-                    percentage = float(boq.retention_tax.split()[-1].replace('%', ''))
-                    boq.retention_amount_total = boq.total * (percentage / 100)
+                    rate = float(boq.retention_tax.split()[-1].replace('%', ''))
                 except (ValueError, IndexError):
-                    boq.retention_amount_total = 0
-            else:
-                boq.retention_amount_total = 0
+                    pass
+            boq.retention_rate = rate
     
-    @api.depends('advanced_payment_amount_original', 'advanced_payment_amount_variation')
+    @api.depends('total', 'retention_rate')
+    def _compute_retention_amounts(self):
+        for boq in self:
+            boq.retention_amount_total = boq.total * (boq.retention_rate / 100)
+    
+    @api.depends('advanced_payment_amount_original', 'advanced_payment_amount_variation',
+                 'advance_recovered_original', 'advance_recovered_variation')
     def _compute_outstanding_advances(self):
         for boq in self:
-            # Calculate how much advance payment is still outstanding
-            # This would need to be calculated based on recovery in payment certificates
-            boq.outstanding_advanced_payment_original = boq.advanced_payment_amount_original
-            boq.outstanding_advanced_payment_variation = boq.advanced_payment_amount_variation
+            # Recovered totals are kept current by the advance ledger
+            boq.outstanding_advanced_payment_original = boq.advanced_payment_amount_original - boq.advance_recovered_original
+            boq.outstanding_advanced_payment_variation = boq.advanced_payment_amount_variation - boq.advance_recovered_variation
     
+    @api.depends('payment_certificate_ids', 'variation_ids')
     def _compute_counts(self):
+        # One grouped count per model for the whole batch
+        domain = [('boq_id', 'in', self._origin.ids)]
+        certificate_counts = dict(self.env['boq.payment.certificate']._read_group(domain, ['boq_id'], ['__count']))
+        variation_counts = dict(self.env['boq.variation']._read_group(domain, ['boq_id'], ['__count']))
         for boq in self:
-            boq.payment_certificate_count = len(boq.payment_certificate_ids)
-            boq.variation_count = len(boq.variation_ids)
+            boq.payment_certificate_count = certificate_counts.get(boq._origin, 0)
+            boq.variation_count = variation_counts.get(boq._origin, 0)
     
     def action_set_margin(self):
         """Open wizard to set margin to all lines"""
@@ -302,6 +1019,17 @@ class BoqProject(models.Model):
             'context': {'default_boq_id': self.id}
         }
     
+    def action_import_lines(self):
+        """Open wizard to import activity lines from a file"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Import Lines',
+            'res_model': 'boq.import.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_boq_id': self.id}
+        }
+    
     def action_submit(self):
         """Submit BOQ and create Sales Order"""
         self.ensure_one()
@@ -405,26 +1133,27 @@ class BoqProject(models.Model):
         """Create payment certificate from current progress"""
         self.ensure_one()
         
-        # Get all subactivities with current progress
-        lines_to_invoice = []
-        for activity in self.activity_line_ids:
-            for sub in activity.subactivity_ids:
-                if sub.current_qty > 0:
-                    lines_to_invoice.append((0, 0, {
-                        'subactivity_id': sub.id,
-                        'completion_percent': (sub.current_qty / sub.master_qty) * 100 if sub.master_qty else 0,
-                        'qty_completed': sub.current_qty,
-                        'amount_completed': sub.current_qty * sub.unit_price,
-                    }))
+        # Fetch only the subactivities with current progress, in one read
+        progress = self.env['boq.subactivity'].search_read(
+            [('boq_id', '=', self.id), ('current_qty', '>', 0)],
+            ['current_qty', 'master_qty', 'unit_price'],
+            order='activity_id, sequence, id',
+        )
         
-        if not lines_to_invoice:
+        if not progress:
             raise UserError(_("No progress to invoice!"))
         
-        # Create certificate
+        # Create certificate, then all its lines in one batch
         certificate = self.env['boq.payment.certificate'].create({
             'boq_id': self.id,
-            'line_ids': lines_to_invoice,
         })
+        self.env['boq.payment.certificate.line'].create([{
+            'certificate_id': certificate.id,
+            'subactivity_id': sub['id'],
+            'completion_percent': (sub['current_qty'] / sub['master_qty']) * 100 if sub['master_qty'] else 0,
+            'qty_completed': sub['current_qty'],
+            'amount_completed': sub['current_qty'] * sub['unit_price'],
+        } for sub in progress])
         
         return {
             'type': 'ir.actions.act_window',
@@ -458,6 +1187,26 @@ class BoqProject(models.Model):
             'context': {'default_boq_id': self.id}
         }
     
+    def action_view_advance_ledger(self):
+        """View advance payments and recoveries"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Advance Ledger',
+            'res_model': 'boq.advance.ledger',
+            'view_mode': 'list',
+            'domain': [('boq_id', '=', self.id)],
+        }
+    
+    def action_view_cost_breakdown(self):
+        """View additional costs by activity and cost type"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': 'Cost Breakdown',
+            'res_model': 'boq.cost.cube',
+            'view_mode': 'pivot,list',
+            'domain': [('boq_id', '=', self.id)],
+        }
+    
     def action_view_variations(self):
         """View variations"""
         return {
@@ -469,6 +1218,110 @@ class BoqProject(models.Model):
             'context': {'default_boq_id': self.id}
         }
     
+    def action_export_boq(self):
+        """Download the activity tree as an XLSX workbook"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/boq/export/{self.id}?file_format=xlsx',
+            'target': 'self',
+        }
+    
+    def _export_tree(self, fileobj, file_format='xlsx', chunk_size=2000):
+        """Write the activity -> sub-activity -> additional cost tree to
+        ``fileobj`` and return the file name.
+
+        Rows are read through a server-side SQL cursor, ``chunk_size`` at a
+        time, and written incrementally (XLSX in constant memory mode), so
+        memory does not grow with the size of the BOQ. The columns can be
+        imported back with the Import Lines wizard. The access rights and
+        record rules of the activities, sub-activities and additional costs
+        apply to the rows, as they would to an ORM read.
+        """
+        self.ensure_one()
+        self.check_access('read')
+        Activity = self.env['boq.activity']
+        Subactivity = self.env['boq.subactivity']
+        Cost = self.env['boq.subactivity.cost']
+        for Model in (Activity, Subactivity, Cost):
+            Model.check_access('read')
+        if file_format == 'xlsx' and xlsxwriter is None:
+            raise UserError(_('The xlsxwriter library is required to export XLSX files.'))
+        self._flush_rollups()
+        Subactivity.flush_model()
+        Cost.flush_model()
+        write_row, close = self._export_writer(fileobj, file_format)
+        write_row(EXPORT_HEADER)
+        lang = self.env.lang or 'en_US'
+        cr = self.env.cr
+        # Several exports may run in the same transaction
+        cursor_name = SQL.identifier(f'boq_export_{next(EXPORT_CURSOR_IDS)}')
+        cr.execute(SQL("""
+            DECLARE %s NO SCROLL CURSOR FOR
+            SELECT act.id, act.name, act.total_cumulative,
+                   sub.id, COALESCE(pp.default_code, pt.name->>%s, pt.name->>'en_US'),
+                   sub.description, sub.activity_type,
+                   COALESCE(uom.name->>%s, uom.name->>'en_US'),
+                   sub.master_qty, sub.previous_qty, sub.current_qty, sub.product_cost,
+                   sub.total_cost, sub.margin_percent, sub.unit_price, sub.total_cumulative,
+                   cost.name, cost.cost
+              FROM boq_activity act
+         LEFT JOIN boq_subactivity sub ON sub.activity_id = act.id AND sub.id IN %s
+         LEFT JOIN product_product pp ON pp.id = sub.product_id
+         LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         LEFT JOIN uom_uom uom ON uom.id = pt.uom_id
+         LEFT JOIN boq_subactivity_cost cost ON cost.subactivity_id = sub.id AND cost.id IN %s
+             WHERE act.id IN %s
+          ORDER BY act.sequence, act.id, sub.sequence, sub.id, cost.id
+        """,
+            cursor_name, lang, lang,
+            # Record rules, as subqueries
+            Subactivity._search([('boq_id', '=', self.id)]).subselect(),
+            Cost._search([('subactivity_id.boq_id', '=', self.id)]).subselect(),
+            Activity._search([('boq_id', '=', self.id)]).subselect(),
+        ))
+        try:
+            last_activity_id = last_sub_id = None
+            while True:
+                cr.execute(SQL("FETCH FORWARD %s FROM %s", chunk_size, cursor_name))
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    (activity_id, activity_name, activity_total, sub_id, product, description,
+                     activity_type, uom, master_qty, previous_qty, current_qty, product_cost,
+                     total_cost, margin, unit_price, total, cost_name, cost) = row
+                    if activity_id != last_activity_id:
+                        last_activity_id, last_sub_id = activity_id, None
+                        write_row(['activity', activity_name] + [None] * 11 + [activity_total, None, None])
+                    if sub_id and sub_id != last_sub_id:
+                        last_sub_id = sub_id
+                        write_row([
+                            'subactivity', activity_name, product, description, activity_type, uom,
+                            master_qty, previous_qty, current_qty, product_cost, total_cost,
+                            margin, unit_price, total, None, None,
+                        ])
+                    if cost_name is not None:
+                        write_row(['cost', activity_name] + [None] * 12 + [cost_name, cost])
+        finally:
+            cr.execute(SQL("CLOSE %s", cursor_name))
+            close()
+        return f'{self.name}.{file_format}'
+
+    def _export_writer(self, fileobj, file_format):
+        """Return ``(write_row, close)`` callables writing rows to ``fileobj``."""
+        if file_format == 'xlsx':
+            workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+            sheet = workbook.add_worksheet('BOQ')
+            row_numbers = itertools.count()
+
+            def write_row(values):
+                sheet.write_row(next(row_numbers), 0, values)
+
+            return write_row, workbook.close
+        stream = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=True)
+        return csv.writer(stream).writerow, stream.detach
+    
     @api.constrains('start_date', 'end_date')
     def _check_dates(self):
         for boq in self:
@@ -0,0 +1,232 @@
+from datetime import timedelta
+import logging
+
+from odoo import api, fields, models, _
+from odoo.exceptions import AccessError
+from odoo.tools import SQL
+from odoo.tools.sql import create_unique_index, index_exists
+
+_logger = logging.getLogger(__name__)
+
+# Last refresh of the P&L table, in UTC
+PNL_WATERMARK_PARAM = 'boq.pnl_watermark'
+# Changes committed by transactions still running at the last refresh may
+# carry an older write date, so that much history is scanned again
+PNL_WATERMARK_OVERLAP = timedelta(minutes=10)
+# Last full rebuild of the P&L table, in UTC
+PNL_FULL_REFRESH_PARAM = 'boq.pnl_full_refresh'
+# Deleted source rows and rows moved to another BOQ leave no write date
+# behind: the cron rebuilds the whole table that often to pick them up
+PNL_FULL_REFRESH_INTERVAL = timedelta(days=1)
+
+# BOQs with a P&L source row written since %(since)s; the analytic lines
+# are only scanned on the accounts of the BOQs, through their account index
+PNL_CHANGED_QUERY = """
+    SELECT boq_id FROM boq_payment_certificate WHERE write_date >= %(since)s
+     UNION
+    SELECT cert.boq_id
+      FROM boq_payment_certificate cert
+      JOIN account_move move ON move.id = cert.invoice_id
+     WHERE move.write_date >= %(since)s
+     UNION
+    SELECT source_boq_id FROM purchase_order
+     WHERE source_boq_id IS NOT NULL AND write_date >= %(since)s
+     UNION
+    SELECT boq.id
+      FROM boq_project boq
+     WHERE EXISTS (SELECT 1 FROM account_analytic_line aal
+                    WHERE aal.account_id = boq.analytic_account_id
+                      AND aal.write_date >= %(since)s)
+     UNION
+    SELECT id FROM boq_project WHERE write_date >= %(since)s
+"""
+
+# All amounts in the currency of the company of the BOQ: the approved
+# amounts are converted at the rate of the certificate date, the purchase
+# orders at their own rate, and the signed invoice and analytic amounts
+# already are in company currency
+PNL_REFRESH_QUERY = """
+    INSERT INTO boq_project_pnl (boq_id, period, company_id,
+                                 certified_amount, invoiced_amount, committed_cost, actual_cost,
+                                 margin, margin_percent,
+                                 create_uid, create_date, write_uid, write_date)
+    SELECT facts.boq_id, facts.period, boq.company_id,
+           SUM(facts.certified), SUM(facts.invoiced), SUM(facts.committed), SUM(facts.actual),
+           SUM(facts.certified) - SUM(facts.actual),
+           CASE WHEN SUM(facts.certified) != 0
+                THEN (SUM(facts.certified) - SUM(facts.actual)) / SUM(facts.certified) * 100
+                ELSE 0 END,
+           %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+      FROM (
+            SELECT cert.boq_id, date_trunc('month', cert.certificate_date)::date AS period,
+                   CASE WHEN cert_boq.currency_id = company.currency_id
+                        THEN COALESCE(cert.amount_approved, 0)
+                        ELSE COALESCE(cert.amount_approved, 0) * COALESCE(company_rate.rate, 1)
+                             / COALESCE(boq_rate.rate, 1) END AS certified,
+                   0 AS invoiced, 0 AS committed, 0 AS actual
+              FROM boq_payment_certificate cert
+              JOIN boq_project cert_boq ON cert_boq.id = cert.boq_id
+              JOIN res_company company ON company.id = cert_boq.company_id
+         LEFT JOIN LATERAL (
+                SELECT rate FROM res_currency_rate
+                 WHERE currency_id = cert_boq.currency_id AND name <= cert.certificate_date
+                   AND (company_id IS NULL OR company_id = company.id)
+              ORDER BY name DESC, company_id NULLS LAST
+                 LIMIT 1
+               ) boq_rate ON TRUE
+         LEFT JOIN LATERAL (
+                SELECT rate FROM res_currency_rate
+                 WHERE currency_id = company.currency_id AND name <= cert.certificate_date
+                   AND (company_id IS NULL OR company_id = company.id)
+              ORDER BY name DESC, company_id NULLS LAST
+                 LIMIT 1
+               ) company_rate ON TRUE
+             WHERE cert.state != 'draft' AND cert.certificate_date IS NOT NULL
+             UNION ALL
+            SELECT cert.boq_id, date_trunc('month', move.invoice_date)::date,
+                   0, COALESCE(move.amount_untaxed_signed, 0), 0, 0
+              FROM boq_payment_certificate cert
+              JOIN account_move move ON move.id = cert.invoice_id
+             WHERE move.state = 'posted' AND move.invoice_date IS NOT NULL
+             UNION ALL
+            SELECT po.source_boq_id, date_trunc('month', COALESCE(po.date_approve, po.date_order))::date,
+                   0, 0, COALESCE(po.amount_untaxed / NULLIF(po.currency_rate, 0), 0), 0
+              FROM purchase_order po
+             WHERE po.source_boq_id IS NOT NULL AND po.state IN ('purchase', 'done')
+             UNION ALL
+            SELECT boq.id, date_trunc('month', aal.date)::date, 0, 0, 0, -aal.amount
+              FROM account_analytic_line aal
+              JOIN boq_project boq ON boq.analytic_account_id = aal.account_id
+             WHERE aal.amount < 0
+           ) facts
+      JOIN boq_project boq ON boq.id = facts.boq_id
+     WHERE %(all)s OR facts.boq_id = ANY(%(boq_ids)s)
+  GROUP BY facts.boq_id, facts.period, boq.company_id
+"""
+
+
+class BoqProjectPnl(models.Model):
+    """Profit and loss of the BOQs per month, materialized in a table.
+
+    The rows are rebuilt by :meth:`_refresh` from the certificates, their
+    invoices, the confirmed subcontract purchase orders and the costs
+    posted on the analytic account of the BOQ, in company currency. The
+    cron only rebuilds the BOQs with a source row written since the last
+    refresh, and the whole table once a day, which picks up the rows
+    deleted from the sources or moved to another BOQ.
+    """
+    _name = 'boq.project.pnl'
+    _description = 'BOQ Project P&L'
+    _order = 'period desc, boq_id'
+    _rec_name = 'boq_id'
+
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    period = fields.Date('Period', required=True, readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    currency_id = fields.Many2one(related='company_id.currency_id')
+
+    certified_amount = fields.Monetary(
+        'Certified',
+        readonly=True,
+        help="Work approved on the submitted certificates of the period"
+    )
+    invoiced_amount = fields.Monetary(
+        'Invoiced',
+        readonly=True,
+        help="Untaxed amount of the posted certificate invoices"
+    )
+    committed_cost = fields.Monetary(
+        'Committed Cost',
+        readonly=True,
+        help="Untaxed amount of the confirmed subcontract purchase orders"
+    )
+    actual_cost = fields.Monetary(
+        'Actual Cost',
+        readonly=True,
+        help="Costs posted on the analytic account of the BOQ"
+    )
+    margin = fields.Monetary(
+        'Margin',
+        readonly=True,
+        help="Certified amount minus actual cost"
+    )
+    margin_percent = fields.Float(
+        'Margin %',
+        digits=(5, 2),
+        readonly=True,
+        aggregator=False,
+        help="Margin over certified amount; for groups, computed from their sums"
+    )
+
+    def init(self):
+        if not index_exists(self.env.cr, 'boq_project_pnl_boq_id_period_index'):
+            create_unique_index(self.env.cr, 'boq_project_pnl_boq_id_period_index', self._table, ['boq_id', 'period'])
+        # Dropped: the module does not own the analytic line table
+        self.env.cr.execute("DROP INDEX IF EXISTS boq_account_analytic_line_write_date_index")
+
+    def _read_group_select(self, aggregate_spec, query):
+        # The margin % of a group is its summed margin over its summed
+        # certified amount, not an aggregate of the monthly percentages
+        if aggregate_spec.split(':')[0] == 'margin_percent':
+            return SQL(
+                "COALESCE(SUM(%s) / NULLIF(SUM(%s), 0) * 100, 0)",
+                self._field_to_sql(self._table, 'margin', query),
+                self._field_to_sql(self._table, 'certified_amount', query),
+            )
+        return super()._read_group_select(aggregate_spec, query)
+
+    @api.model
+    def _refresh(self, boqs=None):
+        """Rebuild the P&L rows of ``boqs``, or of every BOQ when ``None``."""
+        self.env.flush_all()
+        boq_ids = [] if boqs is None else boqs.ids
+        if boqs is None:
+            self.env.cr.execute("DELETE FROM boq_project_pnl")
+        else:
+            self.env.cr.execute("DELETE FROM boq_project_pnl WHERE boq_id = ANY(%s)", [boq_ids])
+        self.env.cr.execute(PNL_REFRESH_QUERY, {
+            'uid': self.env.uid,
+            'all': boqs is None,
+            'boq_ids': boq_ids,
+        })
+        self.invalidate_model()
+
+    @api.model
+    def _cron_refresh(self):
+        """Rebuild the P&L of the BOQs changed since the last refresh, or
+        the whole P&L when the last full rebuild is older than a day."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        self.env.cr.execute("SELECT NOW() AT TIME ZONE 'UTC'")
+        now = self.env.cr.fetchone()[0]
+        watermark = ICP.get_param(PNL_WATERMARK_PARAM)
+        full_refresh = ICP.get_param(PNL_FULL_REFRESH_PARAM)
+        if watermark and full_refresh and fields.Datetime.to_datetime(full_refresh) > now - PNL_FULL_REFRESH_INTERVAL:
+            self.env.cr.execute(PNL_CHANGED_QUERY, {
+                'since': fields.Datetime.to_datetime(watermark) - PNL_WATERMARK_OVERLAP,
+            })
+            boqs = self.env['boq.project'].browse([row[0] for row in self.env.cr.fetchall()])
+            if boqs:
+                self._refresh(boqs)
+        else:
+            boqs = None
+            self._refresh()
+            ICP.set_param(PNL_FULL_REFRESH_PARAM, fields.Datetime.to_string(now))
+        ICP.set_param(PNL_WATERMARK_PARAM, fields.Datetime.to_string(now))
+        _logger.info("BOQ P&L refreshed for %s BOQs", 'all' if boqs is None else len(boqs))
+
+    @api.model
+    def action_refresh(self):
+        """Rebuild the whole P&L table"""
+        if not self.env.user.has_group('boq.group_boq_manager'):
+            raise AccessError(_('Only BOQ managers can refresh the project P&L.'))
+        self._refresh()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
@@ -0,0 +1,249 @@
+from collections import defaultdict
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index, index_exists
+
+# Ledger column and cumulative columns for each level that can be queried
+LEDGER_LEVELS = {
+    'boq.subactivity': ('subactivity_id', 'cumulative_qty', 'cumulative_amount'),
+    'boq.activity': ('activity_id', None, 'activity_cumulative_amount'),
+    'boq.project': ('boq_id', None, 'boq_cumulative_amount'),
+}
+
+
+class BoqQuantityLedger(models.Model):
+    _name = 'boq.quantity.ledger'
+    _description = 'BOQ Quantity Ledger'
+    _order = 'id desc'
+    _rec_name = 'subactivity_id'
+
+    subactivity_id = fields.Many2one(
+        'boq.subactivity',
+        string='Sub-Activity',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    activity_id = fields.Many2one(
+        'boq.activity',
+        string='Activity',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    certificate_id = fields.Many2one(
+        'boq.payment.certificate',
+        string='Certificate',
+        readonly=True,
+        index=True,
+        ondelete='set null'
+    )
+    date = fields.Date(
+        'Date',
+        required=True,
+        readonly=True,
+        help="Date of the certificate"
+    )
+
+    # Movement
+    qty = fields.Float('Quantity', digits=(12, 2), readonly=True)
+    unit_price = fields.Float('Unit Price', readonly=True)
+    amount = fields.Monetary('Amount', readonly=True)
+
+    # Running totals after this entry
+    cumulative_qty = fields.Float(
+        'Cumulative Quantity',
+        digits=(12, 2),
+        readonly=True
+    )
+    cumulative_amount = fields.Monetary('Cumulative Amount', readonly=True)
+    activity_cumulative_amount = fields.Monetary('Activity Cumulative Amount', readonly=True)
+    boq_cumulative_amount = fields.Monetary('BOQ Cumulative Amount', readonly=True)
+
+    currency_id = fields.Many2one(related='boq_id.currency_id')
+    company_id = fields.Many2one(related='boq_id.company_id', store=True)
+
+    def init(self):
+        # One (level, date, id) index per level: as-of queries are a single
+        # backward index scan returning the latest entry
+        for column, _qty_column, _amount_column in LEDGER_LEVELS.values():
+            indexname = f'boq_quantity_ledger_{column}_date_index'
+            if not index_exists(self.env.cr, indexname):
+                create_index(self.env.cr, indexname, self._table, [column, 'date', 'id'])
+
+    def write(self, vals):
+        raise UserError(_('Quantity ledger entries cannot be modified.'))
+
+    def unlink(self):
+        raise UserError(_('Quantity ledger entries cannot be deleted.'))
+
+    @api.model
+    def _record_transfers(self, transfers):
+        """Append one entry per certificate and subactivity billed.
+
+        ``transfers`` is a list of ``(certificate, subactivity, qty)`` with
+        the quantity moved to the previous quantity of the subactivity; it
+        must be recorded before the move is applied. Entries are dated on
+        their certificate and written with ``sudo()``: users only read the
+        ledger.
+        Running totals follow the date order: an entry continues from the
+        latest entry dated on or before it, and the totals of the entries
+        dated after it are restated. Subactivities, activities and BOQs
+        without an earlier entry start from their billed quantities and
+        amounts before the ledger.
+        """
+        if not transfers:
+            return self.browse()
+        boqs = self.env['boq.subactivity'].concat(*(sub for _cert, sub, _qty in transfers)).boq_id
+        # Serialize the running totals of concurrent submissions
+        self.env.cr.execute("SELECT id FROM boq_project WHERE id IN %s FOR UPDATE", [tuple(boqs.ids)])
+        transfers_by_date = defaultdict(list)
+        for transfer in transfers:
+            transfers_by_date[transfer[0].certificate_date].append(transfer)
+        entries = self.browse()
+        for date in sorted(transfers_by_date):
+            entries |= self._record_dated_transfers(date, transfers_by_date[date])
+        return entries
+
+    @api.model
+    def _record_dated_transfers(self, date, transfers):
+        """Record the ``transfers`` of certificates dated ``date``, then
+        restate the running totals of the entries dated after it."""
+        subactivities = self.env['boq.subactivity'].concat(*(sub for _cert, sub, _qty in transfers))
+        sub_totals = self._get_opening_cumulative(subactivities, date)
+        activity_totals = self._get_opening_cumulative(subactivities.activity_id, date)
+        boq_totals = self._get_opening_cumulative(subactivities.boq_id, date)
+        vals_list = []
+        for certificate, sub, qty in transfers:
+            amount = qty * sub.unit_price
+            cumulative_qty, cumulative_amount = sub_totals[sub.id]
+            activity_amount = activity_totals[sub.activity_id.id][1]
+            boq_amount = boq_totals[sub.boq_id.id][1]
+            sub_totals[sub.id] = (cumulative_qty + qty, cumulative_amount + amount)
+            activity_totals[sub.activity_id.id] = (None, activity_amount + amount)
+            boq_totals[sub.boq_id.id] = (None, boq_amount + amount)
+            vals_list.append({
+                'subactivity_id': sub.id,
+                'activity_id': sub.activity_id.id,
+                'boq_id': sub.boq_id.id,
+                'certificate_id': certificate.id,
+                'date': date,
+                'qty': qty,
+                'unit_price': sub.unit_price,
+                'amount': amount,
+                'cumulative_qty': cumulative_qty + qty,
+                'cumulative_amount': cumulative_amount + amount,
+                'activity_cumulative_amount': activity_amount + amount,
+                'boq_cumulative_amount': boq_amount + amount,
+            })
+        entries = self.sudo().create(vals_list).sudo(False)
+        self.flush_model()
+        first_id = min(entries.ids)
+        for column, qty_column, amount_column in LEDGER_LEVELS.values():
+            movements = defaultdict(lambda: [0.0, 0.0])
+            for vals in vals_list:
+                movements[vals[column]][0] += vals['qty']
+                movements[vals[column]][1] += vals['amount']
+            record_ids = list(movements)
+            # Entries cannot be written through the ORM
+            self.env.cr.execute(f"""
+                UPDATE boq_quantity_ledger entry
+                   SET {f'{qty_column} = entry.{qty_column} + movement.qty,' if qty_column else ''}
+                       {amount_column} = entry.{amount_column} + movement.amount
+                  FROM unnest(%s::int[], %s::numeric[], %s::numeric[]) AS movement(record_id, qty, amount)
+                 WHERE entry.{column} = movement.record_id
+                   AND entry.date > %s
+                   AND entry.id < %s
+            """, [
+                record_ids,
+                [movements[record_id][0] for record_id in record_ids],
+                [movements[record_id][1] for record_id in record_ids],
+                date,
+                first_id,
+            ])
+        self.invalidate_model()
+        return entries
+
+    @api.model
+    def _get_opening_cumulative(self, records, date):
+        """Return ``{record id: (cumulative qty, cumulative amount)}`` of
+        ``records`` before an entry dated ``date`` is appended.
+
+        That is the latest entry dated on or before ``date``, or else the
+        total before the first entry of the record, or else its current
+        billed total when it has no entry at all.
+        """
+        totals = self._get_cumulative(records, date=date)
+        missing = [record_id for record_id, values in totals.items() if values is None]
+        if missing:
+            column, qty_column, amount_column = LEDGER_LEVELS[records._name]
+            self.env.cr.execute(f"""
+                SELECT rec.id, entry.qty, entry.amount
+                  FROM unnest(%s::int[]) AS rec(id)
+                  JOIN LATERAL (
+                    SELECT {f'{qty_column} - qty' if qty_column else 'NULL'} AS qty,
+                           {amount_column} - amount AS amount
+                      FROM boq_quantity_ledger
+                     WHERE {column} = rec.id
+                  ORDER BY date, id
+                     LIMIT 1
+                   ) entry ON TRUE
+            """, [missing])
+            for record_id, qty, amount in self.env.cr.fetchall():
+                totals[record_id] = (qty if qty is None else float(qty), float(amount))
+        for record in records:
+            if totals[record.id] is None:
+                qty = record.previous_qty if records._name == 'boq.subactivity' else None
+                totals[record.id] = (qty, record.total_previous)
+        return totals
+
+    @api.model
+    def _get_cumulative(self, records, date=None, certificate=None):
+        """Return the billed cumulative quantity and amount of ``records``.
+
+        ``records`` are subactivities, activities or BOQs. The values are
+        those as of ``date`` (included) or as of the last entry of
+        ``certificate`` in date order, or the latest ones when neither is given. Returns
+        ``{record id: (qty, amount)}``, with ``None`` for records without
+        entries at that point; the quantity is ``None`` above the
+        subactivity level. Each record costs one index lookup.
+        """
+        column, qty_column, amount_column = LEDGER_LEVELS[records._name]
+        if not records:
+            return {}
+        self.flush_model()
+        bound_date, bound_id = date or '9999-12-31', 2 ** 31 - 1
+        if certificate:
+            self.env.cr.execute("""
+                SELECT MAX(date), MAX(id) FROM boq_quantity_ledger
+                 WHERE certificate_id = %s
+            """, [certificate.id])
+            bound_date, bound_id = self.env.cr.fetchone()
+            if not bound_id:
+                return dict.fromkeys(records.ids)
+        self.env.cr.execute(f"""
+            SELECT rec.id, entry.qty, entry.amount
+              FROM unnest(%s::int[]) AS rec(id)
+         LEFT JOIN LATERAL (
+                SELECT {qty_column or 'NULL'} AS qty, {amount_column} AS amount
+                  FROM boq_quantity_ledger
+                 WHERE {column} = rec.id
+                   AND (date, id) <= (%s::date, %s)
+              ORDER BY date DESC, id DESC
+                 LIMIT 1
+               ) entry ON TRUE
+        """, [records.ids, bound_date, bound_id])
+        return {
+            record_id: None if amount is None else (
+                qty if qty is None else float(qty), float(amount)
+            )
+            for record_id, qty, amount in self.env.cr.fetchall()
+        }
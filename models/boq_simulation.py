@@ -0,0 +1,153 @@
+from array import array
+import copy
+
+from .boq_activity import progress_percents
+
+# Sub-activity columns loaded by the simulation, in query order
+SIMULATION_QUERY = """
+    SELECT id,
+           activity_id,
+           COALESCE(master_qty, 0),
+           COALESCE(previous_qty, 0),
+           COALESCE(current_qty, 0),
+           COALESCE(product_cost, 0),
+           COALESCE(total_cost, 0) - COALESCE(product_cost, 0),
+           COALESCE(margin_percent, 0)
+      FROM boq_subactivity
+     WHERE boq_id = %s
+  ORDER BY id
+"""
+
+
+class BoqSimulation:
+    """Pricing columns of one BOQ held in compact arrays.
+
+    Changes are applied to the arrays only, so variations can be evaluated
+    without any write; ``copy()`` gives an independent simulation to try
+    several variations on the same loaded BOQ.
+    """
+
+    def __init__(self, boq):
+        env = boq.env
+        env['boq.subactivity'].flush_model([
+            'activity_id', 'boq_id', 'master_qty', 'previous_qty', 'current_qty',
+            'product_cost', 'total_cost', 'margin_percent',
+        ])
+        env['boq.activity'].flush_model(['boq_id', 'name', 'sequence'])
+        self.retention_rate = boq.retention_rate
+        env.cr.execute(
+            "SELECT id, name FROM boq_activity WHERE boq_id = %s ORDER BY sequence, id",
+            [boq.id],
+        )
+        # Activities are addressed by position; new ones have no id
+        self.activity_ids = []
+        self.activity_names = []
+        for activity_id, name in env.cr.fetchall():
+            self.activity_ids.append(activity_id)
+            self.activity_names.append(name)
+        self.activity_index = {activity_id: i for i, activity_id in enumerate(self.activity_ids)}
+
+        self.sub_index = {}
+        self.activity = array('l')
+        self.master_qty = array('d')
+        self.previous_qty = array('d')
+        self.current_qty = array('d')
+        self.product_cost = array('d')
+        self.additional_cost = array('d')
+        self.margin_percent = array('d')
+        env.cr.execute(SIMULATION_QUERY, [boq.id])
+        for sub_id, activity_id, master, previous, current, cost, additional, margin in env.cr.fetchall():
+            self.sub_index[sub_id] = len(self.activity)
+            self.activity.append(self.activity_index[activity_id])
+            self.master_qty.append(master)
+            self.previous_qty.append(previous)
+            self.current_qty.append(current)
+            self.product_cost.append(cost)
+            self.additional_cost.append(additional)
+            self.margin_percent.append(margin)
+
+    def copy(self):
+        simulation = copy.copy(self)
+        for name in ('activity', 'master_qty', 'previous_qty', 'current_qty',
+                     'product_cost', 'additional_cost', 'margin_percent'):
+            column = getattr(self, name)
+            setattr(simulation, name, array(column.typecode, column))
+        simulation.activity_ids = list(self.activity_ids)
+        simulation.activity_names = list(self.activity_names)
+        simulation.activity_index = dict(self.activity_index)
+        simulation.sub_index = dict(self.sub_index)
+        return simulation
+
+    def apply_variation(self, variation):
+        """Apply the edit, add and new activity lines of ``variation`` the
+        same way ``boq.variation.action_apply_variation`` does."""
+        for line in variation.edit_line_ids:
+            pos = self.sub_index.get(line.target_subactivity_id.id)
+            if pos is None:
+                continue
+            if line.new_qty:
+                self.master_qty[pos] = line.new_qty
+            if line.new_cost:
+                self.product_cost[pos] = line.new_cost
+            if line.new_margin:
+                self.margin_percent[pos] = line.new_margin
+        for line in variation.add_line_ids:
+            if line.product_id and line.target_activity_id.id in self.activity_index:
+                self._add_subactivity(self.activity_index[line.target_activity_id.id], line)
+        for line in variation.new_activity_line_ids:
+            if line.activity_name and line.product_id:
+                self.activity_ids.append(False)
+                self.activity_names.append(line.activity_name)
+                self._add_subactivity(len(self.activity_ids) - 1, line)
+
+    def _add_subactivity(self, activity_pos, line):
+        self.activity.append(activity_pos)
+        self.master_qty.append(line.new_qty)
+        self.previous_qty.append(0.0)
+        self.current_qty.append(0.0)
+        self.product_cost.append(line.new_cost)
+        self.additional_cost.append(0.0)
+        self.margin_percent.append(line.new_margin)
+
+    def rollups(self):
+        """Return the activity and BOQ totals, progress and retention,
+        computed like the stored rollups."""
+        count = len(self.activity_ids)
+        totals = [[0.0] * 6 for _i in range(count)]
+        for pos, activity_pos in enumerate(self.activity):
+            unit_price = (self.product_cost[pos] + self.additional_cost[pos]) * (1 + self.margin_percent[pos] / 100)
+            row = totals[activity_pos]
+            row[0] += self.previous_qty[pos] * unit_price
+            row[1] += self.current_qty[pos] * unit_price
+            row[2] += self.master_qty[pos] * unit_price
+            row[3] += self.master_qty[pos]
+            row[4] += self.previous_qty[pos]
+            row[5] += self.current_qty[pos]
+
+        activities = []
+        total_previous = total_current = total = weighted_billed = weighted_onsite = 0.0
+        for i, (previous, current, cumulative, master_qty, previous_qty, current_qty) in enumerate(totals):
+            billed, onsite = progress_percents(master_qty, previous_qty, current_qty)
+            activities.append({
+                'id': self.activity_ids[i],
+                'name': self.activity_names[i],
+                'total_previous': previous,
+                'total_current': current,
+                'total_cumulative': cumulative,
+                'billed_progress_percent': billed,
+                'onsite_progress_percent': onsite,
+            })
+            total_previous += previous
+            total_current += current
+            total += cumulative
+            weighted_billed += billed * cumulative / 100
+            weighted_onsite += onsite * cumulative / 100
+        return {
+            'total_previous': total_previous,
+            'total_current': total_current,
+            'total': total,
+            'billed_progress_percent': weighted_billed / total * 100 if total else 0.0,
+            'onsite_progress_percent': weighted_onsite / total * 100 if total else 0.0,
+            'retention_amount_total': total * self.retention_rate / 100,
+            'activities': activities,
+        }
@@ -1,5 +1,14 @@
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index, index_exists
+
+from .boq_cost_cube import CUBE_COST_FIELDS, CUBE_SUBACTIVITY_FIELDS
+
+# Fields whose changes can be propagated to the parent rollups as deltas:
+# they never change the unit price nor the master quantity.
+DELTA_PROPAGATION_FIELDS = {'previous_qty', 'current_qty'}
 
 
 class BoqSubactivity(models.Model):
@@ -19,7 +28,8 @@ class BoqSubactivity(models.Model):
     )
     boq_id = fields.Many2one(
         related='activity_id.boq_id', 
-        store=True
+        store=True,
+        index=True
     )
 
     # Product Details
@@ -131,6 +141,18 @@ class BoqSubactivity(models.Model):
     company_id = fields.Many2one(related='boq_id.company_id', store=True)
     state = fields.Selection(related='boq_id.state')
 
+    def init(self):
+        # Sub-activities with progress to certify, read when creating
+        # payment certificates
+        if not index_exists(self.env.cr, 'boq_subactivity_boq_id_progress_index'):
+            create_index(
+                self.env.cr,
+                'boq_subactivity_boq_id_progress_index',
+                self._table,
+                ['boq_id'],
+                where='current_qty > 0',
+            )
+
     @api.depends('product_id', 'description')
     def _compute_name(self):
         for sub in self:
@@ -172,6 +194,78 @@ class BoqSubactivity(models.Model):
                 sub.billed_progress_percent = 0
                 sub.onsite_progress_percent = 0
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        subs = super().create(vals_list)
+        subs.boq_id._check_job_lock()
+        subs.boq_id._kpi_invalidate()
+        self.env['boq.project']._batch_edit_defer(subs.activity_id)
+        return subs
+
+    def write(self, vals):
+        self.boq_id._check_job_lock()
+        self.boq_id._kpi_invalidate()
+        Cube = self.env['boq.cost.cube']
+        costs = self.additional_cost_ids if CUBE_SUBACTIVITY_FIELDS.intersection(vals) else self.additional_cost_ids.browse()
+        before = Cube._contributions(costs)
+        res = self._write_with_rollups(vals)
+        Cube._apply_contributions(before, Cube._contributions(costs))
+        return res
+
+    def _write_with_rollups(self, vals):
+        Boq = self.env['boq.project']
+        if Boq._batch_edit_active():
+            activities = self.activity_id
+            res = super().write(vals)
+            Boq._batch_edit_defer(activities | self.activity_id)
+            return res
+        if not self._use_delta_propagation(vals):
+            return super().write(vals)
+        self.env['boq.project']._flush_rollups()
+        before = {
+            sub.id: (sub.activity_id.id, sub.previous_qty, sub.current_qty,
+                     sub.total_previous, sub.total_current)
+            for sub in self
+        }
+        res = super().write(vals)
+        deltas = defaultdict(lambda: [0.0, 0.0, 0.0, 0.0])
+        for sub in self:
+            activity_id, previous_qty, current_qty, total_previous, total_current = before[sub.id]
+            delta = deltas[activity_id]
+            delta[0] += sub.previous_qty - previous_qty
+            delta[1] += sub.current_qty - current_qty
+            delta[2] += sub.total_previous - total_previous
+            delta[3] += sub.total_current - total_current
+        self.env['boq.activity'].browse(list(deltas))._apply_rollup_deltas(deltas)
+        return res
+
+    def unlink(self):
+        self.boq_id._check_job_lock()
+        self.boq_id._kpi_invalidate()
+        activities = self.activity_id
+        # The additional costs are deleted by the database cascade
+        Cube = self.env['boq.cost.cube']
+        Cube._apply_contributions(Cube._contributions(self.additional_cost_ids), {})
+        res = super().unlink()
+        self.env['boq.project']._batch_edit_defer(activities.exists())
+        return res
+
+    def _validate_fields(self, field_names, excluded_names=()):
+        if self.env['boq.project']._batch_edit_defer_constraints(self, field_names):
+            return
+        super()._validate_fields(field_names, excluded_names)
+
+    def _use_delta_propagation(self, vals):
+        """Quantity-only writes done with the ``boq_delta_propagation``
+        context adjust the parent rollups by the old/new differences instead
+        of re-summing every sibling sub-activity."""
+        return bool(
+            self.env.context.get('boq_delta_propagation')
+            and vals
+            and set(vals) <= DELTA_PROPAGATION_FIELDS
+            and all(isinstance(record_id, int) for record_id in self._ids)
+        )
+
     def action_view_additional_costs(self):
         """View additional costs in popup"""
         return {
@@ -235,9 +329,58 @@ class BoqSubactivityCost(models.Model):
         ondelete='cascade'
     )
     name = fields.Char('Name', required=True)
+    cost_type_id = fields.Many2one(
+        'boq.cost.type',
+        string='Cost Type',
+        index=True,
+        ondelete='restrict'
+    )
     cost = fields.Float('Cost', digits=(12, 2), required=True)
     description = fields.Text('Description')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        costs = super().create(vals_list)
+        costs.subactivity_id.boq_id._check_job_lock()
+        costs.subactivity_id.boq_id._kpi_invalidate()
+        self.env['boq.project']._batch_edit_defer(costs.subactivity_id.activity_id)
+        Cube = self.env['boq.cost.cube']
+        Cube._apply_contributions({}, Cube._contributions(costs))
+        return costs
+
+    def write(self, vals):
+        self.subactivity_id.boq_id._check_job_lock()
+        self.subactivity_id.boq_id._kpi_invalidate()
+        activities = self.subactivity_id.activity_id
+        Cube = self.env['boq.cost.cube']
+        costs = self if CUBE_COST_FIELDS.intersection(vals) else self.browse()
+        before = Cube._contributions(costs)
+        res = super().write(vals)
+        self.env['boq.project']._batch_edit_defer(activities | self.subactivity_id.activity_id)
+        Cube._apply_contributions(before, Cube._contributions(costs))
+        return res
+
+    def unlink(self):
+        self.subactivity_id.boq_id._check_job_lock()
+        self.subactivity_id.boq_id._kpi_invalidate()
+        activities = self.subactivity_id.activity_id
+        Cube = self.env['boq.cost.cube']
+        Cube._apply_contributions(Cube._contributions(self), {})
+        res = super().unlink()
+        self.env['boq.project']._batch_edit_defer(activities.exists())
+        return res
+
+    def _validate_fields(self, field_names, excluded_names=()):
+        if self.env['boq.project']._batch_edit_defer_constraints(self, field_names):
+            return
+        super()._validate_fields(field_names, excluded_names)
+
+    @api.onchange('cost_type_id')
+    def _onchange_cost_type_id(self):
+        """Name the cost after its type"""
+        if self.cost_type_id and not self.name:
+            self.name = self.cost_type_id.name
+
     @api.constrains('cost')
     def _check_cost(self):
         for cost in self:
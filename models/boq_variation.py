@@ -1,11 +1,19 @@
+from collections import defaultdict
+import logging
+import time
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 
+from .boq_simulation import BoqSimulation
+
+_logger = logging.getLogger(__name__)
+
 
 class BoqVariation(models.Model):
     _name = 'boq.variation'
     _description = 'BOQ Variation Order'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'boq.job.mixin']
     _rec_name = 'name'
     _order = 'create_date desc'
 
@@ -107,12 +115,26 @@ class BoqVariation(models.Model):
     company_id = fields.Many2one(related='boq_id.company_id', store=True)
     customer_id = fields.Many2one(related='boq_id.customer_id')
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """Override create to set sequence"""
-        if vals.get('name', _('New')) == _('New'):
-            vals['name'] = self.env['ir.sequence'].next_by_code('boq.variation') or _('New')
-        return super().create(vals)
+        to_name = [vals for vals in vals_list if vals.get('name', _('New')) == _('New')]
+        names = self.env['ir.sequence']._next_batch_by_code('boq.variation', len(to_name))
+        for vals, name in zip(to_name, names):
+            vals['name'] = name or _('New')
+        records = super().create(vals_list)
+        records.boq_id._kpi_invalidate()
+        return records
+
+    def write(self, vals):
+        boqs = self.boq_id
+        res = super().write(vals)
+        (boqs | self.boq_id)._kpi_invalidate()
+        return res
+
+    def unlink(self):
+        self.boq_id._kpi_invalidate()
+        return super().unlink()
 
     @api.depends('edit_line_ids.variation_amount', 'add_line_ids.new_total_amount', 'new_activity_line_ids.new_total_amount')
     def _compute_variation_totals(self):
@@ -147,70 +169,168 @@ class BoqVariation(models.Model):
         """Apply variation changes to BOQ"""
         self.ensure_one()
         
-        if self.state != 'approved':
-            raise UserError(_('Only approved variations can be applied.'))
-        
-        # Process edit lines - modify existing subactivities
-        for line in self.edit_line_ids:
-            if line.target_subactivity_id:
-                subactivity = line.target_subactivity_id
-                if line.new_qty:
-                    subactivity.master_qty = line.new_qty
-                if line.new_cost:
-                    subactivity.product_cost = line.new_cost
-                if line.new_margin:
-                    subactivity.margin_percent = line.new_margin
-                
-                subactivity.is_variation = True
-                subactivity.source_variation_id = self.id
+        self._check_apply()
         
-        # Process add lines - create new subactivities for existing activities
-        for line in self.add_line_ids:
-            if line.target_activity_id and line.product_id:
-                self.env['boq.subactivity'].create({
-                    'activity_id': line.target_activity_id.id,
-                    'product_id': line.product_id.id,
-                    'description': line.description,
-                    'master_qty': line.new_qty,
-                    'product_cost': line.new_cost,
-                    'margin_percent': line.new_margin,
-                    'activity_type': line.activity_type,
-                    'is_variation': True,
-                    'source_variation_id': self.id,
-                })
-        
-        # Process new activity lines - create new activities with subactivities
-        for line in self.new_activity_line_ids:
-            if line.activity_name and line.product_id:
-                # Create new activity
-                activity = self.env['boq.activity'].create({
-                    'boq_id': self.boq_id.id,
-                    'name': line.activity_name,
-                    'product_id': line.product_id.id,
-                    'description': f'Added by variation {self.name}',
-                })
-                
-                # Create subactivity for the new activity
-                self.env['boq.subactivity'].create({
-                    'activity_id': activity.id,
-                    'product_id': line.product_id.id,
-                    'description': line.description,
-                    'master_qty': line.new_qty,
-                    'product_cost': line.new_cost,
-                    'margin_percent': line.new_margin,
-                    'activity_type': line.activity_type,
-                    'is_variation': True,
-                    'source_variation_id': self.id,
-                })
+        t0 = time.perf_counter()
+        with self.boq_id.batch_edit() as stats:
+            edit_count = self._apply_edit_lines(self.edit_line_ids)
+            t1 = time.perf_counter()
+            add_count = self._apply_add_lines(self.add_line_ids)
+            t2 = time.perf_counter()
+            new_activity_count = self._apply_new_activity_lines(self.new_activity_line_ids)
+            t3 = time.perf_counter()
+        # Leaving the block recomputes the rollups of the touched activities
+        t4 = time.perf_counter()
+        _logger.info(
+            "Applied variation %s: %s edits, %s additions, %s new activities in %.2fs",
+            self.name, edit_count, add_count, new_activity_count, t4 - t0,
+        )
         
         self.state = 'applied'
         
         # Send notification
         self.message_post(
-            body=_('Variation %s has been successfully applied to BOQ %s.') % (self.name, self.boq_id.name),
+            body=_('Variation %s has been successfully applied to BOQ %s.') % (self.name, self.boq_id.name)
+            + ' ' + _(
+                '%(edits)s sub-activities edited, %(additions)s added, %(activities)s new activities '
+                'in %(total).2f s (edits %(edit_time).2f s, additions %(add_time).2f s, '
+                'new activities %(activity_time).2f s, rollups of %(recomputes)s records %(rollup_time).2f s).',
+                edits=edit_count, additions=add_count, activities=new_activity_count,
+                total=t4 - t0, edit_time=t1 - t0, add_time=t2 - t1,
+                activity_time=t3 - t2, rollup_time=t4 - t3,
+                recomputes=stats.get('recomputes', 0),
+            ),
             message_type='notification'
         )
 
+    def simulate(self):
+        """Evaluate the variations in memory, without writing anything.
+
+        Each BOQ is loaded once into a :class:`BoqSimulation` and every
+        variation is applied to its own copy, so pending variations of the
+        same BOQ can be compared side by side. Returns, per variation id,
+        the resulting activity and BOQ totals, progress percentages and
+        retention, with the change of the BOQ total and the elapsed time.
+        """
+        results = {}
+        for boq in self.boq_id:
+            start = time.perf_counter()
+            base = BoqSimulation(boq)
+            for variation in self.filtered(lambda v: v.boq_id == boq):
+                simulation = base.copy()
+                simulation.apply_variation(variation)
+                result = simulation.rollups()
+                result['total_change'] = result['total'] - boq.total
+                result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+                results[variation.id] = result
+                start = time.perf_counter()
+        return results
+
+    def action_apply_variation_async(self):
+        """Apply the variation in a background job"""
+        self.ensure_one()
+        self._check_apply()
+        self.env['boq.job']._enqueue(self, _('Apply variation %s', self.name))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Variation Queued'),
+                'message': _('Variation %s will be applied in the background.', self.name),
+                'type': 'info',
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
+
+    def _check_apply(self):
+        if self.state != 'approved':
+            raise UserError(_('Only approved variations can be applied.'))
+        self._check_job_lock()
+
+    def _job_stages(self):
+        return [
+            ('edits', self.edit_line_ids.sorted('id')),
+            ('additions', self.add_line_ids.sorted('id')),
+            ('new_activities', self.new_activity_line_ids.sorted('id')),
+            ('done', None),
+        ]
+
+    def _job_process(self, stage, lines):
+        if stage == 'done':
+            self.state = 'applied'
+            self.message_post(
+                body=_('Variation %s has been successfully applied to BOQ %s.') % (self.name, self.boq_id.name),
+                message_type='notification'
+            )
+            return
+        with self.boq_id.batch_edit():
+            if stage == 'edits':
+                self._apply_edit_lines(lines)
+            elif stage == 'additions':
+                self._apply_add_lines(lines)
+            else:
+                self._apply_new_activity_lines(lines)
+
+    def _apply_edit_lines(self, lines):
+        """Modify the targeted subactivities, with one write per distinct
+        set of new values. Returns the number of subactivities edited."""
+        changes = defaultdict(dict)
+        for line in lines:
+            if line.target_subactivity_id:
+                vals = changes[line.target_subactivity_id]
+                if line.new_qty:
+                    vals['master_qty'] = line.new_qty
+                if line.new_cost:
+                    vals['product_cost'] = line.new_cost
+                if line.new_margin:
+                    vals['margin_percent'] = line.new_margin
+        groups = defaultdict(lambda: self.env['boq.subactivity'])
+        for subactivity, vals in changes.items():
+            groups[tuple(sorted(vals.items()))] |= subactivity
+        for vals, subactivities in groups.items():
+            subactivities.write(dict(vals, is_variation=True, source_variation_id=self.id))
+        return len(changes)
+
+    def _apply_add_lines(self, lines):
+        """Create the subactivities added to existing activities at once.
+        Returns the number of subactivities created."""
+        vals_list = [
+            self._prepare_subactivity_vals(line, line.target_activity_id)
+            for line in lines
+            if line.target_activity_id and line.product_id
+        ]
+        self.env['boq.subactivity'].create(vals_list)
+        return len(vals_list)
+
+    def _apply_new_activity_lines(self, lines):
+        """Create the new activities, then their subactivities, in two
+        batches. Returns the number of activities created."""
+        lines = lines.filtered(lambda l: l.activity_name and l.product_id)
+        activities = self.env['boq.activity'].create([{
+            'boq_id': self.boq_id.id,
+            'name': line.activity_name,
+            'product_id': line.product_id.id,
+            'description': f'Added by variation {self.name}',
+        } for line in lines])
+        self.env['boq.subactivity'].create([
+            self._prepare_subactivity_vals(line, activity)
+            for line, activity in zip(lines, activities)
+        ])
+        return len(activities)
+
+    def _prepare_subactivity_vals(self, line, activity):
+        return {
+            'activity_id': activity.id,
+            'product_id': line.product_id.id,
+            'description': line.description,
+            'master_qty': line.new_qty,
+            'product_cost': line.new_cost,
+            'margin_percent': line.new_margin,
+            'activity_type': line.activity_type,
+            'is_variation': True,
+            'source_variation_id': self.id,
+        }
+
     @api.constrains('approver_ids')
     def _check_approvers(self):
         for variation in self:
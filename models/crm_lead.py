@@ -12,12 +12,17 @@ class CrmLead(models.Model):
     
     boq_count = fields.Integer(
         'BOQ Count', 
-        compute='_compute_boq_count'
+        compute='_compute_boq_count',
+        store=True
     )
 
+    @api.depends('boq_ids')
     def _compute_boq_count(self):
+        counts = dict(self.env['boq.project']._read_group(
+            [('origin_lead_id', 'in', self._origin.ids)], ['origin_lead_id'], ['__count'],
+        ))
         for lead in self:
-            lead.boq_count = len(lead.boq_ids)
+            lead.boq_count = counts.get(lead._origin, 0)
 
     def action_create_boq(self):
         """Create BOQ from opportunity"""
@@ -0,0 +1,36 @@
+from odoo import api, models
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    @api.model
+    def _next_batch_by_code(self, sequence_code, count):
+        """Return ``count`` values of the sequence ``sequence_code``, picked
+        like ``next_by_code`` does, or as many ``False`` if it is missing."""
+        if count <= 0:
+            return []
+        self.browse().check_access('read')
+        sequence = self.search([
+            ('code', '=', sequence_code),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence:
+            return [False] * count
+        return sequence._next_batch(count)
+
+    def _next_batch(self, count):
+        """Return the next ``count`` values of the sequence.
+
+        Standard sequences reserve the numbers with a single ``nextval``
+        query; no-gap and date-range sequences are drawn one by one.
+        """
+        self.ensure_one()
+        if self.implementation != 'standard' or self.use_date_range:
+            return [self._next() for _i in range(count)]
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            ['ir_sequence_%03d' % self.id, count],
+        )
+        numbers = sorted(number for number, in self.env.cr.fetchall())
+        return [self.get_next_char(number) for number in numbers]
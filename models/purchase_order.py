@@ -48,38 +48,40 @@ class PurchaseOrder(models.Model):
                 })
 
                 # Copy selected activities/subactivities to subcontractor BOQ
-                for activity in order.boq_activity_ids:
-                    # Create corresponding activity in subcontract BOQ
-                    new_activity = self.env['boq.activity'].create({
-                        'boq_id': subcontract_boq.id,
-                        'name': activity.name,
-                        'product_id': activity.product_id.id,
-                        'description': activity.description,
-                        'sequence': activity.sequence,
-                    })
-
-                    # Copy subactivities
-                    for sub in activity.subactivity_ids:
-                        # Find corresponding PO line to get subcontract price
-                        po_line = order.order_line.filtered(
-                            lambda l: l.product_id == sub.product_id
-                        )
-                        unit_cost = po_line[0].price_unit if po_line else sub.product_cost
-
-                        self.env['boq.subactivity'].create({
-                            'activity_id': new_activity.id,
-                            'product_id': sub.product_id.id,
-                            'description': sub.description,
-                            'master_qty': sub.master_qty,
-                            'product_cost': unit_cost,
-                            'activity_type': sub.activity_type,
-                            'margin_percent': 0,  # Usually no margin for subcontracts
-                        })
+                order._copy_activities_to_subcontract(subcontract_boq)
 
                 order.subcontract_boq_id = subcontract_boq
 
         return res
 
+    def _copy_activities_to_subcontract(self, subcontract_boq):
+        """Copy the selected activities and their subactivities into
+        ``subcontract_boq``, priced at the subcontract PO prices.
+
+        Prices are looked up in a product index built once from the order
+        lines, and the tree is copied with the set-based BOQ clone.
+        """
+        self.ensure_one()
+        # First order line of each product gives its subcontract price;
+        # sections and notes have no product
+        unit_costs = {}
+        for line in self.order_line:
+            if line.display_type or not line.product_id:
+                continue
+            unit_costs.setdefault(line.product_id.id, line.price_unit)
+
+        self.source_boq_id._clone_tree_into(
+            subcontract_boq,
+            activities=self.boq_activity_ids,
+            overrides={
+                # Usually no margin for subcontracts
+                'boq.activity': {'margin_percent': 0},
+                'boq.subactivity': {'margin_percent': 0, 'is_variation': False},
+            },
+            product_costs=unit_costs,
+            copy_costs=False,
+        )
+
     def action_view_subcontract_boq(self):
         """View subcontract BOQ"""
         self.ensure_one()
@@ -0,0 +1,16 @@
+from . import test_import
+from . import test_job_lock
+from . import test_quantity_ledger
+from . import test_rollups
+from . import test_clone
+from . import test_retention
+from . import test_project_pnl
+from . import test_certificate
+from . import test_pricing
+from . import test_advance_ledger
+from . import test_export
+from . import test_sql_rollups
+from . import test_boq_project
+from . import test_variation
+from . import test_wizards
+from . import test_cost_cube
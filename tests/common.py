@@ -0,0 +1,26 @@
+from odoo.tests.common import TransactionCase
+
+
+class BoqTestCommon(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.customer = cls.env['res.partner'].create({'name': 'BOQ Test Customer', 'customer_rank': 1})
+        cls.product = cls.env['product.product'].create({
+            'name': 'BOQ Test Product',
+            'default_code': 'BOQ-TEST-1',
+            'standard_price': 10.0,
+        })
+        cls.boq = cls.env['boq.project'].create({'customer_id': cls.customer.id})
+        cls.activity = cls.env['boq.activity'].create({
+            'boq_id': cls.boq.id,
+            'name': 'Test Activity',
+        })
+        cls.subs = cls.env['boq.subactivity'].create([{
+            'activity_id': cls.activity.id,
+            'product_id': cls.product.id,
+            'master_qty': master_qty,
+            'product_cost': 10.0,
+            'margin_percent': 10.0,
+        } for master_qty in (10.0, 20.0)])
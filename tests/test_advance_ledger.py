@@ -0,0 +1,29 @@
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqAdvanceLedger(BoqTestCommon):
+
+    def test_balances(self):
+        Ledger = self.env['boq.advance.ledger']
+        Ledger._record(self.boq, 'original', 'advance', 100.0, date='2024-01-05')
+        Ledger._record(self.boq, 'original', 'recovery', 30.0, date='2024-02-05')
+        entry = Ledger._record(self.boq, 'variation', 'advance', 40.0, date='2024-02-10')
+        self.assertEqual(self.boq.advanced_payment_amount_original, 100.0)
+        self.assertEqual(self.boq.advance_recovered_original, 30.0)
+        self.assertEqual(self.boq.outstanding_advanced_payment_original, 70.0)
+        self.assertEqual(self.boq.outstanding_advanced_payment_variation, 40.0)
+        self.assertEqual(entry.balance_after, 40.0)
+        entries = Ledger.search([('boq_id', '=', self.boq.id), ('line_type', '=', 'original')], order='id')
+        self.assertEqual(entries.mapped('amount'), [100.0, -30.0])
+        self.assertEqual(entries.mapped('balance_after'), [100.0, 70.0])
+
+    def test_totals_only_written_by_ledger(self):
+        with self.assertRaises(UserError):
+            self.boq.write({'advanced_payment_amount_original': 500.0})
+        with self.assertRaises(UserError):
+            self.boq.write({'advance_recovered_variation': 5.0})
+        self.assertFalse(self.boq.copy().advanced_payment_amount_original)
@@ -0,0 +1,60 @@
+from odoo.tests import tagged
+
+from odoo.addons.boq.models.boq_project import KPI_CACHE, KPI_STALE_KEY
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqProject(BoqTestCommon):
+
+    def test_activity_sequences(self):
+        self.assertEqual(self.activity.sequence, 10)
+        activities = self.env['boq.activity'].create([
+            {'boq_id': self.boq.id, 'name': 'Second Activity'},
+            {'boq_id': self.boq.id, 'name': 'Pinned Activity', 'sequence': 5},
+            {'boq_id': self.boq.id, 'name': 'Third Activity'},
+        ])
+        self.assertEqual(activities.mapped('sequence'), [20, 5, 30])
+        # Sequences are counted per BOQ
+        other = self.env['boq.project'].create({'customer_id': self.customer.id})
+        activity = self.env['boq.activity'].create({'boq_id': other.id, 'name': 'First Activity'})
+        self.assertEqual(activity.sequence, 10)
+
+    def test_counts(self):
+        self.assertEqual(self.boq.payment_certificate_count, 0)
+        self.assertEqual(self.boq.variation_count, 0)
+        self.subs.write({'current_qty': 1.0})
+        self.boq.action_create_payment_certificate()
+        self.env['boq.variation'].create({'boq_id': self.boq.id, 'description': 'Test Variation'})
+        self.assertEqual(self.boq.payment_certificate_count, 1)
+        self.assertEqual(self.boq.variation_count, 1)
+
+        lead = self.env['crm.lead'].create({'name': 'BOQ Test Lead', 'partner_id': self.customer.id})
+        self.assertEqual(lead.boq_count, 0)
+        self.env['boq.project'].create([
+            {'customer_id': self.customer.id, 'origin_lead_id': lead.id} for _i in range(2)
+        ])
+        self.assertEqual(lead.boq_count, 2)
+
+    def test_kpis_invalidated_by_writes(self):
+        self.env.cr.precommit.clear()
+        kpis = self.boq._get_kpis()[self.boq.id]
+        self.assertAlmostEqual(kpis['total'], 330.0)
+        self.assertEqual(KPI_CACHE[(self.env.cr.dbname, self.boq.id)][1], kpis)
+
+        self.subs[0].master_qty = 20.0
+        self.assertIn(self.boq.id, self.env.cr.precommit.data[KPI_STALE_KEY])
+        # Values of the transaction are read again, but not cached
+        self.assertAlmostEqual(self.boq._get_kpis()[self.boq.id]['total'], 440.0)
+        self.assertAlmostEqual(KPI_CACHE[(self.env.cr.dbname, self.boq.id)][1]['total'], 330.0)
+
+        self.env.flush_all()
+        self.env.cr.execute("SELECT kpi_stamp FROM boq_project WHERE id = %s", [self.boq.id])
+        stamp = self.env.cr.fetchone()[0] or 0
+        self.boq._kpi_bump_stamps()
+        self.env.cr.execute("SELECT kpi_stamp FROM boq_project WHERE id = %s", [self.boq.id])
+        self.assertEqual(self.env.cr.fetchone()[0], stamp + 1)
+        self.assertNotIn(KPI_STALE_KEY, self.env.cr.precommit.data)
+        self.assertAlmostEqual(self.boq._get_kpis()[self.boq.id]['total'], 440.0)
+        self.assertAlmostEqual(KPI_CACHE[(self.env.cr.dbname, self.boq.id)][1]['total'], 440.0)
@@ -0,0 +1,57 @@
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.boq.models.boq_project import KPI_STALE_KEY
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqCertificate(BoqTestCommon):
+
+    def _certificate(self):
+        self.subs.write({'current_qty': 5.0})
+        action = self.boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        certificate.action_set_approved_amount()
+        return certificate
+
+    def test_quantity_transfers(self):
+        self.env['boq.subactivity.cost'].create({
+            'subactivity_id': self.subs[0].id,
+            'name': 'Transport',
+            'cost': 2.0,
+        })
+        certificate = self._certificate()
+        Cube = self.env['boq.cost.cube']
+        breakdown = Cube._breakdown(self.boq)
+        self.env.cr.precommit.clear()
+        certificate._apply_quantity_transfers()
+        self.assertEqual(self.subs.mapped('previous_qty'), [5.0, 5.0])
+        self.assertEqual(self.subs.mapped('current_qty'), [0.0, 0.0])
+        self.assertEqual(self.activity.previous_qty_total, 10.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+        self.assertIn(self.boq.id, self.env.cr.precommit.data[KPI_STALE_KEY])
+        self.assertEqual(Cube._breakdown(self.boq), breakdown)
+        ledger = self.env['boq.quantity.ledger'].search([('certificate_id', '=', certificate.id)])
+        self.assertEqual(len(ledger), 2)
+
+    def test_quantity_transfers_respect_job_lock(self):
+        certificate = self._certificate()
+        self.env['boq.job']._enqueue(self.boq, 'Locking Job')
+        with self.assertRaises(UserError):
+            certificate._apply_quantity_transfers()
+
+    def test_certificate_lines(self):
+        self.subs[1].current_qty = 5.0
+        action = self.boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        # Only the sub-activities with current progress get a line
+        self.assertEqual(certificate.line_ids.subactivity_id, self.subs[1])
+        self.assertEqual(certificate.line_ids.qty_completed, 5.0)
+        self.assertAlmostEqual(certificate.line_ids.completion_percent, 25.0)
+        self.assertAlmostEqual(certificate.line_ids.amount_completed, 55.0)
+
+    def test_certificate_without_progress(self):
+        with self.assertRaises(UserError):
+            self.boq.action_create_payment_certificate()
@@ -0,0 +1,54 @@
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqClone(BoqTestCommon):
+
+    def test_clone_tree(self):
+        self.subs.write({'current_qty': 4.0})
+        self.env['boq.subactivity.cost'].create({
+            'subactivity_id': self.subs[0].id,
+            'name': 'Transport',
+            'cost': 2.0,
+        })
+        clone = self.boq.clone_tree()
+        self.assertNotEqual(clone, self.boq)
+        self.assertEqual(len(clone.activity_line_ids), 1)
+        subs = clone.activity_line_ids.subactivity_ids
+        self.assertEqual(sorted(subs.mapped('master_qty')), [10.0, 20.0])
+        self.assertEqual(subs.mapped('current_qty'), [0.0, 0.0])
+        self.assertEqual(len(subs.additional_cost_ids), 1)
+        self.assertFalse(clone.sale_order_id)
+        self.assertEqual(clone._check_rollup_consistency(), [])
+        self.assertEqual(
+            self.env['boq.cost.cube']._breakdown(clone, ['activity_id'])[0]['amount'],
+            2.0 * 10.0,
+        )
+
+    def test_subcontract_po_with_section_line(self):
+        """Section and note lines of a subcontract PO have no product and
+        are left out of the subcontract prices."""
+        vendor = self.env['res.partner'].create({'name': 'BOQ Test Subcontractor', 'supplier_rank': 1})
+        order = self.env['purchase.order'].create({
+            'partner_id': vendor.id,
+            'from_boq': True,
+            'source_boq_id': self.boq.id,
+            'boq_activity_ids': [(6, 0, self.activity.ids)],
+            'order_line': [
+                (0, 0, {'display_type': 'line_section', 'name': 'Works'}),
+                (0, 0, {
+                    'product_id': self.product.id,
+                    'name': 'Works',
+                    'product_qty': 30.0,
+                    'price_unit': 7.0,
+                }),
+                (0, 0, {'display_type': 'line_note', 'name': 'Terms'}),
+            ],
+        })
+        order.button_confirm()
+        subs = order.subcontract_boq_id.activity_line_ids.subactivity_ids
+        self.assertEqual(len(subs), 2)
+        self.assertEqual(subs.mapped('product_cost'), [7.0, 7.0])
+        self.assertEqual(subs.mapped('margin_percent'), [0.0, 0.0])
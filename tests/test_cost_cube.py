@@ -0,0 +1,56 @@
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqCostCube(BoqTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.transport, cls.handling = cls.env['boq.cost.type'].create([
+            {'name': 'Transport'},
+            {'name': 'Handling'},
+        ])
+
+    def _breakdowns(self):
+        Cube = self.env['boq.cost.cube']
+        return [
+            {
+                tuple(values[fname] for fname in groupby): (values['amount'], values['line_count'])
+                for values in Cube._breakdown(self.boq, groupby)
+            }
+            for groupby in (('cost_type_id',), ('activity_id', 'activity_type'))
+        ]
+
+    def test_incremental_matches_rebuild(self):
+        Cost = self.env['boq.subactivity.cost']
+        costs = Cost.create([
+            {'subactivity_id': self.subs[0].id, 'name': 'Truck', 'cost': 2.0, 'cost_type_id': self.transport.id},
+            {'subactivity_id': self.subs[1].id, 'name': 'Crane', 'cost': 3.0, 'cost_type_id': self.handling.id},
+            {'subactivity_id': self.subs[1].id, 'name': 'Van', 'cost': 1.0, 'cost_type_id': self.transport.id},
+        ])
+        # Every change is moved into the cube as it is written
+        costs[0].cost = 4.0
+        costs[2].cost_type_id = self.handling
+        self.subs[1].write({'master_qty': 30.0, 'activity_type': 'labor'})
+        costs[1].unlink()
+
+        incremental = self._breakdowns()
+        self.assertEqual(incremental[0], {(self.transport,): (40.0, 1), (self.handling,): (30.0, 1)})
+        self.assertEqual(incremental[1], {
+            (self.activity, 'material'): (40.0, 1),
+            (self.activity, 'labor'): (30.0, 1),
+        })
+        self.env['boq.cost.cube']._rebuild(self.boq)
+        self.assertEqual(self._breakdowns(), incremental)
+
+    def test_cells_removed_with_their_lines(self):
+        self.env['boq.subactivity.cost'].create({
+            'subactivity_id': self.subs[0].id, 'name': 'Truck', 'cost': 2.0, 'cost_type_id': self.transport.id,
+        })
+        self.assertEqual(len(self.env['boq.cost.cube'].search([('boq_id', '=', self.boq.id)])), 1)
+        self.subs[0].unlink()
+        self.assertFalse(self.env['boq.cost.cube'].search([('boq_id', '=', self.boq.id)]))
+        self.assertEqual(self.env['boq.cost.cube']._breakdown(self.boq), [])
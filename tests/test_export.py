@@ -0,0 +1,29 @@
+import csv
+import io
+
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqExport(BoqTestCommon):
+
+    def _export(self):
+        fileobj = io.BytesIO()
+        filename = self.boq._export_tree(fileobj, 'csv', chunk_size=1)
+        self.assertTrue(filename.endswith('.csv'))
+        return list(csv.reader(io.StringIO(fileobj.getvalue().decode())))
+
+    def test_export_tree(self):
+        self.env['boq.subactivity.cost'].create({
+            'subactivity_id': self.subs[0].id,
+            'name': 'Transport',
+            'cost': 2.0,
+        })
+        rows = self._export()
+        self.assertEqual([row[0] for row in rows[1:]], ['activity', 'subactivity', 'cost', 'subactivity'])
+        self.assertEqual(rows[3][-2], 'Transport')
+        self.assertEqual(float(rows[3][-1]), 2.0)
+        # A second export in the same transaction opens its own cursor
+        self.assertEqual(self._export(), rows)
@@ -0,0 +1,65 @@
+import base64
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqImport(BoqTestCommon):
+
+    def _import(self, content, batch_size):
+        wizard = self.env['boq.import.wizard'].create({
+            'boq_id': self.boq.id,
+            'file': base64.b64encode(content.encode()),
+            'filename': 'lines.csv',
+            'batch_size': batch_size,
+        })
+        wizard.action_import()
+        return self.boq.activity_line_ids.filtered(lambda a: a.name == 'Imported').subactivity_ids
+
+    def test_cost_after_batch_boundary(self):
+        """A cost row right after a flushed batch belongs to the sub-activity
+        it follows, not to the first one of the next batch."""
+        content = (
+            "Activity,Product,Master Qty,Cost Name,Cost\n"
+            "Imported,BOQ-TEST-1,5,,\n"
+            ",,,Transport,3\n"
+            "Imported,BOQ-TEST-1,7,,\n"
+        )
+        first, second = self._import(content, batch_size=1).sorted('id')
+        self.assertEqual(first.additional_cost_ids.mapped('name'), ['Transport'])
+        self.assertFalse(second.additional_cost_ids)
+
+    def test_costs_within_batch(self):
+        content = (
+            "Activity,Product,Master Qty,Cost Name,Cost\n"
+            "Imported,BOQ-TEST-1,5,,\n"
+            ",,,Transport,3\n"
+            "Imported,BOQ-TEST-1,7,,\n"
+            ",,,Crane,4\n"
+        )
+        first, second = self._import(content, batch_size=100).sorted('id')
+        self.assertEqual(first.additional_cost_ids.mapped('name'), ['Transport'])
+        self.assertEqual(second.additional_cost_ids.mapped('name'), ['Crane'])
+        self.assertEqual(second.total_cost, second.product_cost + 4)
+
+    def test_activities_created_per_batch(self):
+        content = (
+            "Activity,Product,Master Qty\n"
+            "Imported,BOQ-TEST-1,5\n"
+            "Second,BOQ-TEST-1,6\n"
+            "Imported,BOQ-TEST-1,7\n"
+            "Test Activity,BOQ-TEST-1,8\n"
+            "Third,BOQ-TEST-1,9\n"
+        )
+        Activity = type(self.env['boq.activity'])
+        with patch.object(Activity, 'create', autospec=True, side_effect=Activity.create) as create:
+            subs = self._import(content, batch_size=3)
+        # One create per batch with new activities
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(len(subs), 2)
+        activities = self.boq.activity_line_ids.sorted('sequence')
+        self.assertEqual(activities.mapped('name'), ['Test Activity', 'Imported', 'Second', 'Third'])
+        self.assertEqual(len(self.activity.subactivity_ids), 3)
@@ -0,0 +1,65 @@
+from odoo.exceptions import AccessError, UserError
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqJobLock(BoqTestCommon):
+
+    def _queue_certificate(self):
+        self.subs.write({'current_qty': 5.0})
+        action = self.boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        certificate.action_set_approved_amount()
+        certificate.action_submit_async()
+        return certificate
+
+    def test_queued_job_locks_records(self):
+        certificate = self._queue_certificate()
+        self.assertEqual(certificate.job_state, 'pending')
+        self.assertEqual(self.boq.job_id, certificate.job_id)
+        with self.assertRaises(UserError):
+            certificate.write({'certificate_date': '2020-01-01'})
+        with self.assertRaises(UserError):
+            self.subs[0].write({'master_qty': 30.0})
+        # The worker itself is allowed to write
+        with certificate.job_id._processing():
+            self.subs[0].write({'master_qty': 30.0})
+
+    def test_lock_not_lifted_by_context_or_other_job(self):
+        certificate = self._queue_certificate()
+        job = certificate.job_id
+        for job_id in (job.id, job.id + 1):
+            with self.assertRaises(UserError):
+                self.subs[0].with_context(boq_job_id=job_id).write({'master_qty': 30.0})
+        other_job = self.env['boq.job'].sudo().create({
+            'name': 'Other Job',
+            'res_model': 'boq.project',
+            'res_id': self.boq.id,
+        })
+        with other_job._processing(), self.assertRaises(UserError):
+            self.subs[0].write({'master_qty': 30.0})
+
+    def test_failed_job_released_by_manager(self):
+        certificate = self._queue_certificate()
+        job = certificate.job_id
+        job.write({'state': 'failed', 'error': 'boom'})
+        with self.assertRaises(UserError):
+            self.subs[0].write({'master_qty': 30.0})
+        self.env.user.groups_id |= self.env.ref('boq.group_boq_manager')
+        certificate.action_cancel_job()
+        self.assertEqual(job.state, 'cancelled')
+        self.subs[0].write({'master_qty': 30.0})
+
+    def test_users_cannot_move_job_state(self):
+        certificate = self._queue_certificate()
+        user = self.env['res.users'].create({
+            'name': 'BOQ Test User',
+            'login': 'boq_test_user',
+            'groups_id': [(6, 0, [self.env.ref('boq.group_boq_user').id])],
+        })
+        with self.assertRaises(AccessError):
+            certificate.job_id.with_user(user).write({'state': 'done'})
+        with self.assertRaises(AccessError):
+            certificate.job_id.with_user(user).action_cancel()
@@ -0,0 +1,55 @@
+from unittest import skipIf
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.boq.models.boq_pricing import np
+from odoo.addons.boq.models.boq_project import KPI_STALE_KEY
+
+from .common import BoqTestCommon
+
+
+@skipIf(np is None, "numpy is not installed")
+@tagged('post_install', '-at_install')
+class TestBoqPricing(BoqTestCommon):
+
+    def test_evaluate(self):
+        self.env['boq.subactivity.cost'].create({
+            'subactivity_id': self.subs[0].id,
+            'name': 'Transport',
+            'cost': 2.0,
+        })
+        self.subs[1].activity_type = 'labor'
+        current, margin, escalation = self.env['boq.pricing.engine'].evaluate(self.boq.id, [
+            {'name': 'Current'},
+            {'name': 'Margin 20', 'margin': 20.0},
+            {'cost_escalation': 10.0, 'margin_by_type': {'labor': 0.0}},
+        ])
+        self.assertAlmostEqual(current['total'], self.boq.total)
+        self.assertAlmostEqual(current['activities'][self.activity.id], self.activity.total_cumulative)
+        # (10 + 2) * 10 + 10 * 20, with 20% margin
+        self.assertAlmostEqual(margin['cost'], 320.0)
+        self.assertAlmostEqual(margin['total'], 384.0)
+        self.assertAlmostEqual(margin['margin_amount'], 64.0)
+        self.assertEqual(escalation['name'], 'Scenario 3')
+        self.assertAlmostEqual(escalation['activity_types']['material'], 143.0)
+        self.assertAlmostEqual(escalation['activity_types']['labor'], 220.0)
+        self.assertAlmostEqual(escalation['total'], 363.0)
+        # Scenarios are only evaluated
+        self.assertEqual(self.subs.mapped('margin_percent'), [10.0, 10.0])
+
+    def test_commit(self):
+        Pricing = self.env['boq.pricing.engine']
+        self.env.cr.precommit.clear()
+        self.assertEqual(Pricing.commit(self.boq.id, {'margin': 20.0, 'cost_escalation': 10.0}), 2)
+        self.assertEqual(self.subs.mapped('margin_percent'), [20.0, 20.0])
+        self.assertEqual(self.subs.mapped('product_cost'), [11.0, 11.0])
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+        self.assertIn(self.boq.id, self.env.cr.precommit.data[KPI_STALE_KEY])
+        # Nothing left to change
+        self.assertEqual(Pricing.commit(self.boq.id, {'margin': 20.0}), 0)
+
+    def test_commit_respects_job_lock(self):
+        self.env['boq.job']._enqueue(self.boq, 'Locking Job')
+        with self.assertRaises(UserError):
+            self.env['boq.pricing.engine'].commit(self.boq.id, {'margin': 20.0})
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from odoo.addons.boq.models.boq_project_pnl import PNL_FULL_REFRESH_PARAM, PNL_WATERMARK_PARAM
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqProjectPnl(BoqTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Pnl = cls.env['boq.project.pnl']
+        cls.ICP = cls.env['ir.config_parameter'].sudo()
+        # The first cron run of the tests is a full rebuild
+        cls.ICP.set_param(PNL_WATERMARK_PARAM, False)
+        cls.ICP.set_param(PNL_FULL_REFRESH_PARAM, False)
+
+    def _certificate(self, boq, date='2024-02-15'):
+        boq.activity_line_ids.subactivity_ids.write({'current_qty': 5.0})
+        action = boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        certificate.action_set_approved_amount()
+        certificate.write({'certificate_date': date, 'state': 'submitted'})
+        return certificate
+
+    def _age_sources(self):
+        """Date the BOQ and certificate rows a day back, as if written
+        before the last refresh."""
+        self.env.flush_all()
+        for table in ('boq_project', 'boq_payment_certificate'):
+            self.env.cr.execute(f"UPDATE {table} SET write_date = write_date - INTERVAL '1 day'")
+        self.env.invalidate_all()
+
+    def _rows(self, boq):
+        return self.Pnl.search([('boq_id', '=', boq.id)])
+
+    def test_company_currency(self):
+        company = self.env.company
+        currency = self.env['res.currency'].create({
+            'name': 'BQX',
+            'symbol': 'Q',
+            'rate_ids': [(0, 0, {'name': '2024-01-01', 'rate': 2.0, 'company_id': company.id})],
+        })
+        boq = self.boq.clone_tree(default={'currency_id': currency.id})
+        certificate = self._certificate(boq)
+        self.Pnl._refresh(boq)
+        row = self._rows(boq)
+        self.assertEqual(len(row), 1)
+        self.assertEqual(row.currency_id, company.currency_id)
+        expected = currency._convert(
+            certificate.amount_approved, company.currency_id, company, certificate.certificate_date, round=False,
+        )
+        self.assertAlmostEqual(row.certified_amount, expected, places=2)
+
+    def test_grouped_margin_percent(self):
+        self.Pnl.create([{
+            'boq_id': self.boq.id,
+            'period': period,
+            'certified_amount': certified,
+            'margin': margin,
+            'margin_percent': margin / certified * 100,
+        } for period, certified, margin in (('2024-01-01', 100.0, 50.0), ('2024-02-01', 300.0, 30.0))])
+        [(boq, margin_percent)] = self.Pnl._read_group(
+            [('boq_id', '=', self.boq.id)], ['boq_id'], ['margin_percent:avg'],
+        )
+        # Summed margin over summed certified amount, not the 30% average
+        self.assertEqual(boq, self.boq)
+        self.assertAlmostEqual(margin_percent, 20.0)
+
+    def test_incremental_and_full_refresh(self):
+        certificate = self._certificate(self.boq)
+        self.Pnl._cron_refresh()
+        self.assertEqual(self._rows(self.boq).certified_amount, certificate.amount_approved)
+
+        # A written source row is picked up by the next run
+        self._age_sources()
+        certificate.state = 'draft'
+        self.Pnl._cron_refresh()
+        self.assertFalse(self._rows(self.boq))
+        certificate.state = 'submitted'
+        self.Pnl._cron_refresh()
+        self.assertTrue(self._rows(self.boq))
+
+        # A deleted one leaves no write date: only the daily full rebuild sees it
+        certificate.unlink()
+        self._age_sources()
+        self.Pnl._cron_refresh()
+        self.assertTrue(self._rows(self.boq))
+        self.ICP.set_param(
+            PNL_FULL_REFRESH_PARAM,
+            fields.Datetime.to_string(fields.Datetime.now() - timedelta(days=2)),
+        )
+        self.Pnl._cron_refresh()
+        self.assertFalse(self._rows(self.boq))
+        self.assertTrue(self.ICP.get_param(PNL_WATERMARK_PARAM))
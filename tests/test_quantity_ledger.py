@@ -0,0 +1,70 @@
+from odoo.exceptions import AccessError
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqQuantityLedger(BoqTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Ledger = cls.env['boq.quantity.ledger']
+        Certificate = cls.env['boq.payment.certificate']
+        cls.cert_jan = Certificate.create({'boq_id': cls.boq.id, 'certificate_date': '2024-01-10'})
+        cls.cert_feb = Certificate.create({'boq_id': cls.boq.id, 'certificate_date': '2024-02-10'})
+        cls.sub = cls.subs[0]
+        cls.Ledger._record_transfers([(cls.cert_jan, cls.sub, 2.0)])
+        cls.Ledger._record_transfers([(cls.cert_feb, cls.sub, 3.0)])
+
+    def test_entries_dated_on_certificate(self):
+        entries = self.Ledger.search([('subactivity_id', '=', self.sub.id)])
+        self.assertEqual(
+            sorted(str(date) for date in entries.mapped('date')),
+            ['2024-01-10', '2024-02-10'],
+        )
+
+    def test_as_of_date(self):
+        price = self.sub.unit_price
+        self.assertIsNone(self.Ledger._get_cumulative(self.sub, date='2023-12-31')[self.sub.id])
+        self.assertEqual(self.Ledger._get_cumulative(self.sub, date='2024-01-31')[self.sub.id], (2.0, 2.0 * price))
+        self.assertEqual(self.Ledger._get_cumulative(self.sub, date='2024-02-10')[self.sub.id], (5.0, 5.0 * price))
+        self.assertEqual(self.Ledger._get_cumulative(self.sub)[self.sub.id], (5.0, 5.0 * price))
+
+    def test_as_of_certificate(self):
+        price = self.sub.unit_price
+        self.assertEqual(self.Ledger._get_cumulative(self.sub, certificate=self.cert_jan)[self.sub.id], (2.0, 2.0 * price))
+        activity_total = self.Ledger._get_cumulative(self.activity, certificate=self.cert_jan)[self.activity.id]
+        self.assertEqual(activity_total, (None, 2.0 * price))
+
+    def test_certificates_out_of_date_order(self):
+        """A certificate dated before an already recorded one is counted
+        from its date on, and restates the totals after it."""
+        sub = self.subs[1]
+        price = sub.unit_price
+        self.Ledger._record_transfers([(self.cert_feb, sub, 3.0)])
+        self.Ledger._record_transfers([(self.cert_jan, sub, 2.0)])
+        self.assertEqual(self.Ledger._get_cumulative(sub, date='2024-01-31')[sub.id], (2.0, 2.0 * price))
+        self.assertEqual(self.Ledger._get_cumulative(sub, date='2024-02-10')[sub.id], (5.0, 5.0 * price))
+        self.assertEqual(self.Ledger._get_cumulative(sub)[sub.id], (5.0, 5.0 * price))
+        self.assertEqual(self.Ledger._get_cumulative(sub, certificate=self.cert_jan)[sub.id], (2.0, 2.0 * price))
+        cumulative = self.Ledger._get_cumulative
+        self.assertEqual(cumulative(self.activity, date='2024-01-31')[self.activity.id], (None, 4.0 * price))
+        self.assertEqual(cumulative(self.activity, date='2024-02-10')[self.activity.id], (None, 10.0 * price))
+        self.assertEqual(cumulative(self.boq, date='2024-02-10')[self.boq.id], (None, 10.0 * price))
+
+    def test_ledger_is_read_only_for_users(self):
+        user = self.env['res.users'].create({
+            'name': 'BOQ Ledger User',
+            'login': 'boq_ledger_user',
+            'groups_id': [(6, 0, [self.env.ref('boq.group_boq_user').id])],
+        })
+        with self.assertRaises(AccessError):
+            self.Ledger.with_user(user).create({
+                'subactivity_id': self.sub.id,
+                'activity_id': self.activity.id,
+                'boq_id': self.boq.id,
+                'date': '2024-03-01',
+                'qty': 1.0,
+            })
@@ -0,0 +1,30 @@
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqRetention(BoqTestCommon):
+
+    def _certificate(self):
+        self.subs.write({'current_qty': 5.0})
+        action = self.boq.action_create_payment_certificate()
+        certificate = self.env['boq.payment.certificate'].browse(action['res_id'])
+        certificate.action_set_approved_amount()
+        return certificate
+
+    def test_retention_rate(self):
+        self.assertEqual(self.boq.retention_rate, 5.0)
+        self.boq.retention_tax = 'RET 7.5%'
+        self.assertEqual(self.boq.retention_rate, 7.5)
+        self.assertAlmostEqual(self.boq.retention_amount_total, self.boq.total * 0.075)
+        # Labels without a percentage fall back to the default rate
+        for label in ('Retention', 'RET x%', False):
+            self.boq.retention_tax = label
+            self.assertEqual(self.boq.retention_rate, 5.0)
+
+    def test_certificate_uses_boq_rate(self):
+        self.boq.retention_tax = 'RET 10%'
+        certificate = self._certificate()
+        self.assertTrue(certificate.amount_approved)
+        self.assertAlmostEqual(certificate.amount_retention, certificate.amount_approved * 0.1)
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqRollups(BoqTestCommon):
+
+    def test_deltas_propagate(self):
+        self.subs[0].current_qty = 5.0
+        self.assertEqual(self.activity.current_qty_total, 5.0)
+        self.subs.write({'master_qty': 40.0})
+        self.assertEqual(self.activity.master_qty_total, 80.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_consistent_after_create_and_unlink(self):
+        self.subs[1].margin_percent = 25.0
+        self.env['boq.subactivity'].create({
+            'activity_id': self.activity.id,
+            'product_id': self.product.id,
+            'master_qty': 5.0,
+            'product_cost': 3.0,
+        })
+        self.subs[0].unlink()
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_batch_edit(self):
+        with self.boq.batch_edit() as stats:
+            self.subs.write({'current_qty': 2.0})
+            self.subs.write({'margin_percent': 20.0})
+        self.assertEqual(stats['boqs'], 1)
+        self.assertEqual(self.activity.current_qty_total, 4.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_batch_edit_left_by_an_error(self):
+        with self.assertRaises(ValueError):
+            with self.env.cr.savepoint(), self.boq.batch_edit():
+                self.subs.write({'current_qty': 1.0})
+                raise ValueError('rolled back')
+        self.assertFalse(self.boq._batch_edit_active())
+        self.subs[0].current_qty = 3.0
+        self.assertEqual(self.activity.current_qty_total, 3.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def _patch_deltas(self):
+        Activity = type(self.env['boq.activity'])
+        return patch.object(
+            Activity, '_apply_rollup_deltas', autospec=True, side_effect=Activity._apply_rollup_deltas,
+        )
+
+    def test_delta_propagation_of_quantities(self):
+        subs = self.subs.with_context(boq_delta_propagation=True)
+        with self._patch_deltas() as apply_deltas:
+            subs[0].write({'current_qty': 5.0})
+            subs[1].write({'previous_qty': 4.0, 'current_qty': 2.0})
+        self.assertEqual(apply_deltas.call_count, 2)
+        self.assertEqual(self.activity.current_qty_total, 7.0)
+        self.assertEqual(self.activity.previous_qty_total, 4.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_delta_propagation_context_with_cost_and_margin(self):
+        """Writes beyond the quantities take the full recompute, even with
+        the delta propagation context."""
+        subs = self.subs.with_context(boq_delta_propagation=True)
+        with self._patch_deltas() as apply_deltas:
+            subs[0].write({'product_cost': 12.0})
+            subs[1].write({'margin_percent': 30.0, 'current_qty': 3.0})
+        apply_deltas.assert_not_called()
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+        subs[1].write({'current_qty': 6.0})
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_delta_propagation_in_batch_edit(self):
+        subs = self.subs.with_context(boq_delta_propagation=True)
+        with self._patch_deltas() as apply_deltas, self.boq.batch_edit():
+            subs.write({'current_qty': 2.0})
+            subs[0].write({'product_cost': 15.0, 'margin_percent': 5.0})
+        apply_deltas.assert_not_called()
+        self.assertEqual(self.activity.current_qty_total, 4.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
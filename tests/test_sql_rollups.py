@@ -0,0 +1,69 @@
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+ROLLUP_FIELDS = [
+    'total_previous', 'total_current', 'total_cumulative',
+    'master_qty_total', 'previous_qty_total', 'current_qty_total',
+    'billed_progress_percent', 'onsite_progress_percent',
+]
+
+
+@tagged('post_install', '-at_install')
+class TestBoqSqlRollups(BoqTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.subs[0].write({'previous_qty': 4.0, 'current_qty': 2.0})
+        cls.subs[1].write({'previous_qty': 5.0, 'current_qty': 10.0, 'margin_percent': 25.0})
+        cls.empty_activity = cls.env['boq.activity'].create({
+            'boq_id': cls.boq.id,
+            'name': 'Empty Activity',
+        })
+
+    def test_activity_rollups_match_orm(self):
+        self.assertTrue(self.env['boq.project']._use_sql_rollups(self.activity))
+        # The same lines on a new record are rolled up by the ORM
+        draft = self.env['boq.activity'].new({
+            'boq_id': self.boq.id,
+            'name': 'Draft Activity',
+            'subactivity_ids': [Command.create({
+                'product_id': sub.product_id.id,
+                'master_qty': sub.master_qty,
+                'previous_qty': sub.previous_qty,
+                'current_qty': sub.current_qty,
+                'product_cost': sub.product_cost,
+                'margin_percent': sub.margin_percent,
+            }) for sub in self.subs],
+        })
+        self.assertFalse(self.env['boq.project']._use_sql_rollups(draft))
+        for fname in ROLLUP_FIELDS:
+            self.assertAlmostEqual(self.activity[fname], draft[fname], msg=fname)
+        # 10 * 11 + 20 * 12.5
+        self.assertAlmostEqual(self.activity.total_cumulative, 360.0)
+        self.assertAlmostEqual(self.activity.billed_progress_percent, 30.0)
+        self.assertAlmostEqual(self.activity.onsite_progress_percent, 70.0)
+
+    def test_recompute_with_both_paths(self):
+        activities = self.activity | self.empty_activity
+        stored = {activity.id: activity.read(ROLLUP_FIELDS)[0] for activity in activities}
+        for context in ({}, {'boq_rollup_orm': True}):
+            records = activities.with_context(**context)
+            records.invalidate_recordset(ROLLUP_FIELDS)
+            for fname in ('total_cumulative', 'billed_progress_percent'):
+                self.env.add_to_compute(records._fields[fname], records)
+            records.flush_recordset(ROLLUP_FIELDS)
+            for activity in records:
+                for fname in ROLLUP_FIELDS:
+                    self.assertAlmostEqual(activity[fname], stored[activity.id][fname], msg=fname)
+        self.assertEqual(self.empty_activity.total_cumulative, 0.0)
+        self.assertEqual(self.empty_activity.billed_progress_percent, 0.0)
+
+    def test_boq_rollups_match_subactivities(self):
+        subs = self.boq.activity_line_ids.subactivity_ids
+        self.assertAlmostEqual(self.boq.total, sum(subs.mapped('total_cumulative')))
+        self.assertAlmostEqual(self.boq.total_previous, sum(subs.mapped('total_previous')))
+        self.assertAlmostEqual(self.boq.total_current, sum(subs.mapped('total_current')))
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
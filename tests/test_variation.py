@@ -0,0 +1,84 @@
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqVariation(BoqTestCommon):
+
+    def _variation(self):
+        sub = self.subs[0]
+        variation = self.env['boq.variation'].create({
+            'boq_id': self.boq.id,
+            'description': 'Test Variation',
+            'approver_ids': [(6, 0, self.env.user.ids)],
+            'edit_line_ids': [(0, 0, {
+                'action_type': 'edit',
+                'target_subactivity_id': sub.id,
+                'original_qty': sub.master_qty,
+                'original_cost': sub.product_cost,
+                'original_margin': sub.margin_percent,
+                'new_qty': 15.0,
+                'new_cost': 12.0,
+                'new_margin': 20.0,
+            })],
+            'add_line_ids': [(0, 0, {
+                'action_type': 'add',
+                'target_activity_id': self.activity.id,
+                'product_id': self.product.id,
+                'new_qty': 5.0,
+                'new_cost': 4.0,
+            })],
+            'new_activity_line_ids': [(0, 0, {
+                'action_type': 'new_activity',
+                'activity_name': 'Extra Works',
+                'product_id': self.product.id,
+                'new_qty': 2.0,
+                'new_cost': 50.0,
+                'new_margin': 10.0,
+            })],
+        })
+        variation.action_submit()
+        variation.action_approve()
+        return variation
+
+    def test_apply_variation(self):
+        variation = self._variation()
+        variation.action_apply_variation()
+        self.assertEqual(variation.state, 'applied')
+        self.assertEqual(self.subs[0].master_qty, 15.0)
+        self.assertAlmostEqual(self.subs[0].unit_price, 14.4)
+        added = self.activity.subactivity_ids - self.subs
+        self.assertEqual(len(added), 1)
+        self.assertTrue(added.is_variation)
+        self.assertEqual(added.source_variation_id, variation)
+        new_activity = self.boq.activity_line_ids - self.activity
+        self.assertEqual(new_activity.name, 'Extra Works')
+        self.assertAlmostEqual(new_activity.total_cumulative, 110.0)
+        # 15 * 14.4 + 20 * 11 + 5 * 4 + 2 * 55
+        self.assertAlmostEqual(self.boq.total, 566.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_simulate_matches_apply(self):
+        variation = self._variation()
+        result = variation.simulate()[variation.id]
+        # Nothing is written by the simulation
+        self.assertEqual(self.subs[0].master_qty, 10.0)
+        self.assertEqual(len(self.boq.activity_line_ids), 1)
+        self.assertAlmostEqual(self.boq.total, 330.0)
+        self.assertAlmostEqual(result['total_change'], 236.0)
+
+        variation.action_apply_variation()
+        self.assertAlmostEqual(result['total'], self.boq.total)
+        self.assertAlmostEqual(result['retention_amount_total'], self.boq.retention_amount_total)
+        simulated = {values['name']: values for values in result['activities']}
+        for activity in self.boq.activity_line_ids:
+            for fname in ('total_cumulative', 'total_previous', 'billed_progress_percent'):
+                self.assertAlmostEqual(simulated[activity.name][fname], activity[fname])
+
+    def test_simulate_variations_side_by_side(self):
+        # Each variation is applied to its own copy of the loaded BOQ
+        first, second = self._variation(), self._variation()
+        results = (first | second).simulate()
+        self.assertAlmostEqual(results[first.id]['total'], 566.0)
+        self.assertAlmostEqual(results[second.id]['total'], 566.0)
@@ -0,0 +1,73 @@
+from odoo.tests import tagged
+
+from .common import BoqTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBoqWizards(BoqTestCommon):
+
+    def test_advance_payment_groups(self):
+        self.subs[1].write({'is_variation': True, 'activity_type': 'labor'})
+        Wizard = self.env['boq.advance.payment.wizard']
+        expected = {
+            'activity': {('Test Activity', False): (110.0, 1), ('Test Activity', True): (220.0, 1)},
+            'origin': {('Original', False): (110.0, 1), ('Variation', True): (220.0, 1)},
+            'activity_type': {('Material', False): (110.0, 1), ('Labor', True): (220.0, 1)},
+        }
+        for group_by, groups in expected.items():
+            lines = {
+                (vals['name'], vals['is_variation']): (vals['amount'], vals['subactivity_count'])
+                for _command, _id, vals in Wizard._prepare_group_lines(self.boq, group_by)
+            }
+            self.assertEqual(lines, groups, group_by)
+
+        defaults = Wizard.with_context(boq_id=self.boq.id).default_get(['boq_id', 'group_by', 'line_ids'])
+        self.assertEqual(defaults['boq_id'], self.boq.id)
+        # Only the original lines are selected by default
+        selected = [vals['amount'] for _command, _id, vals in defaults['line_ids'] if vals['selected']]
+        self.assertEqual(selected, [110.0])
+
+    def test_subcontract_purchase_order(self):
+        vendor = self.env['res.partner'].create({'name': 'BOQ Test Subcontractor', 'supplier_rank': 1})
+        wizard = self.env['boq.subcontract.wizard'].with_context(boq_id=self.boq.id).create({
+            'vendor_id': vendor.id,
+        })
+        self.assertEqual(len(wizard.line_ids), 1)
+        self.assertEqual(wizard.line_ids.activity_id, self.activity)
+        self.assertEqual(wizard.line_ids.total_quantity, 30.0)
+        self.assertEqual(wizard.line_ids.subactivity_count, 2)
+
+        wizard.line_ids.write({'selected': True, 'unit_cost': 7.0})
+        self.assertAlmostEqual(wizard.line_ids.estimated_total, 210.0)
+        action = wizard.action_create_purchase_order()
+        order = self.env['purchase.order'].browse(action['res_id'])
+        self.assertEqual(order.partner_id, vendor)
+        self.assertEqual(order.source_boq_id, self.boq)
+        self.assertEqual(order.order_line.mapped('product_qty'), [10.0, 20.0])
+        self.assertEqual(order.order_line.mapped('price_unit'), [7.0, 7.0])
+
+    def test_set_margin(self):
+        wizard = self.env['boq.set.margin.wizard'].create({
+            'boq_id': self.boq.id,
+            'margin_percent': 15.0,
+            'apply_to': 'all',
+        })
+        wizard.action_set_margin()
+        self.assertEqual(self.boq.margin_percent, 15.0)
+        self.assertEqual(self.activity.margin_percent, 15.0)
+        self.assertEqual(self.subs.mapped('margin_percent'), [15.0, 15.0])
+        self.assertAlmostEqual(self.boq.total, 345.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
+
+    def test_set_margin_keeps_existing(self):
+        self.subs[0].margin_percent = 0.0
+        wizard = self.env['boq.set.margin.wizard'].create({
+            'boq_id': self.boq.id,
+            'margin_percent': 15.0,
+            'apply_to': 'subactivities_only',
+            'override_existing': False,
+        })
+        wizard.action_set_margin()
+        self.assertEqual(self.subs.mapped('margin_percent'), [15.0, 10.0])
+        self.assertAlmostEqual(self.activity.total_cumulative, 10 * 11.5 + 20 * 11.0)
+        self.assertEqual(self.boq._check_rollup_consistency(), [])
@@ -1,3 +1,4 @@
 from . import set_margin_wizard
 from . import advance_payment_wizard
-from . import subcontract_wizard
\ No newline at end of file
+from . import subcontract_wizard
+from . import boq_import_wizard
\ No newline at end of file
@@ -37,6 +37,12 @@ class AdvancePaymentWizard(models.TransientModel):
     amount = fields.Monetary('Amount')
     percentage = fields.Float('Percentage', digits=(5, 2))
     
+    group_by = fields.Selection([
+        ('activity', 'Activity'),
+        ('origin', 'Original / Variation'),
+        ('activity_type', 'Activity Type')
+    ], string='Group By', default='activity', required=True)
+    
     line_ids = fields.One2many(
         'boq.advance.payment.wizard.line',
         'wizard_id',
@@ -70,24 +76,53 @@ class AdvancePaymentWizard(models.TransientModel):
             defaults['boq_id'] = boq.id
             defaults['currency_id'] = boq.currency_id.id
             defaults['journal_id'] = boq.adv_payment_journal_id.id if boq.adv_payment_journal_id else False
-            
-            # Create lines for activities
-            line_vals = []
-            for activity in boq.activity_line_ids:
-                for subactivity in activity.subactivity_ids:
-                    # Check if it's variation or original
-                    is_variation = subactivity.is_variation
-                    line_vals.append((0, 0, {
-                        'subactivity_id': subactivity.id,
-                        'amount': subactivity.total_cumulative,
-                        'is_variation': is_variation,
-                        'selected': not is_variation,  # Select original by default
-                    }))
-            
-            defaults['line_ids'] = line_vals
+            defaults['line_ids'] = self._prepare_group_lines(boq, defaults.get('group_by', 'activity'))
         
         return defaults
 
+    @api.model
+    def _prepare_group_lines(self, boq, group_by):
+        """Line commands for the sub-activities of ``boq`` aggregated by
+        ``group_by`` and by origin, read with one grouped query"""
+        groupby = {
+            'activity': ['activity_id', 'is_variation'],
+            'origin': ['is_variation'],
+            'activity_type': ['activity_type', 'is_variation'],
+        }[group_by]
+        groups = self.env['boq.subactivity']._read_group(
+            [('boq_id', '=', boq.id)],
+            groupby,
+            ['total_cumulative:sum', '__count'],
+        )
+        activity_types = dict(self.env['boq.subactivity']._fields['activity_type']._description_selection(self.env))
+        line_vals = []
+        for *keys, amount, count in groups:
+            group = dict(zip(groupby, keys))
+            is_variation = bool(group['is_variation'])
+            if group_by == 'activity':
+                name = group['activity_id'].name
+            elif group_by == 'activity_type':
+                name = activity_types.get(group['activity_type']) or _('Undefined')
+            else:
+                name = _('Variation') if is_variation else _('Original')
+            line_vals.append((0, 0, {
+                'name': name,
+                'activity_id': group.get('activity_id', self.env['boq.activity']).id,
+                'activity_type': group.get('activity_type'),
+                'subactivity_count': count,
+                'amount': amount,
+                'is_variation': is_variation,
+                'selected': not is_variation,  # Select original by default
+            }))
+        return line_vals
+
+    @api.onchange('group_by')
+    def _onchange_group_by(self):
+        """Aggregate the lines again for the new grouping"""
+        if self.boq_id:
+            self.line_ids = [(5, 0, 0)] + self._prepare_group_lines(self.boq_id, self.group_by)
+            self._onchange_line_type()
+
     @api.depends('line_ids.selected', 'line_ids.amount', 'line_type')
     def _compute_lines_total(self):
         for wizard in self:
@@ -149,12 +184,14 @@ class AdvancePaymentWizard(models.TransientModel):
         
         invoice = self.env['account.move'].create(invoice_vals)
         
-        # Update BOQ advanced payment fields
+        # Update BOQ advanced payment fields through the advance ledger
+        self.env['boq.advance.ledger']._record(
+            self.boq_id, self.line_type, 'advance', self.amount,
+            date=self.payment_date, move=invoice,
+        )
         if self.line_type == 'original':
-            self.boq_id.advanced_payment_amount_original += self.amount
             self.boq_id.advanced_payment_percentage_original = self.percentage
         else:
-            self.boq_id.advanced_payment_amount_variation += self.amount
             self.boq_id.advanced_payment_percentage_variation = self.percentage
         
         return {
@@ -198,17 +235,37 @@ class AdvancePaymentWizardLine(models.TransientModel):
         ondelete='cascade'
     )
     
-    subactivity_id = fields.Many2one(
-        'boq.subactivity',
-        string='Sub-activity',
-        required=True
-    )
+    # Group keys, depending on the grouping of the wizard
+    activity_id = fields.Many2one('boq.activity', string='Activity')
+    activity_type = fields.Selection([
+        ('material', 'Material'),
+        ('labor', 'Labor'),
+        ('service', 'Service')
+    ], string='Activity Type')
+    is_variation = fields.Boolean('Is Variation', default=False)
     
+    name = fields.Char('Group')
+    subactivity_count = fields.Integer('Sub-activities')
     selected = fields.Boolean('Selected', default=False)
     amount = fields.Monetary('Amount', required=True)
-    is_variation = fields.Boolean('Is Variation', default=False)
-    
-    # Display fields
-    activity_name = fields.Char(related='subactivity_id.activity_id.name')
-    product_name = fields.Char(related='subactivity_id.product_id.name')
-    currency_id = fields.Many2one(related='wizard_id.currency_id')
\ No newline at end of file
+    currency_id = fields.Many2one(related='wizard_id.currency_id')
+
+    def action_view_subactivities(self):
+        """Open the sub-activities of the group, loaded page by page"""
+        self.ensure_one()
+        domain = [
+            ('boq_id', '=', self.wizard_id.boq_id.id),
+            ('is_variation', '=', self.is_variation),
+        ]
+        if self.activity_id:
+            domain.append(('activity_id', '=', self.activity_id.id))
+        if self.activity_type:
+            domain.append(('activity_type', '=', self.activity_type))
+        return {
+            'type': 'ir.actions.act_window',
+            'name': self.name,
+            'res_model': 'boq.subactivity',
+            'view_mode': 'list',
+            'domain': domain,
+            'target': 'new',
+        }
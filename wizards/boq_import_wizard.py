@@ -0,0 +1,311 @@
+import base64
+from contextlib import contextmanager
+import csv
+import io
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError, ValidationError
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+_logger = logging.getLogger(__name__)
+
+# Recognised column headers (case-insensitive) and the wizard keys they map to
+IMPORT_COLUMNS = {
+    'activity': 'activity',
+    'product': 'product',
+    'uom': 'uom',
+    'unit of measure': 'uom',
+    'description': 'description',
+    'activity type': 'activity_type',
+    'activity_type': 'activity_type',
+    'master qty': 'master_qty',
+    'master_qty': 'master_qty',
+    'master quantity': 'master_qty',
+    'product cost': 'product_cost',
+    'product_cost': 'product_cost',
+    'margin': 'margin_percent',
+    'margin %': 'margin_percent',
+    'margin_percent': 'margin_percent',
+    'cost name': 'cost_name',
+    'cost_name': 'cost_name',
+    'additional cost': 'cost',
+    'cost': 'cost',
+}
+
+
+class BoqImportWizard(models.TransientModel):
+    _name = 'boq.import.wizard'
+    _description = 'Import BOQ Lines'
+
+    boq_id = fields.Many2one(
+        'boq.project',
+        string='BOQ',
+        help="BOQ to import the lines into. Leave empty to create a new BOQ."
+    )
+
+    customer_id = fields.Many2one(
+        'res.partner',
+        string='Customer',
+        domain="[('is_company', '=', True)]",
+        help="Customer of the new BOQ when no BOQ is selected"
+    )
+
+    # Kept in an attachment so that the import can read it from the file
+    # store as a stream
+    file = fields.Binary('File', required=True, attachment=True)
+    filename = fields.Char('File Name')
+
+    batch_size = fields.Integer(
+        'Batch Size',
+        default=1000,
+        help="Number of sub-activities inserted per batch"
+    )
+
+    @api.constrains('batch_size')
+    def _check_batch_size(self):
+        for wizard in self:
+            if wizard.batch_size <= 0:
+                raise ValidationError(_('Batch size must be greater than zero.'))
+
+    def action_import(self):
+        """Stream the file into the BOQ in fixed-size batches.
+
+        Each row with a product creates a sub-activity under the activity
+        named in its ``Activity`` column; activities are created on first
+        use. A row with only ``Cost Name``/``Cost`` adds an additional cost
+        to the previous sub-activity. Rollups are computed once at the end.
+        """
+        self.ensure_one()
+        start = time.perf_counter()
+        boq = self.boq_id or self._create_boq()
+        importer = _BoqImporter(boq, self.batch_size)
+        with boq.batch_edit():
+            for row_number, row in self._iter_rows():
+                importer.add_row(row_number, row)
+            importer.flush()
+        elapsed = time.perf_counter() - start
+        rate = importer.rows / elapsed if elapsed else importer.rows
+        _logger.info(
+            "Imported %s rows (%s sub-activities, %s additional costs) into %s in %.2fs (%.0f rows/s)",
+            importer.rows, importer.subactivity_count, importer.cost_count, boq.name, elapsed, rate,
+        )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Import Done'),
+                'message': _(
+                    '%(rows)s rows imported (%(subs)s sub-activities, %(costs)s additional costs) '
+                    'in %(seconds).1f s, %(rate).0f rows/s.',
+                    rows=importer.rows, subs=importer.subactivity_count,
+                    costs=importer.cost_count, seconds=elapsed, rate=rate,
+                ),
+                'type': 'success',
+                'next': {
+                    'type': 'ir.actions.act_window',
+                    'res_model': 'boq.project',
+                    'res_id': boq.id,
+                    'view_mode': 'form',
+                },
+            }
+        }
+
+    def _create_boq(self):
+        if not self.customer_id:
+            raise UserError(_('Select a BOQ or a customer for the new BOQ.'))
+        return self.env['boq.project'].create({'customer_id': self.customer_id.id})
+
+    def _iter_rows(self):
+        """Yield ``(row number, dict)`` pairs read one at a time from the
+        file, keyed by the recognised column names."""
+        with self._open_file() as fileobj:
+            if (self.filename or '').lower().endswith('.xlsx'):
+                rows = self._read_xlsx(fileobj)
+            else:
+                rows = self._read_csv(fileobj)
+            yield from self._iter_values(rows)
+
+    @contextmanager
+    def _open_file(self):
+        """Open the uploaded file for reading, straight from the file store
+        when the attachment is stored there."""
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+        if attachment.store_fname:
+            with open(attachment._full_path(attachment.store_fname), 'rb') as fileobj:
+                yield fileobj
+        else:
+            # Database storage: the content is only available as a whole
+            yield io.BytesIO(attachment.raw or base64.b64decode(self.file or b''))
+
+    def _iter_values(self, rows):
+        header = None
+        for row_number, row in enumerate(rows, start=1):
+            if header is None:
+                header = [IMPORT_COLUMNS.get(str(cell or '').strip().lower()) for cell in row]
+                missing = {'activity', 'product', 'master_qty'} - set(header)
+                if missing:
+                    raise UserError(_('Missing columns in the file: %s', ', '.join(sorted(missing))))
+                continue
+            values = {
+                key: cell for key, cell in zip(header, row)
+                if key and cell not in (None, '')
+            }
+            if values:
+                yield row_number, values
+
+    def _read_csv(self, fileobj):
+        return csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+
+    def _read_xlsx(self, fileobj):
+        if openpyxl is None:
+            raise UserError(_('The openpyxl library is required to import XLSX files.'))
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+
+class _BoqImporter:
+    """Buffer imported rows and insert them in batches.
+
+    Products and units of measure are resolved through in-memory indexes
+    filled lazily, one query per batch for the products not seen yet.
+    """
+
+    def __init__(self, boq, batch_size):
+        self.env = boq.env
+        self.boq = boq
+        self.batch_size = batch_size
+        self.rows = 0
+        self.subactivity_count = 0
+        self.cost_count = 0
+        self.activity_ids = {
+            activity.name: activity.id for activity in boq.activity_line_ids
+        }
+        self.next_sequence = max(boq.activity_line_ids.mapped('sequence') or [0]) + 10
+        self.product_index = {}
+        self.uom_index = {
+            uom.name.lower(): uom.id
+            for uom in self.env['uom.uom'].with_context(active_test=False).search([])
+        }
+        self.activity_types = dict(self.env['boq.subactivity']._fields['activity_type']._description_selection(self.env))
+        self.pending = []
+        self.pending_costs = []
+        self.last_subactivity_id = None
+
+    def add_row(self, row_number, values):
+        self.rows += 1
+        if values.get('product'):
+            self.pending.append((row_number, values))
+        if values.get('cost_name') or values.get('cost'):
+            if not self.pending and not self.subactivity_count:
+                raise UserError(_('Row %s: an additional cost must follow a sub-activity.', row_number))
+            self.pending_costs.append((row_number, len(self.pending) - 1, values))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the buffered sub-activities and additional costs."""
+        if not self.pending and not self.pending_costs:
+            return
+        self._index_products({str(values['product']).strip() for _row, values in self.pending})
+        self._create_activities(str(values['activity']).strip() for _row, values in self.pending)
+        sub_vals_list = [self._subactivity_vals(row_number, values) for row_number, values in self.pending]
+        subs = self.env['boq.subactivity'].create(sub_vals_list)
+        # Costs buffered before the first sub-activity of this batch belong
+        # to the last sub-activity of the previous one
+        previous_subactivity_id = self.last_subactivity_id
+        if subs:
+            self.last_subactivity_id = subs[-1].id
+        cost_vals_list = []
+        for row_number, index, values in self.pending_costs:
+            sub_id = subs[index].id if index >= 0 else previous_subactivity_id
+            cost_vals_list.append({
+                'subactivity_id': sub_id,
+                'name': str(values.get('cost_name') or _('Additional Cost')),
+                'cost': self._float(row_number, values, 'cost'),
+            })
+        self.env['boq.subactivity.cost'].create(cost_vals_list)
+        self.subactivity_count += len(subs)
+        self.cost_count += len(cost_vals_list)
+        self.pending = []
+        self.pending_costs = []
+        # Keep memory bounded: write the batch and drop it from the cache
+        self.env.flush_all()
+        self.env.invalidate_all()
+
+    def _subactivity_vals(self, row_number, values):
+        product_id, uom_id = self.product_index.get(str(values['product']).strip(), (None, None))
+        if not product_id:
+            raise UserError(_('Row %(row)s: unknown product "%(product)s".', row=row_number, product=values['product']))
+        if values.get('uom'):
+            row_uom_id = self.uom_index.get(str(values['uom']).strip().lower())
+            if row_uom_id != uom_id:
+                raise UserError(_(
+                    'Row %(row)s: unit of measure "%(uom)s" does not match the product unit.',
+                    row=row_number, uom=values['uom'],
+                ))
+        activity_type = str(values.get('activity_type') or 'material').strip().lower()
+        if activity_type not in self.activity_types:
+            activity_type = next(
+                (key for key, label in self.activity_types.items() if label.lower() == activity_type),
+                None,
+            )
+            if not activity_type:
+                raise UserError(_('Row %(row)s: unknown activity type "%(type)s".', row=row_number, type=values['activity_type']))
+        return {
+            'activity_id': self.activity_ids[str(values['activity']).strip()],
+            'product_id': product_id,
+            'description': values.get('description') and str(values['description']),
+            'activity_type': activity_type,
+            'master_qty': self._float(row_number, values, 'master_qty'),
+            'product_cost': self._float(row_number, values, 'product_cost'),
+            'margin_percent': self._float(row_number, values, 'margin_percent'),
+        }
+
+    def _create_activities(self, names):
+        """Create the activities of ``names`` not seen yet with one
+        ``create``, in the order of their first row."""
+        names = [name for name in dict.fromkeys(names) if name not in self.activity_ids]
+        if not names:
+            return
+        # The sequences are given explicitly to skip the per-activity lookup
+        activities = self.env['boq.activity'].create([{
+            'boq_id': self.boq.id,
+            'name': name,
+            'sequence': self.next_sequence + 10 * i,
+        } for i, name in enumerate(names)])
+        self.next_sequence += 10 * len(names)
+        self.activity_ids.update(zip(names, activities.ids))
+
+    def _index_products(self, keys):
+        """Resolve the product references not indexed yet, by internal
+        reference first and then by name."""
+        keys -= self.product_index.keys()
+        if not keys:
+            return
+        Product = self.env['product.product']
+        for product in Product.search_fetch([('default_code', 'in', list(keys))], ['default_code', 'uom_id']):
+            self.product_index[product.default_code] = (product.id, product.uom_id.id)
+        keys -= self.product_index.keys()
+        if keys:
+            for product in Product.search_fetch([('name', 'in', list(keys))], ['name', 'uom_id']):
+                self.product_index.setdefault(product.name, (product.id, product.uom_id.id))
+
+    def _float(self, row_number, values, key):
+        value = values.get(key) or 0.0
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise UserError(_('Row %(row)s: invalid number "%(value)s".', row=row_number, value=value))
@@ -1,3 +1,5 @@
+import time
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 
@@ -42,27 +44,35 @@ class SetMarginWizard(models.TransientModel):
         self.ensure_one()
         
         boq = self.boq_id
+        start = time.perf_counter()
+        activities = self.env['boq.activity']
+        subactivities = self.env['boq.subactivity']
         
-        # Update BOQ global margin
-        boq.margin_percent = self.margin_percent
-        
-        # Apply to activities
-        if self.apply_to in ['all', 'activities_only']:
-            for activity in boq.activity_line_ids:
-                if self.override_existing or not activity.margin_percent:
-                    activity.margin_percent = self.margin_percent
+        with boq.batch_edit():
+            # Update BOQ global margin
+            boq.margin_percent = self.margin_percent
+            
+            # Apply to activities, with one write for all matching lines
+            if self.apply_to in ['all', 'activities_only']:
+                activities = activities.search(self._margin_domain())
+                activities.write({'margin_percent': self.margin_percent})
+            
+            # Apply to subactivities  
+            if self.apply_to in ['all', 'subactivities_only']:
+                subactivities = subactivities.search(self._margin_domain())
+                subactivities.write({'margin_percent': self.margin_percent})
         
-        # Apply to subactivities  
-        if self.apply_to in ['all', 'subactivities_only']:
-            for activity in boq.activity_line_ids:
-                for subactivity in activity.subactivity_ids:
-                    if self.override_existing or not subactivity.margin_percent:
-                        subactivity.margin_percent = self.margin_percent
+        elapsed = time.perf_counter() - start
         
         # Show success message
-        message = _('Margin of %s%% has been applied to %s.') % (
-            self.margin_percent,
-            dict(self._fields['apply_to'].selection)[self.apply_to]
+        message = _(
+            'Margin of %(margin)s%% has been applied to %(apply_to)s: '
+            '%(activities)s activities and %(subactivities)s sub-activities changed in %(seconds).2f s.',
+            margin=self.margin_percent,
+            apply_to=dict(self._fields['apply_to'].selection)[self.apply_to],
+            activities=len(activities),
+            subactivities=len(subactivities),
+            seconds=elapsed,
         )
         
         return {
@@ -73,4 +83,12 @@ class SetMarginWizard(models.TransientModel):
                 'message': message,
                 'type': 'success',
             }
-        }
\ No newline at end of file
+        }
+
+    def _margin_domain(self):
+        """Lines of the BOQ whose margin changes: all of them when
+        overriding existing margins, otherwise only those without one"""
+        domain = [('boq_id', '=', self.boq_id.id), ('margin_percent', '!=', self.margin_percent)]
+        if not self.override_existing:
+            domain.append(('margin_percent', 'in', [0, False]))
+        return domain
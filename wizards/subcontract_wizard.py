@@ -1,6 +1,9 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 
+# Purchase order lines created per batch
+PO_LINE_BATCH_SIZE = 1000
+
 
 class SubcontractWizard(models.TransientModel):
     _name = 'boq.subcontract.wizard'
@@ -40,7 +43,13 @@ class SubcontractWizard(models.TransientModel):
 
     @api.model
     def default_get(self, fields_list):
-        """Populate wizard with BOQ activities"""
+        """Populate wizard with BOQ activities.
+
+        Every activity of the BOQ gets a line, since the unit cost is
+        entered per activity; only their rendering is paged by the view.
+        The lines carry the activity totals, summed in one query, and the
+        sub-activities are only read when the purchase order is created.
+        """
         defaults = super().default_get(fields_list)
         
         if 'boq_id' in self.env.context:
@@ -48,13 +57,24 @@ class SubcontractWizard(models.TransientModel):
             defaults['boq_id'] = boq.id
             defaults['project_name'] = f"SUB-{boq.name}"
             
-            # Create lines for activities
+            # Create lines for activities, with quantities summed in one query
+            quantities = {
+                activity.id: (master_qty, count)
+                for activity, master_qty, count in self.env['boq.subactivity']._read_group(
+                    [('boq_id', '=', boq.id)],
+                    ['activity_id'],
+                    ['master_qty:sum', '__count'],
+                )
+            }
             line_vals = []
             for activity in boq.activity_line_ids:
+                total_quantity, subactivity_count = quantities.get(activity.id, (0.0, 0))
                 line_vals.append((0, 0, {
                     'activity_id': activity.id,
                     'selected': False,
                     'unit_cost': 0.0,  # Will be filled by user
+                    'total_quantity': total_quantity,
+                    'subactivity_count': subactivity_count,
                 }))
             
             defaults['line_ids'] = line_vals
@@ -70,20 +90,6 @@ class SubcontractWizard(models.TransientModel):
             raise UserError(_('Please select at least one activity to subcontract.'))
         
         # Create purchase order
-        po_lines = []
-        for line in selected_lines:
-            # Create PO line for each subactivity in the activity
-            for subactivity in line.activity_id.subactivity_ids:
-                po_lines.append((0, 0, {
-                    'product_id': subactivity.product_id.id,
-                    'name': f"{line.activity_id.name} - {subactivity.name}",
-                    'product_qty': subactivity.master_qty,
-                    'product_uom': subactivity.uom_id.id,
-                    'price_unit': line.unit_cost,
-                    'date_planned': fields.Datetime.now(),
-                    'analytic_distribution': {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {},
-                }))
-        
         purchase_order = self.env['purchase.order'].create({
             'partner_id': self.vendor_id.id,
             'company_id': self.company_id.id,
@@ -91,9 +97,9 @@ class SubcontractWizard(models.TransientModel):
             'origin': self.boq_id.name,
             'from_boq': True,
             'source_boq_id': self.boq_id.id,
-            'order_line': po_lines,
             'boq_activity_ids': [(6, 0, selected_lines.mapped('activity_id').ids)],
         })
+        self._create_purchase_order_lines(purchase_order, selected_lines)
         
         return {
             'type': 'ir.actions.act_window',
@@ -103,6 +109,30 @@ class SubcontractWizard(models.TransientModel):
             'view_mode': 'form',
         }
 
+    def _create_purchase_order_lines(self, purchase_order, lines):
+        """Create a PO line for each subactivity of the activities of
+        ``lines``, read in one query and created in batches"""
+        unit_costs = {line.activity_id.id: line.unit_cost for line in lines}
+        subactivities = self.env['boq.subactivity'].search_fetch(
+            [('activity_id', 'in', list(unit_costs))],
+            ['activity_id', 'product_id', 'name', 'master_qty'],
+            order='activity_id, sequence, id',
+        )
+        date_planned = fields.Datetime.now()
+        analytic_distribution = {self.boq_id.analytic_account_id.id: 100} if self.boq_id.analytic_account_id else {}
+        PurchaseOrderLine = self.env['purchase.order.line']
+        for start in range(0, len(subactivities), PO_LINE_BATCH_SIZE):
+            PurchaseOrderLine.create([{
+                'order_id': purchase_order.id,
+                'product_id': subactivity.product_id.id,
+                'name': f"{subactivity.activity_id.name} - {subactivity.name}",
+                'product_qty': subactivity.master_qty,
+                'product_uom': subactivity.uom_id.id,
+                'price_unit': unit_costs[subactivity.activity_id.id],
+                'date_planned': date_planned,
+                'analytic_distribution': analytic_distribution,
+            } for subactivity in subactivities[start:start + PO_LINE_BATCH_SIZE]])
+
     @api.constrains('line_ids')
     def _check_lines(self):
         for wizard in self:
@@ -141,16 +171,17 @@ class SubcontractWizardLine(models.TransientModel):
     activity_name = fields.Char(related='activity_id.name')
     total_quantity = fields.Float(
         'Total Quantity',
-        compute='_compute_totals'
+        readonly=True,
+        help="Sum of the master quantities of the activity sub-activities"
     )
+    subactivity_count = fields.Integer('Sub-activities', readonly=True)
     estimated_total = fields.Monetary(
         'Estimated Total',
         compute='_compute_totals'
     )
     currency_id = fields.Many2one(related='wizard_id.currency_id')
 
-    @api.depends('activity_id.subactivity_ids.master_qty', 'unit_cost')
+    @api.depends('total_quantity', 'unit_cost')
     def _compute_totals(self):
         for line in self:
-            line.total_quantity = sum(line.activity_id.subactivity_ids.mapped('master_qty'))
             line.estimated_total = line.total_quantity * line.unit_cost
\ No newline at end of file